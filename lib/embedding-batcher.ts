@@ -0,0 +1,116 @@
+import type OpenAI from "openai"
+
+// Micro-batching of embedding requests.
+//
+// Concurrent searches each need one query embedding; sent one by one they cost
+// one round trip (and one request against the rate limit) apiece. The batcher
+// collects texts that arrive within a short window, up to a size cap, sends
+// them as a single multi-input request and hands each caller its own vector.
+// The first text of a batch waits at most `maxWaitMs`, which is the ceiling on
+// the latency batching adds; a full batch is sent at once.
+
+export interface EmbeddingBatcherOptions {
+  model?: string
+  maxBatchSize?: number
+  maxWaitMs?: number
+}
+
+interface PendingEmbedding {
+  text: string
+  resolve: (embedding: number[]) => void
+  reject: (error: unknown) => void
+}
+
+export class EmbeddingBatcher {
+  private pending: PendingEmbedding[] = []
+  private timer: ReturnType<typeof setTimeout> | null = null
+  private requests = 0
+  private inputs = 0
+  private largestBatch = 0
+  private openai: OpenAI
+
+  readonly model: string
+  readonly maxBatchSize: number
+  readonly maxWaitMs: number
+
+  constructor(openai: OpenAI, options: EmbeddingBatcherOptions = {}) {
+    this.openai = openai
+    this.model = options.model ?? "text-embedding-3-small"
+    // The embeddings endpoint accepts at most 2048 inputs per request
+    this.maxBatchSize = Math.min(2048, Math.max(1, options.maxBatchSize ?? 64))
+    this.maxWaitMs = Math.max(0, options.maxWaitMs ?? 10)
+  }
+
+  embed(text: string): Promise<number[]> {
+    return new Promise((resolve, reject) => {
+      this.pending.push({ text, resolve, reject })
+
+      if (this.pending.length >= this.maxBatchSize) {
+        this.flush()
+      } else if (!this.timer) {
+        this.timer = setTimeout(() => this.flush(), this.maxWaitMs)
+      }
+    })
+  }
+
+  embedMany(texts: string[]): Promise<number[][]> {
+    return Promise.all(texts.map((text) => this.embed(text)))
+  }
+
+  getStats() {
+    return {
+      model: this.model,
+      maxBatchSize: this.maxBatchSize,
+      maxWaitMs: this.maxWaitMs,
+      requests: this.requests,
+      inputs: this.inputs,
+      meanBatchSize: this.requests ? this.inputs / this.requests : 0,
+      largestBatch: this.largestBatch,
+      pending: this.pending.length,
+    }
+  }
+
+  private flush() {
+    if (this.timer) {
+      clearTimeout(this.timer)
+      this.timer = null
+    }
+
+    while (this.pending.length > 0) {
+      const batch = this.pending.splice(0, this.maxBatchSize)
+      void this.send(batch)
+    }
+  }
+
+  private async send(batch: PendingEmbedding[]) {
+    this.requests++
+    this.inputs += batch.length
+    this.largestBatch = Math.max(this.largestBatch, batch.length)
+
+    try {
+      const response = await this.openai.embeddings.create({
+        model: this.model,
+        input: batch.map((item) => item.text),
+        encoding_format: "float",
+      })
+
+      // Results carry the index of their input; do not rely on their order
+      const embeddings: number[][] = new Array(batch.length)
+      for (const item of response.data) {
+        embeddings[item.index] = item.embedding
+      }
+
+      batch.forEach((item, i) => {
+        if (embeddings[i]) {
+          item.resolve(embeddings[i])
+        } else {
+          item.reject(new Error(`Embedding response is missing input ${i} of ${batch.length}`))
+        }
+      })
+    } catch (error) {
+      for (const item of batch) {
+        item.reject(error)
+      }
+    }
+  }
+}
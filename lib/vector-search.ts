@@ -1,4 +1,5 @@
 import OpenAI from "openai"
+import { EmbeddingBatcher } from "./embedding-batcher"
 
 export interface ArgoProfile {
   id: string
@@ -89,12 +90,19 @@ export interface EmbeddingMetadata extends ArgoVectorMetadata {
 class VectorSearchEngine {
   private vectorStore: EmbeddingMetadata[] = []
   private openai: OpenAI
+  private embeddingBatcher: EmbeddingBatcher
   private isInitialized = false
 
   constructor(apiKey?: string) {
     this.openai = new OpenAI({
       apiKey: apiKey || process.env.OPENAI_API_KEY || "your-api-key-here",
     })
+    // Concurrent searches share multi-input embedding requests
+    this.embeddingBatcher = new EmbeddingBatcher(this.openai, {
+      model: "text-embedding-3-small",
+      maxBatchSize: Number(process.env.EMBEDDING_BATCH_MAX_SIZE) || 64,
+      maxWaitMs: Number(process.env.EMBEDDING_BATCH_MAX_WAIT_MS ?? 10),
+    })
   }
 
   async initialize() {
@@ -370,13 +378,7 @@ class VectorSearchEngine {
 
   async generateEmbedding(text: string): Promise<number[]> {
     try {
-      const response = await this.openai.embeddings.create({
-        model: "text-embedding-3-small",
-        input: text,
-        encoding_format: "float",
-      })
-
-      return response.data[0].embedding
+      return await this.embeddingBatcher.embed(text)
     } catch (error) {
       console.error("[v0] Failed to generate embedding:", error)
       return Array.from({ length: 1536 }, () => Math.random() - 0.5)
@@ -390,27 +392,39 @@ class VectorSearchEngine {
 
     console.log(`[v0] Processing ${profiles.length} profiles for vector indexing...`)
 
-    for (const profile of profiles) {
-      try {
-        const textContent = this.extractTextContent(profile)
-        const embedding = await this.generateEmbedding(textContent)
-        const vectorMetadata = this.createVectorMetadata(profile, textContent)
-
-        const embeddingMetadata: EmbeddingMetadata = {
-          ...vectorMetadata,
-          vector_id: this.vectorStore.length,
-          embedding,
-          embedding_model: "text-embedding-3-small",
-          created_at: new Date().toISOString(),
-          updated_at: new Date().toISOString(),
+    // One multi-input embedding request per chunk instead of one request per profile
+    const chunkSize = this.embeddingBatcher.maxBatchSize
+    for (let start = 0; start < profiles.length; start += chunkSize) {
+      const chunk: { profile: ArgoProfile; textContent: string }[] = []
+      for (const profile of profiles.slice(start, start + chunkSize)) {
+        try {
+          chunk.push({ profile, textContent: this.extractTextContent(profile) })
+        } catch (error) {
+          console.error(`[v0] Failed to process profile ${profile.id}:`, error)
         }
-
-        this.vectorStore.push(embeddingMetadata)
-
-        await new Promise((resolve) => setTimeout(resolve, 100))
-      } catch (error) {
-        console.error(`[v0] Failed to process profile ${profile.id}:`, error)
       }
+      const embeddings = await Promise.all(chunk.map(({ textContent }) => this.generateEmbedding(textContent)))
+
+      chunk.forEach(({ profile, textContent }, i) => {
+        try {
+          const vectorMetadata = this.createVectorMetadata(profile, textContent)
+
+          const embeddingMetadata: EmbeddingMetadata = {
+            ...vectorMetadata,
+            vector_id: this.vectorStore.length,
+            embedding: embeddings[i],
+            embedding_model: "text-embedding-3-small",
+            created_at: new Date().toISOString(),
+            updated_at: new Date().toISOString(),
+          }
+
+          this.vectorStore.push(embeddingMetadata)
+        } catch (error) {
+          console.error(`[v0] Failed to process profile ${profile.id}:`, error)
+        }
+      })
+
+      await new Promise((resolve) => setTimeout(resolve, 100))
     }
 
     console.log(`[v0] Added ${this.vectorStore.length} profiles to vector store`)
@@ -473,6 +487,7 @@ class VectorSearchEngine {
       isInitialized: this.isInitialized,
       totalProfiles: this.vectorStore.length,
       indexSize: this.vectorStore.length,
+      embeddingBatching: this.embeddingBatcher.getStats(),
     }
   }
 
@@ -0,0 +1,230 @@
+"""
+Admission control in front of RAGPipeline.process_query.
+
+At most `max_concurrent` queries run at once; the rest wait in a bounded
+queue with two priority classes. Interactive queries are always dispatched
+before batch queries, and batch queries may only occupy `batch_share` of
+the slots, so interactive traffic keeps headroom while batch work soaks up
+whatever capacity is spare.
+
+Rather than letting requests pile up, the controller rejects early:
+
+* when the estimated queue wait exceeds the request's queue-time limit or
+  what is left of its latency budget after a typical service time,
+* when the queue is full (an interactive arrival sheds the newest queued
+  batch request instead, when there is one),
+* when a queued request has waited longer than its queue-time limit.
+
+The wait estimate is the request's queue position times the mean service
+time (an EWMA of completed queries) divided by the slots its class may use.
+Every rejection carries a `retry_after` hint derived from the same estimate.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, AsyncIterator, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower bound for retry-after hints, so that clients never retry in a tight loop
+MIN_RETRY_AFTER = 1.0
+
+class Priority(IntEnum):
+    """Admission classes, highest priority first"""
+    INTERACTIVE = 0
+    BATCH = 1
+
+    @classmethod
+    def parse(cls, value: Any) -> "Priority":
+        """Priority from a name such as "interactive" or "batch" """
+        if isinstance(value, Priority):
+            return value
+        try:
+            return cls[str(value).upper()]
+        except KeyError:
+            raise ValueError(f"Unknown priority {value!r}; expected one of {[p.name.lower() for p in cls]}")
+
+class AdmissionRejected(RuntimeError):
+    """A query was not admitted; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, reason: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+@dataclass
+class AdmissionSlot:
+    """An admitted query's place in the pipeline"""
+    priority: Priority
+    queue_time: float = 0.0
+
+@dataclass
+class _Waiter:
+    priority: Priority
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+class AdmissionController:
+    """Bounded two-class priority queue with early rejection"""
+
+    def __init__(self, max_concurrent: int = 16, max_queue: int = 64, interactive_queue_time: float = 2.0,
+                 batch_queue_time: float = 30.0, batch_share: float = 0.75, ewma_alpha: float = 0.2):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_time = {Priority.INTERACTIVE: interactive_queue_time, Priority.BATCH: batch_queue_time}
+        self.batch_limit = max(1, int(max_concurrent * batch_share))
+        self.ewma_alpha = ewma_alpha
+
+        self._queues: Dict[Priority, Deque[_Waiter]] = {priority: deque() for priority in Priority}
+        self._running: Dict[Priority, int] = {priority: 0 for priority in Priority}
+        self.service_time: Optional[float] = None
+
+        self.admitted = {priority: 0 for priority in Priority}
+        self.rejected: Dict[str, int] = {}
+        self.queue_time_total = 0.0
+
+    @asynccontextmanager
+    async def admit(self, priority: Priority = Priority.INTERACTIVE,
+                    budget: Optional[float] = None) -> AsyncIterator[AdmissionSlot]:
+        """Hold a pipeline slot for the block, waiting in the queue if necessary"""
+        slot = await self._acquire(priority, budget)
+        started = time.monotonic()
+        try:
+            yield slot
+        finally:
+            self._release(priority, time.monotonic() - started)
+
+    def estimate_wait(self, priority: Priority) -> float:
+        """Expected queue wait for a query of this class arriving now"""
+        if self._can_start(priority) and not self._ahead_of(priority):
+            return 0.0
+        if not self.service_time:
+            return 0.0
+        slots = self.max_concurrent if priority == Priority.INTERACTIVE else self.batch_limit
+        return (self._ahead_of(priority) + 1) * self.service_time / slots
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = sum(self.admitted.values())
+        return {
+            "running": {priority.name.lower(): count for priority, count in self._running.items()},
+            "queued": {priority.name.lower(): len(queue) for priority, queue in self._queues.items()},
+            "admitted": {priority.name.lower(): count for priority, count in self.admitted.items()},
+            "rejected": dict(self.rejected),
+            "mean_queue_time": self.queue_time_total / admitted if admitted else 0.0,
+            "service_time": self.service_time,
+        }
+
+    async def _acquire(self, priority: Priority, budget: Optional[float]) -> AdmissionSlot:
+        if self._can_start(priority) and not self._ahead_of(priority):
+            self._start(priority, 0.0)
+            return AdmissionSlot(priority)
+
+        limit = self.max_queue_time[priority]
+        if budget is not None:
+            limit = min(limit, max(0.0, budget - (self.service_time or 0.0)))
+        estimate = self.estimate_wait(priority)
+        if estimate > limit:
+            self._reject(AdmissionRejected(
+                f"Estimated queue wait {estimate:.2f}s exceeds the {limit:.2f}s allowed for {priority.name.lower()} queries",
+                reason="wait_exceeds_budget", retry_after=estimate,
+            ))
+
+        if self._queued() >= self.max_queue and not (priority == Priority.INTERACTIVE and self._shed_batch()):
+            self._reject(AdmissionRejected(
+                f"Admission queue is full ({self.max_queue} waiting)",
+                reason="queue_full", retry_after=self._drain_time(),
+            ))
+
+        waiter = _Waiter(priority, asyncio.get_running_loop().create_future())
+        self._queues[priority].append(waiter)
+        try:
+            # shield() keeps a timeout from cancelling a slot that was granted at the same moment
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=limit)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                if waiter.future.exception() is not None:
+                    # Shed at the moment the wait timed out
+                    raise waiter.future.exception()
+                return AdmissionSlot(priority, time.monotonic() - waiter.enqueued)
+            self._reject(AdmissionRejected(
+                f"Queued {priority.name.lower()} query waited longer than {limit:.2f}s",
+                reason="queue_timeout", retry_after=self.estimate_wait(priority),
+            ))
+        except asyncio.CancelledError:
+            if not self._abandon(waiter) and waiter.future.exception() is None:
+                # The slot was granted as the caller gave up; hand it on (a shed waiter holds none)
+                self._release(priority, None)
+            raise
+        return AdmissionSlot(priority, time.monotonic() - waiter.enqueued)
+
+    def _can_start(self, priority: Priority) -> bool:
+        if sum(self._running.values()) >= self.max_concurrent:
+            return False
+        return priority == Priority.INTERACTIVE or self._running[Priority.BATCH] < self.batch_limit
+
+    def _ahead_of(self, priority: Priority) -> int:
+        """Queued queries that would be dispatched before a new one of this class"""
+        return sum(len(self._queues[p]) for p in Priority if p <= priority)
+
+    def _queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _drain_time(self) -> float:
+        if not self.service_time:
+            return MIN_RETRY_AFTER
+        return self._queued() * self.service_time / self.max_concurrent
+
+    def _start(self, priority: Priority, queue_time: float):
+        self._running[priority] += 1
+        self.admitted[priority] += 1
+        self.queue_time_total += queue_time
+
+    def _release(self, priority: Priority, service_time: Optional[float]):
+        self._running[priority] -= 1
+        if service_time is not None:
+            if self.service_time is None:
+                self.service_time = service_time
+            else:
+                self.service_time += self.ewma_alpha * (service_time - self.service_time)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Grant freed slots to waiting queries, interactive first"""
+        for priority in Priority:
+            queue = self._queues[priority]
+            while queue and self._can_start(priority):
+                waiter = queue.popleft()
+                self._start(priority, time.monotonic() - waiter.enqueued)
+                waiter.future.set_result(None)
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """Remove a waiter that gave up; False when it had already been granted a slot"""
+        if waiter.future.done():
+            return False
+        self._queues[waiter.priority].remove(waiter)
+        waiter.future.cancel()
+        return True
+
+    def _shed_batch(self) -> bool:
+        """Reject the most recently queued batch query to make room"""
+        queue = self._queues[Priority.BATCH]
+        if not queue:
+            return False
+        waiter = queue.pop()
+        self.rejected["shed"] = self.rejected.get("shed", 0) + 1
+        waiter.future.set_exception(AdmissionRejected(
+            "Batch query shed in favour of interactive traffic",
+            reason="shed", retry_after=max(MIN_RETRY_AFTER, self._drain_time()),
+        ))
+        return True
+
+    def _reject(self, error: AdmissionRejected):
+        error.retry_after = max(MIN_RETRY_AFTER, error.retry_after)
+        self.rejected[error.reason] = self.rejected.get(error.reason, 0) + 1
+        logger.info(f"Admission rejected ({error.reason}): {error}")
+        raise error
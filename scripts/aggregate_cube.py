@@ -0,0 +1,388 @@
+"""
+Precomputed aggregate cube over ARGO profiles.
+
+Profiles are rolled up into cells keyed by region x year x month x monsoon
+period. Each cell holds count, sum, sum of squares, min, max and a sparse
+fixed-width histogram for the main measurement columns, so averages,
+extremes, standard deviations and threshold counts over any combination of
+cells are answered without touching the database. `add_profiles` folds in
+rows whose profile ID has not been seen before and drops rows without one,
+so reading a row twice never counts it twice. `refresh` reads the whole
+table through queryARGO, page by page until a short page: the MCP server's
+queryARGO ignores the SQL and pages over the table in no guaranteed order,
+so there is no watermark to resume from and only unseen rows are added.
+"""
+
+import json
+import logging
+import math
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sql_compiler import MONSOON_MONTHS, REGIONS, QueryShape
+
+logger = logging.getLogger(__name__)
+
+METRICS = ("surfacetemp", "surfacesal", "mld", "thermoclinedepth", "ohc_0_200m")
+
+# Histogram bucket widths; threshold counts are exact at multiples of these
+BUCKET_WIDTHS = {
+    "surfacetemp": 0.5,
+    "surfacesal": 0.1,
+    "mld": 5.0,
+    "thermoclinedepth": 10.0,
+    "ohc_0_200m": 1e8,
+}
+
+ALL_REGIONS = "all"
+EDGE_TOLERANCE = 1e-9
+
+CellKey = Tuple[str, int, int, str]
+
+def monsoon_period(month: int) -> str:
+    """Monsoon period of a calendar month"""
+    for period, months in MONSOON_MONTHS.items():
+        if month in months:
+            return period
+    raise ValueError(f"Invalid month: {month}")
+
+@dataclass
+class MetricStats:
+    """Mergeable summary statistics for one column"""
+    count: int = 0
+    total: float = 0.0
+    sum_sq: float = 0.0
+    minimum: float = math.inf
+    maximum: float = -math.inf
+    buckets: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+    edges: Dict[int, int] = field(default_factory=lambda: defaultdict(int))
+
+    def add(self, value: float, width: float):
+        """Fold one value into the summary"""
+        self.count += 1
+        self.total += value
+        self.sum_sq += value * value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+
+        scaled = value / width
+        self.buckets[math.floor(scaled + EDGE_TOLERANCE)] += 1
+        # Values sitting exactly on a bucket edge distinguish > from >=
+        if abs(scaled - round(scaled)) < EDGE_TOLERANCE:
+            self.edges[round(scaled)] += 1
+
+    def merge(self, other: "MetricStats"):
+        """Combine another summary into this one"""
+        self.count += other.count
+        self.total += other.total
+        self.sum_sq += other.sum_sq
+        self.minimum = min(self.minimum, other.minimum)
+        self.maximum = max(self.maximum, other.maximum)
+        for bucket, count in other.buckets.items():
+            self.buckets[bucket] += count
+        for edge, count in other.edges.items():
+            self.edges[edge] += count
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    @property
+    def stddev(self) -> Optional[float]:
+        if self.count < 2:
+            return None
+        variance = (self.sum_sq - self.total * self.total / self.count) / (self.count - 1)
+        return math.sqrt(max(variance, 0.0))
+
+    def count_where(self, op: str, edge: int) -> int:
+        """Number of values satisfying `value <op> edge * width`"""
+        at_or_above = sum(count for bucket, count in self.buckets.items() if bucket >= edge)
+        on_edge = self.edges.get(edge, 0)
+        if op == ">=":
+            return at_or_above
+        if op == ">":
+            return at_or_above - on_edge
+        if op == "<":
+            return self.count - at_or_above
+        if op == "<=":
+            return self.count - at_or_above + on_edge
+        if op == "=":
+            return on_edge
+        raise ValueError(f"Unsupported comparison: {op}")
+
+    def value(self, aggregate: str) -> Optional[float]:
+        """Aggregate value by SQL name"""
+        if not self.count:
+            return None
+        return {
+            "avg": self.mean,
+            "sum": self.total,
+            "min": self.minimum,
+            "max": self.maximum,
+            "count": float(self.count),
+        }[aggregate]
+
+@dataclass
+class CubeCell:
+    """Statistics for one region, year, month and monsoon period"""
+    profiles: int = 0
+    metrics: Dict[str, MetricStats] = field(default_factory=lambda: {metric: MetricStats() for metric in METRICS})
+
+@dataclass
+class CubeAnswer:
+    """Aggregation answered from the cube"""
+    aggregate: str
+    metric: Optional[str]
+    region: str
+    group_by: Optional[str]
+    rows: List[Dict[str, Any]]
+    cells_scanned: int
+    elapsed_us: float
+
+class AggregateCube:
+    """Region x year x month x monsoon roll-up of the argo_profiles table"""
+
+    def __init__(self, regions: Optional[Dict[str, Tuple[float, float, float, float]]] = None):
+        self.regions = regions if regions is not None else REGIONS
+        self.cells: Dict[CellKey, CubeCell] = {}
+        self.seen_ids: Set[int] = set()
+        self.max_id = 0
+        self.profiles = 0
+        self.skipped_without_id = 0
+        self.last_refresh: Optional[float] = None
+
+    @property
+    def is_ready(self) -> bool:
+        """Whether the cube holds any data"""
+        return self.profiles > 0
+
+    def add_profiles(self, rows: Iterable[Dict[str, Any]]) -> int:
+        """Fold rows not seen before into the cube and return how many were added"""
+        added = 0
+        for row in rows:
+            profile_id = _as_int(row.get("id"))
+            if profile_id is None:
+                # Without an ID a row cannot be recognized when it is read again
+                self.skipped_without_id += 1
+                continue
+            if profile_id in self.seen_ids:
+                continue
+
+            day = _as_date(row.get("date"))
+            if day is None:
+                continue
+
+            period = monsoon_period(day.month)
+            for region in self._regions_for(row.get("lat"), row.get("lon")):
+                cell = self.cells.setdefault((region, day.year, day.month, period), CubeCell())
+                cell.profiles += 1
+                for metric in METRICS:
+                    value = row.get(metric)
+                    if isinstance(value, (int, float)) and math.isfinite(value):
+                        cell.metrics[metric].add(float(value), BUCKET_WIDTHS[metric])
+
+            self.seen_ids.add(profile_id)
+            self.max_id = max(self.max_id, profile_id)
+            self.profiles += 1
+            added += 1
+
+        return added
+
+    async def refresh(self, mcp_client, batch_size: int = 500) -> int:
+        """Read the table via queryARGO and fold in the profiles not seen yet"""
+        columns = ", ".join(("id", "date", "lat", "lon") + METRICS)
+        # queryARGO only applies the page range, so every refresh is a full scan
+        sql = f"SELECT {columns} FROM argo_profiles ORDER BY id"
+        added = 0
+        page = 1
+
+        while True:
+            raw = await mcp_client.query_argo_sql(sql, page=page, page_size=batch_size)
+            data = json.loads(raw) if isinstance(raw, str) else raw
+            rows = data.get("data", {}).get("data", [])
+            added += self.add_profiles(rows)
+            if len(rows) < batch_size:
+                break
+            page += 1
+
+        self.last_refresh = time.time()
+        if added:
+            logger.info(f"Aggregate cube refreshed with {added} new profile(s) from {page} page(s), {len(self.cells)} cells")
+        return added
+
+    def answer(self, shape: QueryShape) -> Optional[CubeAnswer]:
+        """Answer an aggregation query shape from the cube, or None if it cannot be"""
+        started = time.perf_counter()
+        if not self.is_ready or not shape.aggregate or shape.order_by or shape.limit:
+            return None
+
+        region = shape.region or ALL_REGIONS
+        if region != ALL_REGIONS and region not in self.regions:
+            return None
+
+        month_range = self._month_range(shape)
+        if month_range is None:
+            return None
+
+        threshold = self._threshold(shape)
+        if threshold is None:
+            return None
+        threshold_metric, predicates = threshold
+
+        # Thresholds are only exact for counts; averages over a filtered subset need the rows
+        if predicates and shape.aggregate != "count":
+            return None
+
+        groups: Dict[Any, Tuple[int, MetricStats]] = {}
+        cells_scanned = 0
+        for (cell_region, year, month, period), cell in self.cells.items():
+            if cell_region != region or not month_range[0] <= (year, month) < month_range[1]:
+                continue
+            if shape.months and month not in shape.months:
+                continue
+
+            cells_scanned += 1
+            key = {
+                "month": f"{year:04d}-{month:02d}",
+                "year": year,
+                "monsoon": period,
+            }.get(shape.group_by)
+
+            profiles, stats = groups.get(key, (0, MetricStats()))
+            metric = shape.metric or threshold_metric
+            if metric:
+                stats.merge(cell.metrics[metric])
+            groups[key] = (profiles + cell.profiles, stats)
+
+        rows = []
+        for key in sorted(groups, key=lambda k: (k is None, str(k))):
+            profiles, stats = groups[key]
+            if shape.aggregate == "count":
+                if len(predicates) == 1:
+                    value = stats.count_where(*predicates[0])
+                elif predicates:
+                    value = _count_between(stats, predicates)
+                else:
+                    value = profiles
+                row = {"count": value}
+            else:
+                row = {
+                    f"{shape.aggregate}_{shape.metric}": stats.value(shape.aggregate),
+                    "count": stats.count,
+                    "stddev": stats.stddev,
+                }
+            if shape.group_by:
+                row = {shape.group_by: key, **row}
+            rows.append(row)
+
+        if not rows and not shape.group_by:
+            rows = [{"count": 0}] if shape.aggregate == "count" else [
+                {f"{shape.aggregate}_{shape.metric}": None, "count": 0, "stddev": None}
+            ]
+
+        return CubeAnswer(
+            aggregate=shape.aggregate,
+            metric=shape.metric,
+            region=region,
+            group_by=shape.group_by,
+            rows=rows,
+            cells_scanned=cells_scanned,
+            elapsed_us=(time.perf_counter() - started) * 1e6,
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """Report cube size and freshness"""
+        return {
+            "profiles": self.profiles,
+            "cells": len(self.cells),
+            "max_id": self.max_id,
+            "skipped_without_id": self.skipped_without_id,
+            "last_refresh": self.last_refresh,
+        }
+
+    def _regions_for(self, lat: Any, lon: Any) -> List[str]:
+        """Every named region containing a position, plus the global roll-up"""
+        regions = [ALL_REGIONS]
+        if not isinstance(lat, (int, float)) or not isinstance(lon, (int, float)):
+            return regions
+
+        for name, (lat_min, lat_max, lon_min, lon_max) in self.regions.items():
+            if not lat_min <= lat <= lat_max:
+                continue
+            if lon_min <= lon_max:
+                inside = lon_min <= lon <= lon_max
+            else:
+                inside = lon >= lon_min or lon <= lon_max
+            if inside:
+                regions.append(name)
+        return regions
+
+    @staticmethod
+    def _month_range(shape: QueryShape) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+        """Half-open (year, month) range of the query, if it aligns with whole months"""
+        start, end = (0, 1), (10000, 1)
+        if shape.date_from:
+            if shape.date_from.day != 1:
+                return None
+            start = (shape.date_from.year, shape.date_from.month)
+        if shape.date_to:
+            if shape.date_to.day != 1:
+                return None
+            end = (shape.date_to.year, shape.date_to.month)
+        return start, end
+
+    @staticmethod
+    def _threshold(shape: QueryShape) -> Optional[Tuple[Optional[str], List[Tuple[str, int]]]]:
+        """Bucket-aligned predicates on a single cube metric, or None if not answerable"""
+        columns = {condition.column for condition in shape.conditions}
+        if not columns:
+            return None, []
+        if len(columns) > 1 or not columns <= set(METRICS):
+            return None
+
+        metric = columns.pop()
+        if shape.metric and shape.metric != metric:
+            return None
+
+        lower = sum(1 for condition in shape.conditions if condition.op in (">", ">="))
+        upper = sum(1 for condition in shape.conditions if condition.op in ("<", "<="))
+        if len(shape.conditions) > 1 and (lower, upper) != (1, 1):
+            return None
+
+        predicates = []
+        for condition in shape.conditions:
+            scaled = condition.value / BUCKET_WIDTHS[metric]
+            if abs(scaled - round(scaled)) > EDGE_TOLERANCE:
+                return None
+            predicates.append((condition.op, round(scaled)))
+        return metric, predicates
+
+def _count_between(stats: MetricStats, predicates: List[Tuple[str, int]]) -> int:
+    """Count values inside the range formed by one lower and one upper bound"""
+    (lower_op, lower_edge), = [(op, edge) for op, edge in predicates if op in (">", ">=")]
+    (upper_op, upper_edge), = [(op, edge) for op, edge in predicates if op in ("<", "<=")]
+    # Values above the lower bound minus those that are also beyond the upper bound
+    beyond_upper = stats.count - stats.count_where(upper_op, upper_edge)
+    return max(0, stats.count_where(lower_op, lower_edge) - beyond_upper)
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _as_date(value: Any) -> Optional[date]:
+    """Parse the date column as returned by queryARGO"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, str) and len(value) >= 10:
+        try:
+            return date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    return None
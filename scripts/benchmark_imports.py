@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Import-time benchmark for the RAG pipeline scripts.
+
+Each module is imported in a fresh interpreter several times and the wall
+time is reported relative to a bare interpreter start, so cold-start costs
+of CLI invocations and pipeline workers can be tracked over time.
+
+Usage:
+    python benchmark_imports.py [--runs 10] [--modules rag_config rag_pipeline ...]
+    python benchmark_imports.py --importtime rag_pipeline
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_MODULES = [
+    "rag_config",
+    "rag_pipeline",
+    "llm_agent",
+    "mcp_client",
+    "test_queries",
+    "test_rag_pipeline",
+]
+
+# Heavy third-party packages that should only load on first use
+HEAVY_DEPENDENCIES = ["openai", "mcp", "numpy", "aiohttp"]
+
+def _time_import(statement: str, runs: int) -> List[float]:
+    """Run a statement in fresh interpreters and return wall times in milliseconds"""
+    timings = []
+
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-c", statement],
+            cwd=SCRIPTS_DIR,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+
+    return timings
+
+def _loaded_heavy_dependencies(module: str) -> List[str]:
+    """Report which heavy dependencies a module pulls in at import time"""
+    probe = (
+        f"import sys, {module}; "
+        f"print(','.join(m for m in {HEAVY_DEPENDENCIES!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", probe],
+        cwd=SCRIPTS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    output = result.stdout.strip().splitlines()
+    return [m for m in output[-1].split(",") if m] if output else []
+
+def benchmark(modules: List[str], runs: int) -> Dict[str, Dict[str, float]]:
+    """Benchmark import time of each module against a bare interpreter start"""
+    baseline = statistics.median(_time_import("pass", runs))
+    results = {}
+
+    for module in modules:
+        timings = _time_import(f"import {module}", runs)
+        results[module] = {
+            "median_ms": statistics.median(timings),
+            "min_ms": min(timings),
+            "import_ms": max(0.0, statistics.median(timings) - baseline),
+            "heavy_dependencies": _loaded_heavy_dependencies(module),
+        }
+
+    results["<interpreter>"] = {"median_ms": baseline, "min_ms": baseline, "import_ms": 0.0, "heavy_dependencies": []}
+    return results
+
+def show_importtime(module: str, top: int = 15):
+    """Print the slowest entries of `python -X importtime` for a module"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPTS_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|", 2)
+        entries.append((int(cumulative_us), name.rstrip()))
+
+    print(f"Slowest imports for {module} (cumulative microseconds):")
+    for cumulative_us, name in sorted(entries, reverse=True)[:top]:
+        print(f"  {cumulative_us:>10}  {name}")
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark import time of the RAG pipeline scripts")
+    parser.add_argument("--runs", type=int, default=10, help="fresh interpreter runs per module")
+    parser.add_argument("--modules", nargs="+", default=DEFAULT_MODULES, help="modules to import")
+    parser.add_argument("--importtime", metavar="MODULE", help="show the -X importtime breakdown for a module")
+    args = parser.parse_args()
+
+    if args.importtime:
+        show_importtime(args.importtime)
+        return
+
+    results = benchmark(args.modules, args.runs)
+
+    print(f"{'module':<20} {'median ms':>10} {'min ms':>10} {'import ms':>10}  heavy deps loaded")
+    print("-" * 80)
+    for module, stats in results.items():
+        heavy = ", ".join(stats["heavy_dependencies"]) or "-"
+        print(f"{module:<20} {stats['median_ms']:>10.1f} {stats['min_ms']:>10.1f} {stats['import_ms']:>10.1f}  {heavy}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Benchmark results store and regression gate.
+
+Each benchmark run keeps the raw per-query samples of every stage latency
+(plus the total) and the wall time of the run. Runs are saved under
+`<directory>/runs/` and any run can be promoted to a named baseline under
+`<directory>/baselines/`. A new run is compared against a baseline with
+bootstrap confidence intervals on the ratio of median stage latencies and
+of throughput; a stage regresses when the interval excludes "no change" and
+the point estimate is worse than the tolerance.
+
+Usage:
+    python benchmark_store.py list
+    python benchmark_store.py set-baseline runs/20240101_120000_validation.json main
+    python benchmark_store.py compare runs/20240102_120000_validation.json main
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+TOTAL = "total"
+# Added to both medians so that stages which take (almost) no time compare as unchanged
+EPSILON = 1e-6
+THROUGHPUT = "throughput"
+
+@dataclass
+class BenchmarkRun:
+    """Raw samples from one benchmark run"""
+    label: str
+    samples: Dict[str, List[float]] = field(default_factory=dict)
+    wall_time: float = 0.0
+    created_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    environment: Dict[str, str] = field(default_factory=dict)
+
+    def add_sample(self, total: float, stage_timings: Optional[Dict[str, float]] = None):
+        """Record one query's total latency and its per-stage latencies"""
+        self.samples.setdefault(TOTAL, []).append(total)
+        for stage, seconds in (stage_timings or {}).items():
+            self.samples.setdefault(stage, []).append(seconds)
+
+    @property
+    def queries(self) -> int:
+        return len(self.samples.get(TOTAL, []))
+
+    @property
+    def throughput(self) -> float:
+        """Completed queries per second of wall time"""
+        return self.queries / self.wall_time if self.wall_time > 0 else 0.0
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BenchmarkRun":
+        return cls(**{key: data[key] for key in ("label", "samples", "wall_time", "created_at", "environment")
+                      if key in data})
+
+@dataclass
+class MetricComparison:
+    """Change in one metric between a baseline and a new run"""
+    metric: str
+    baseline: float
+    current: float
+    ratio: float
+    ci_low: float
+    ci_high: float
+    higher_is_better: bool
+    regression: bool
+
+    def describe(self) -> str:
+        status = "REGRESSION" if self.regression else "ok"
+        return (f"{self.metric:<24} {self.baseline:>10.4f} -> {self.current:>10.4f}  "
+                f"x{self.ratio:.3f} [{self.ci_low:.3f}, {self.ci_high:.3f}]  {status}")
+
+@dataclass
+class Comparison:
+    """Result of comparing a run against a baseline"""
+    baseline: str
+    current: str
+    confidence: float
+    tolerance: float
+    metrics: List[MetricComparison]
+
+    @property
+    def regressions(self) -> List[MetricComparison]:
+        return [metric for metric in self.metrics if metric.regression]
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+def environment_info() -> Dict[str, str]:
+    """Identify where and on what revision a run was taken"""
+    info = {"python": platform.python_version(), "platform": platform.platform()}
+    try:
+        info["git_commit"] = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        pass
+    return info
+
+def _numpy():
+    # Deferred so that importing the store (the validation suite does) stays cheap
+    return importlib.import_module("numpy")
+
+def bootstrap_ratio(baseline: List[float], current: List[float], confidence: float = 0.95,
+                    iterations: int = 2000, seed: int = 0):
+    """Percentile bootstrap interval of median(current) / median(baseline)"""
+    np = _numpy()
+    rng = np.random.default_rng(seed)
+    base = np.asarray(baseline, dtype=float)
+    cur = np.asarray(current, dtype=float)
+
+    base_medians = np.median(base[rng.integers(0, len(base), (iterations, len(base)))], axis=1)
+    cur_medians = np.median(cur[rng.integers(0, len(cur), (iterations, len(cur)))], axis=1)
+    ratios = (cur_medians + EPSILON) / (base_medians + EPSILON)
+
+    alpha = (1.0 - confidence) / 2
+    ratio = float((np.median(cur) + EPSILON) / (np.median(base) + EPSILON))
+    return ratio, float(np.quantile(ratios, alpha)), float(np.quantile(ratios, 1 - alpha))
+
+def compare_runs(baseline: BenchmarkRun, current: BenchmarkRun, confidence: float = 0.95,
+                 tolerance: float = 0.10, min_delta: float = 0.005, iterations: int = 2000,
+                 seed: int = 0) -> Comparison:
+    """Compare per-stage latencies and throughput of a run against a baseline
+    
+    A latency only regresses when its median also grew by at least `min_delta` seconds.
+    """
+    np = _numpy()
+    metrics = []
+    for stage in sorted(set(baseline.samples) & set(current.samples)):
+        base, cur = baseline.samples[stage], current.samples[stage]
+        if not base or not cur:
+            continue
+        ratio, low, high = bootstrap_ratio(base, cur, confidence, iterations, seed)
+        base_median, cur_median = float(np.median(base)), float(np.median(cur))
+        metrics.append(MetricComparison(
+            metric=f"{stage}_latency",
+            baseline=base_median,
+            current=cur_median,
+            ratio=ratio,
+            ci_low=low,
+            ci_high=high,
+            higher_is_better=False,
+            regression=low > 1.0 and ratio > 1.0 + tolerance and cur_median - base_median >= min_delta,
+        ))
+
+    if baseline.throughput and current.throughput and baseline.samples.get(TOTAL) and current.samples.get(TOTAL):
+        # Throughput is queries / wall time; its uncertainty follows that of the typical query latency
+        latency_ratio, low, high = bootstrap_ratio(baseline.samples[TOTAL], current.samples[TOTAL],
+                                                   confidence, iterations, seed)
+        ratio = current.throughput / baseline.throughput
+        scale = ratio * latency_ratio
+        metrics.append(MetricComparison(
+            metric=THROUGHPUT,
+            baseline=baseline.throughput,
+            current=current.throughput,
+            ratio=ratio,
+            ci_low=scale / high,
+            ci_high=scale / low,
+            higher_is_better=True,
+            regression=scale / low < 1.0 and ratio < 1.0 - tolerance,
+        ))
+
+    return Comparison(baseline=f"{baseline.label} ({baseline.created_at})",
+                      current=f"{current.label} ({current.created_at})", confidence=confidence,
+                      tolerance=tolerance, metrics=metrics)
+
+class BenchmarkStore:
+    """Directory of benchmark runs and named baselines"""
+
+    def __init__(self, directory: str = "benchmark_results"):
+        self.directory = directory
+        self.runs_dir = os.path.join(directory, "runs")
+        self.baselines_dir = os.path.join(directory, "baselines")
+        os.makedirs(self.runs_dir, exist_ok=True)
+        os.makedirs(self.baselines_dir, exist_ok=True)
+
+    def save_run(self, run: BenchmarkRun) -> str:
+        """Persist a run and return its path"""
+        if not run.environment:
+            run.environment = environment_info()
+        stamp = datetime.fromisoformat(run.created_at).strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.runs_dir, f"{stamp}_{run.label}.json")
+        self._write(path, asdict(run))
+        return path
+
+    def load_run(self, path: str) -> BenchmarkRun:
+        if not os.path.exists(path):
+            path = os.path.join(self.directory, path)
+        with open(path, encoding="utf-8") as f:
+            return BenchmarkRun.from_dict(json.load(f))
+
+    def set_baseline(self, name: str, run: BenchmarkRun) -> str:
+        """Promote a run to the named baseline, replacing any previous one"""
+        path = self._baseline_path(name)
+        self._write(path, asdict(run))
+        logger.info(f"Baseline '{name}' set from run {run.label} ({run.created_at})")
+        return path
+
+    def get_baseline(self, name: str) -> BenchmarkRun:
+        path = self._baseline_path(name)
+        if not os.path.exists(path):
+            raise KeyError(f"No baseline named '{name}' in {self.baselines_dir}")
+        with open(path, encoding="utf-8") as f:
+            return BenchmarkRun.from_dict(json.load(f))
+
+    def list_baselines(self) -> List[str]:
+        return sorted(name[:-len(".json")] for name in os.listdir(self.baselines_dir) if name.endswith(".json"))
+
+    def list_runs(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.runs_dir) if name.endswith(".json"))
+
+    def _baseline_path(self, name: str) -> str:
+        if not name or os.sep in name or name.startswith("."):
+            raise ValueError(f"Invalid baseline name: {name!r}")
+        return os.path.join(self.baselines_dir, f"{name}.json")
+
+    def _write(self, path: str, data: Dict):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, path)
+
+def report_comparison(comparison: Comparison) -> bool:
+    """Log a comparison and return True when it contains no regressions"""
+    logger.info(f"Comparing {comparison.current} against baseline {comparison.baseline} "
+                f"({comparison.confidence:.0%} CI, {comparison.tolerance:.0%} tolerance)")
+    for metric in comparison.metrics:
+        logger.info(f"  {metric.describe()}")
+
+    if comparison.regressions:
+        logger.error(f"{len(comparison.regressions)} significant regression(s): "
+                     f"{', '.join(metric.metric for metric in comparison.regressions)}")
+        return False
+    logger.info("No significant regressions")
+    return True
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Manage benchmark baselines and detect regressions")
+    parser.add_argument("--store", default="benchmark_results", help="Benchmark results directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="List saved runs and baselines")
+
+    promote = commands.add_parser("set-baseline", help="Promote a saved run to a named baseline")
+    promote.add_argument("run", help="Path of the run file")
+    promote.add_argument("name", help="Baseline name")
+
+    compare = commands.add_parser("compare", help="Compare a saved run against a baseline")
+    compare.add_argument("run", help="Path of the run file")
+    compare.add_argument("baseline", help="Baseline name")
+    compare.add_argument("--confidence", type=float, default=0.95, help="Bootstrap confidence level")
+    compare.add_argument("--tolerance", type=float, default=0.10, help="Relative change tolerated before failing")
+    compare.add_argument("--min-delta", type=float, default=0.005, help="Smallest latency increase (s) that can fail")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    store = BenchmarkStore(args.store)
+
+    if args.command == "list":
+        print("Baselines:", ", ".join(store.list_baselines()) or "(none)")
+        for run in store.list_runs():
+            print(f"  runs/{run}")
+        return 0
+
+    if args.command == "set-baseline":
+        store.set_baseline(args.name, store.load_run(args.run))
+        return 0
+
+    comparison = compare_runs(store.get_baseline(args.baseline), store.load_run(args.run),
+                              confidence=args.confidence, tolerance=args.tolerance, min_delta=args.min_delta)
+    return 0 if report_comparison(comparison) else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
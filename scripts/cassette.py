@@ -0,0 +1,287 @@
+"""
+Record-and-replay cassettes for LLM and MCP traffic.
+
+In record mode, wrappers around the OpenAI client and the MCP tool layer
+pass every request through to the live service and capture the request,
+response (or error) and timing - including per-chunk offsets for streamed
+completions - into a cassette file. In replay mode the same wrappers serve
+the recorded responses back without any network access, matched by request
+content, optionally sleeping for the recorded latencies so that runs
+reproduce real traffic shapes.
+
+Usage:
+    cassette = Cassette.record("validation.cassette.json")
+    cassette.wrap_agent(agent)
+    ...
+    cassette.save()
+
+    cassette = Cassette.replay("validation.cassette.json", replay_latency=True)
+    cassette.wrap_agent(agent)
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import defaultdict, deque
+from dataclasses import asdict, is_dataclass
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+class CassetteMissError(LookupError):
+    """Raised in replay mode when a request was never recorded"""
+    pass
+
+class RecordedCallError(RuntimeError):
+    """Replays an error that the live service raised while recording"""
+    pass
+
+def _dump(value: Any) -> Any:
+    """Convert SDK objects, dataclasses and namespaces into JSON-compatible data"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if is_dataclass(value) and not isinstance(value, type):
+        return _dump(asdict(value))
+    if isinstance(value, SimpleNamespace):
+        return {key: _dump(item) for key, item in vars(value).items()}
+    if isinstance(value, dict):
+        return {str(key): _dump(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+def _to_namespace(value: Any) -> Any:
+    """Rebuild attribute access (response.choices[0].message.content) from recorded JSON"""
+    if isinstance(value, dict):
+        return SimpleNamespace(**{key: _to_namespace(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_namespace(item) for item in value]
+    return value
+
+def request_key(kind: str, request: Dict[str, Any]) -> str:
+    """Stable identity of a request"""
+    canonical = json.dumps({"kind": kind, "request": _dump(request)}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class Cassette:
+    """A file of recorded interactions"""
+
+    def __init__(self, path: str, mode: str, replay_latency: bool = False, latency_scale: float = 1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError("Cassette mode must be 'record' or 'replay'")
+
+        self.path = path
+        self.mode = mode
+        self.replay_latency = replay_latency
+        self.latency_scale = latency_scale
+        self.interactions: List[Dict[str, Any]] = []
+        self._queues: Dict[str, Deque[Dict[str, Any]]] = defaultdict(deque)
+        self.hits = 0
+        self.misses = 0
+
+        if mode == "replay":
+            self._load()
+
+    @classmethod
+    def record(cls, path: str) -> "Cassette":
+        """Open a cassette that records live traffic"""
+        return cls(path, "record")
+
+    @classmethod
+    def replay(cls, path: str, replay_latency: bool = False, latency_scale: float = 1.0) -> "Cassette":
+        """Open a recorded cassette for offline replay"""
+        return cls(path, "replay", replay_latency=replay_latency, latency_scale=latency_scale)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == "record"
+
+    def save(self):
+        """Write recorded interactions to disk"""
+        if not self.recording:
+            return
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": CASSETTE_VERSION,
+                "recorded_at": datetime.now().isoformat(),
+                "interactions": self.interactions,
+            }, f, indent=1)
+        logger.info(f"Cassette with {len(self.interactions)} interaction(s) saved to {self.path}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Interaction and replay counters"""
+        return {"mode": self.mode, "interactions": len(self.interactions), "hits": self.hits, "misses": self.misses}
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version: {data.get('version')}")
+
+        self.interactions = data["interactions"]
+        # Identical requests are served in recording order
+        for interaction in self.interactions:
+            self._queues[interaction["key"]].append(interaction)
+
+    def _next(self, kind: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Recorded interaction for a request"""
+        key = request_key(kind, request)
+        queue = self._queues.get(key)
+        if not queue:
+            self.misses += 1
+            raise CassetteMissError(f"No recorded {kind} interaction for request {key[:12]}")
+
+        self.hits += 1
+        # The last recording of a request keeps answering repeats of it
+        return queue.popleft() if len(queue) > 1 else queue[0]
+
+    async def _wait(self, seconds: float):
+        if self.replay_latency and seconds > 0:
+            await asyncio.sleep(seconds * self.latency_scale)
+
+    async def call(self, kind: str, request: Dict[str, Any], invoke: Callable[[], Awaitable[Any]],
+                   decode: Callable[[Any], Any] = _to_namespace) -> Any:
+        """Record or replay one request/response exchange"""
+        if not self.recording:
+            interaction = self._next(kind, request)
+            await self._wait(interaction["latency"])
+            if "error" in interaction:
+                raise RecordedCallError(interaction["error"])
+            return decode(interaction["response"])
+
+        started = time.monotonic()
+        entry = {"kind": kind, "key": request_key(kind, request), "request": _dump(request)}
+        try:
+            response = await invoke()
+        except Exception as e:
+            entry.update(latency=time.monotonic() - started, error=f"{type(e).__name__}: {e}")
+            self.interactions.append(entry)
+            raise
+
+        entry.update(latency=time.monotonic() - started, response=_dump(response))
+        self.interactions.append(entry)
+        return response
+
+    async def stream(self, kind: str, request: Dict[str, Any],
+                     invoke: Callable[[], Awaitable[AsyncIterator[Any]]]) -> AsyncIterator[Any]:
+        """Record or replay a streamed response chunk by chunk"""
+        if not self.recording:
+            interaction = self._next(kind, request)
+            await self._wait(interaction["latency"])
+            if "error" in interaction:
+                raise RecordedCallError(interaction["error"])
+            return self._replay_chunks(interaction["chunks"])
+
+        started = time.monotonic()
+        entry = {"kind": kind, "key": request_key(kind, request), "request": _dump(request)}
+        try:
+            stream = await invoke()
+        except Exception as e:
+            entry.update(latency=time.monotonic() - started, error=f"{type(e).__name__}: {e}")
+            self.interactions.append(entry)
+            raise
+        entry["latency"] = time.monotonic() - started
+        return self._record_chunks(stream, entry, time.monotonic())
+
+    async def _record_chunks(self, stream: AsyncIterator[Any], entry: Dict[str, Any], opened: float):
+        chunks = []
+        try:
+            async for chunk in stream:
+                chunks.append([time.monotonic() - opened, _dump(chunk)])
+                yield chunk
+        finally:
+            entry["chunks"] = chunks
+            self.interactions.append(entry)
+
+    async def _replay_chunks(self, chunks: List[List[Any]]):
+        previous = 0.0
+        for offset, chunk in chunks:
+            await self._wait(offset - previous)
+            previous = offset
+            yield _to_namespace(chunk)
+
+    def wrap_llm(self, client: Any) -> "CassetteLLM":
+        """Wrap an AsyncOpenAI-compatible client (None is fine when replaying)"""
+        return CassetteLLM(client, self)
+
+    def wrap_mcp(self, client: Any) -> "CassetteMCP":
+        """Wrap an MCP client whose coroutine methods return JSON-compatible data"""
+        return CassetteMCP(client, self)
+
+    def wrap_agent(self, agent: Any) -> Any:
+        """Route an ARGOLLMAgent's LLM calls and tool calls through the cassette"""
+        from llm_agent import MCPToolResponse
+
+        agent.client = self.wrap_llm(agent.client if self.recording else None)
+        live_tool_call = agent._simulate_mcp_call
+
+        async def tool_call(tool_call):
+            request = {"tool": tool_call.tool_name, "arguments": tool_call.arguments, "call_id": tool_call.call_id}
+            return await self.call("mcp", request, lambda: live_tool_call(tool_call),
+                                   decode=lambda data: MCPToolResponse(**data))
+
+        agent._simulate_mcp_call = tool_call
+        return agent
+
+    def wrap_pipeline(self, pipeline: Any) -> Any:
+        """Route a RAGPipeline's LLM and MCP traffic through the cassette"""
+        llm = self.wrap_llm(pipeline.openai if self.recording else None)
+        pipeline.openai = llm
+        pipeline.intent_classifier.openai = llm
+        pipeline.sql_generator.openai = llm
+        pipeline.mcp_client = self.wrap_mcp(pipeline.mcp_client)
+        return pipeline
+
+class CassetteLLM:
+    """AsyncOpenAI stand-in that records or replays chat completions and embeddings"""
+
+    def __init__(self, client: Any, cassette: Cassette):
+        self._client = client
+        self._cassette = cassette
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    async def _create_completion(self, **kwargs):
+        if kwargs.get("stream"):
+            return await self._cassette.stream(
+                "llm.chat", kwargs, lambda: self._client.chat.completions.create(**kwargs)
+            )
+        return await self._cassette.call("llm.chat", kwargs, lambda: self._client.chat.completions.create(**kwargs))
+
+    async def _create_embedding(self, **kwargs):
+        return await self._cassette.call("llm.embeddings", kwargs, lambda: self._client.embeddings.create(**kwargs))
+
+class CassetteMCP:
+    """Proxy that records or replays every coroutine method of an MCP client"""
+
+    # Lifecycle calls go to the wrapped client and are not recorded
+    PASSTHROUGH = {"connect", "disconnect", "ping", "close", "stats"}
+
+    def __init__(self, client: Any, cassette: Cassette):
+        self._client = client
+        self._cassette = cassette
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if name in self.PASSTHROUGH or not asyncio.iscoroutinefunction(attribute):
+            if name in self.PASSTHROUGH and not self._cassette.recording:
+                return _noop
+            return attribute
+
+        async def method(*args, **kwargs):
+            request = {"method": name, "args": list(args), "kwargs": kwargs}
+            return await self._cassette.call("mcp", request, lambda: attribute(*args, **kwargs), decode=lambda data: data)
+
+        return method
+
+async def _noop(*args, **kwargs):
+    """Lifecycle calls are no-ops while replaying"""
+    return True
@@ -1,11 +1,14 @@
 import asyncio
 import json
 import logging
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, List, Any, Optional, Tuple
 from datetime import datetime
-import openai
 from dataclasses import dataclass
-import re
+
+from llm_scheduler import LLMScheduler, ScheduledLLMClient
+from session_store import SessionStore
+from telemetry import Telemetry, correlation, correlation_id, default_telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -27,13 +30,136 @@ class MCPToolResponse:
     error: str = None
     metadata: Dict[str, Any] = None
 
+class IncrementalToolCallParser:
+    """Extracts TOOL_CALL objects from streamed text as soon as each one closes"""
+    
+    MARKER = "TOOL_CALL:"
+    
+    def __init__(self):
+        self._buffer = ""
+        self._scan = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._calls = 0
+    
+    def feed(self, chunk: str) -> List[MCPToolCall]:
+        """Consume the next piece of text and return the tool calls it completed"""
+        self._buffer += chunk
+        completed = []
+        
+        while True:
+            if self._start is None and not self._find_object_start():
+                break
+            end = self._find_object_end()
+            if end is None:
+                break
+            
+            tool_call = self._parse(self._buffer[self._start:end])
+            if tool_call:
+                completed.append(tool_call)
+            
+            # Only unparsed text is kept, so long responses do not grow the buffer
+            self._buffer = self._buffer[end:]
+            self._scan = 0
+            self._start = None
+        
+        return completed
+    
+    def close(self):
+        """Report a tool call left unterminated at the end of the stream"""
+        if self._start is not None:
+            logger.error(f"Unterminated tool call in LLM response: {self._buffer[self._start:self._start + 200]}")
+    
+    def _find_object_start(self) -> bool:
+        """Advance to the opening brace that follows the next TOOL_CALL marker"""
+        while True:
+            marker = self._buffer.find(self.MARKER, self._scan)
+            if marker == -1:
+                # Keep a possible partial marker at the end of the buffer
+                keep = len(self.MARKER) - 1
+                self._buffer = self._buffer[-keep:] if len(self._buffer) > keep else self._buffer
+                self._scan = 0
+                return False
+            
+            position = marker + len(self.MARKER)
+            while position < len(self._buffer) and self._buffer[position].isspace():
+                position += 1
+            if position == len(self._buffer):
+                # Marker seen but its object has not started streaming yet
+                self._buffer = self._buffer[marker:]
+                self._scan = 0
+                return False
+            if self._buffer[position] != "{":
+                logger.error("TOOL_CALL marker not followed by a JSON object")
+                self._scan = position
+                continue
+            
+            self._start = position
+            self._scan = position
+            self._depth = 0
+            self._in_string = False
+            self._escaped = False
+            return True
+    
+    def _find_object_end(self) -> Optional[int]:
+        """Track brace depth outside JSON strings; return the end offset once balanced"""
+        buffer = self._buffer
+        for position in range(self._scan, len(buffer)):
+            char = buffer[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    return position + 1
+        
+        self._scan = len(buffer)
+        return None
+    
+    def _parse(self, text: str) -> Optional[MCPToolCall]:
+        """Decode one balanced TOOL_CALL object"""
+        index = self._calls
+        self._calls += 1
+        try:
+            call_data = json.loads(text)
+            return MCPToolCall(
+                tool_name=call_data["tool"],
+                arguments=call_data.get("arguments", {}),
+                call_id=call_data.get("call_id", f"call_{index}")
+            )
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            logger.error(f"Failed to parse tool call: {e}")
+            return None
+
 class ARGOLLMAgent:
     """LLM Agent that uses MCP Server tools to answer ARGO oceanographic queries"""
     
-    def __init__(self, openai_api_key: str, model: str = "gpt-4"):
-        self.client = openai.OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, model: str = "gpt-4", session_store: Optional[SessionStore] = None,
+                 telemetry: Optional[Telemetry] = None, llm_scheduler: Optional[LLMScheduler] = None):
+        # Imported here so that importing the agent module stays cheap
+        import openai
+        
+        # The async client lets one agent serve many conversations concurrently.
+        # A scheduler shared with other LLM users keeps the combined traffic within the provider's limits.
+        self.llm_scheduler = llm_scheduler
+        if llm_scheduler is None:
+            self.client = openai.AsyncOpenAI(api_key=openai_api_key)
+        else:
+            self.client = ScheduledLLMClient(openai.AsyncOpenAI(api_key=openai_api_key, max_retries=0), llm_scheduler)
         self.model = model
-        self.conversation_history = []
+        self.sessions = session_store if session_store is not None else SessionStore()
+        self.telemetry = telemetry if telemetry is not None else default_telemetry()
         
         self.system_prompt = """You are an expert oceanographic data analyst specializing in Indian Ocean ARGO float data. 
 
@@ -89,92 +215,116 @@ RESPONSE GUIDELINES:
 When you need to use a tool, format your response as:
 TOOL_CALL: {"tool": "toolName", "arguments": {...}, "call_id": "unique_id"}"""
 
-    async def process_query(self, user_query: str) -> str:
-        """Process a user query and return a comprehensive response"""
+    @property
+    def conversation_history(self) -> List[Dict[str, str]]:
+        """History of the default session, kept for single-user callers"""
+        session = self.sessions.peek("default")
+        return session.messages() if session else []
+
+    async def process_query(self, user_query: str, session_id: str = "default",
+                            timings: Optional[Dict[str, float]] = None) -> str:
+        """Process a user query within a conversation session and return a comprehensive response
+        
+        When a `timings` dict is passed it is filled with per-stage latencies in seconds.
+        """
+        timings = timings if timings is not None else {}
+        with correlation(correlation_id.get()):
+            return await self._process_query(user_query, session_id, timings)
+
+    async def _process_query(self, user_query: str, session_id: str, timings: Dict[str, float]) -> str:
+        """Answer one query within its session"""
+        self.telemetry.emit("agent_query_started", session_id=session_id, query=user_query)
         try:
-            # Add user query to conversation history
-            self.conversation_history.append({
-                "role": "user", 
-                "content": user_query
-            })
-            
-            # Get LLM response with tool calls
-            response = await self._get_llm_response()
-            
-            # Process any tool calls
-            if self._contains_tool_calls(response):
-                tool_results = await self._execute_tool_calls(response)
+            # Requests within one session are serialized; sessions run concurrently
+            start = time.monotonic()
+            async with self.sessions.session(session_id) as session:
+                timings["session_wait"] = round(time.monotonic() - start, 4)
+                # Add user query to conversation history
+                session.add_message("user", user_query)
                 
-                # Get final response with tool results
-                final_response = await self._get_final_response(tool_results)
-                return final_response
-            else:
+                # Stream the LLM response; tool calls run while it is still generating
+                response, tool_results = await self._stream_llm_response(session.messages(), timings)
+                
+                # Process any tool calls
+                if tool_results:
+                    # Get final response with tool results
+                    start = time.monotonic()
+                    response = await self._get_final_response(tool_results, session.messages())
+                    timings["final_response"] = round(time.monotonic() - start, 4)
+                
+                # Add to conversation history
+                session.add_message("assistant", response)
+                self.telemetry.emit("agent_query_completed", session_id=session_id, timings=timings,
+                                    tool_calls=len(tool_results))
                 return response
                 
         except Exception as e:
-            logger.error(f"Error processing query: {e}")
+            logger.error(f"Error processing query [{correlation_id.get()}]: {e}")
+            self.telemetry.emit("agent_query_failed", session_id=session_id, error=f"{type(e).__name__}: {e}")
             return f"I encountered an error while processing your query: {str(e)}"
 
-    async def _get_llm_response(self) -> str:
-        """Get initial response from LLM"""
+    async def _stream_llm_response(self, history: List[Dict[str, str]],
+                                   timings: Optional[Dict[str, float]] = None) -> Tuple[str, List[MCPToolResponse]]:
+        """Stream the initial LLM response, dispatching each tool call as soon as it is complete"""
+        timings = timings if timings is not None else {}
+        start = time.monotonic()
         messages = [
             {"role": "system", "content": self.system_prompt},
-            *self.conversation_history
+            *history
         ]
         
-        response = self.client.chat.completions.create(
+        stream = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=0.1,
-            max_tokens=1500
+            max_tokens=1500,
+            stream=True
         )
         
-        return response.choices[0].message.content
-
-    def _contains_tool_calls(self, response: str) -> bool:
-        """Check if response contains tool calls"""
-        return "TOOL_CALL:" in response
-
-    async def _execute_tool_calls(self, response: str) -> List[MCPToolResponse]:
-        """Extract and execute tool calls from LLM response"""
-        tool_calls = self._extract_tool_calls(response)
-        results = []
-        
-        for tool_call in tool_calls:
-            try:
-                # Simulate MCP tool execution (in real implementation, this would call MCP server)
-                result = await self._simulate_mcp_call(tool_call)
-                results.append(result)
-            except Exception as e:
-                logger.error(f"Tool call failed: {e}")
-                results.append(MCPToolResponse(
-                    call_id=tool_call.call_id,
-                    success=False,
-                    error=str(e)
-                ))
+        parser = IncrementalToolCallParser()
+        chunks = []
+        tool_tasks = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                chunks.append(delta)
+                for tool_call in parser.feed(delta):
+                    self.telemetry.emit("tool_call_dispatched", call_id=tool_call.call_id, tool=tool_call.tool_name)
+                    tool_tasks.append(asyncio.create_task(self._run_tool_call(tool_call)))
+            parser.close()
+        except BaseException:
+            for task in tool_tasks:
+                task.cancel()
+            raise
+        timings["initial_response"] = round(time.monotonic() - start, 4)
         
-        return results
+        # Tools dispatched mid-stream only add the time they outlive the stream
+        start = time.monotonic()
+        tool_results = list(await asyncio.gather(*tool_tasks)) if tool_tasks else []
+        if tool_tasks:
+            timings["tool_wait"] = round(time.monotonic() - start, 4)
+        return "".join(chunks), tool_results
 
-    def _extract_tool_calls(self, response: str) -> List[MCPToolCall]:
-        """Extract tool calls from LLM response"""
-        tool_calls = []
-        
-        # Find all TOOL_CALL patterns
-        pattern = r'TOOL_CALL:\s*({[^}]+})'
-        matches = re.findall(pattern, response)
-        
-        for i, match in enumerate(matches):
-            try:
-                call_data = json.loads(match)
-                tool_calls.append(MCPToolCall(
-                    tool_name=call_data["tool"],
-                    arguments=call_data["arguments"],
-                    call_id=call_data.get("call_id", f"call_{i}")
-                ))
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse tool call: {e}")
-        
-        return tool_calls
+    async def _run_tool_call(self, tool_call: MCPToolCall) -> MCPToolResponse:
+        """Execute one tool call, converting failures into an error response"""
+        start = time.monotonic()
+        try:
+            # Simulate MCP tool execution (in real implementation, this would call MCP server)
+            result = await self._simulate_mcp_call(tool_call)
+            self.telemetry.emit("tool_call_completed", call_id=tool_call.call_id, tool=tool_call.tool_name,
+                                success=result.success, elapsed=round(time.monotonic() - start, 4))
+            return result
+        except Exception as e:
+            logger.error(f"Tool call failed [{correlation_id.get()}]: {e}")
+            return MCPToolResponse(
+                call_id=tool_call.call_id,
+                success=False,
+                error=str(e)
+            )
 
     async def _simulate_mcp_call(self, tool_call: MCPToolCall) -> MCPToolResponse:
         """Simulate MCP tool call (replace with actual MCP client in production)"""
@@ -370,7 +520,7 @@ TOOL_CALL: {"tool": "toolName", "arguments": {...}, "call_id": "unique_id"}"""
             }
         )
 
-    async def _get_final_response(self, tool_results: List[MCPToolResponse]) -> str:
+    async def _get_final_response(self, tool_results: List[MCPToolResponse], history: List[Dict[str, str]]) -> str:
         """Generate final response using tool results"""
         # Prepare tool results for LLM
         results_summary = []
@@ -409,26 +559,18 @@ Provide a natural language response that directly answers the user's question.
         
         messages = [
             {"role": "system", "content": self.system_prompt},
-            *self.conversation_history,
+            *history,
             {"role": "user", "content": final_prompt}
         ]
         
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=messages,
             temperature=0.1,
             max_tokens=2000
         )
         
-        final_answer = response.choices[0].message.content
-        
-        # Add to conversation history
-        self.conversation_history.append({
-            "role": "assistant",
-            "content": final_answer
-        })
-        
-        return final_answer
+        return response.choices[0].message.content
 
 # Example usage and testing
 async def main():
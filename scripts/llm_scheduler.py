@@ -0,0 +1,323 @@
+"""
+Rate-limit-aware scheduling of LLM calls.
+
+The intent classifier, SQL generator, response generator and agent each
+call the provider independently; at peak their combined traffic exceeds the
+account's requests-per-minute and tokens-per-minute limits and the provider
+answers with 429s, which the callers then retry into a storm. `LLMScheduler`
+is shared by all of them and admits each call only when two token buckets,
+one for requests and one for tokens, can pay for it:
+
+* A call's token cost is estimated up front from its prompt size plus the
+  completion tokens it may generate (which providers also count against
+  the limit), and settled against the reported usage when it returns.
+* Waiting calls are dispatched strictly in priority order: interactive
+  before batch and, within a class, calls on a query's critical path before
+  speculative ones. The class comes from a context variable, so every call
+  made on behalf of a query inherits it.
+* A 429 that still gets through pauses all dispatch for the provider's
+  retry-after period and empties the buckets, then the call is retried.
+  The bucket rates are also cut and then recovered step by step with each
+  successful call (additive increase, multiplicative decrease), so a quota
+  configured too high, or shared with another process, settles instead of
+  causing repeated 429s.
+
+`ScheduledLLMClient` wraps an AsyncOpenAI-compatible client so that the
+callers need no changes.
+"""
+
+import asyncio
+import itertools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from admission import Priority
+
+logger = logging.getLogger(__name__)
+
+# Used when a 429 carries no retry-after header; doubled per retry
+DEFAULT_RATE_LIMIT_PAUSE = 1.0
+
+# Rate adaptation: cut on a 429, recover a fraction of the configured rate per successful call
+RATE_BACKOFF = 0.8
+RATE_RECOVERY = 0.01
+MIN_RATE_FRACTION = 0.1
+
+@dataclass
+class CallTag:
+    """Scheduling class of the LLM calls made in a context"""
+    priority: Priority = Priority.INTERACTIVE
+    critical: bool = True
+
+llm_call_tag: ContextVar[CallTag] = ContextVar("llm_call_tag", default=CallTag())
+
+@contextmanager
+def llm_call_scope(priority: Optional[Priority] = None, critical: Optional[bool] = None) -> Iterator[CallTag]:
+    """Schedule LLM calls made within the block, and tasks it spawns, with this class
+
+    The yielded tag can be changed later, e.g. to promote a speculative
+    branch onto the critical path; calls still waiting pick the change up.
+    """
+    current = llm_call_tag.get()
+    tag = CallTag(
+        priority=current.priority if priority is None else priority,
+        critical=current.critical if critical is None else critical,
+    )
+    token = llm_call_tag.set(tag)
+    try:
+        yield tag
+    finally:
+        llm_call_tag.reset(token)
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    return getattr(error, "status_code", None) == 429
+
+def retry_after_from(error: BaseException) -> Optional[float]:
+    """Pause requested by a 429 response, from its retry-after headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return getattr(error, "retry_after", None)
+
+class TokenBucket:
+    """Continuously refilling budget of `per_minute` units, holding at most `capacity`"""
+
+    def __init__(self, per_minute: float, capacity: Optional[float] = None):
+        self.max_rate = per_minute / 60.0
+        self.rate = self.max_rate
+        self.capacity = capacity if capacity is not None else per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, amount: float) -> float:
+        """Seconds until `amount` can be taken; a cost above capacity waits for a full bucket"""
+        self._refill()
+        needed = min(amount, self.capacity) - self.tokens
+        return max(0.0, needed / self.rate) if self.rate > 0 else 0.0
+
+    def take(self, amount: float):
+        """Take `amount`, going into debt for costs above capacity"""
+        self._refill()
+        self.tokens -= amount
+
+    def adjust(self, amount: float):
+        """Charge (positive) or refund (negative) a correction"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self):
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+    def back_off(self):
+        """Lower the refill rate after the provider pushed back"""
+        self._refill()
+        self.rate = max(self.max_rate * MIN_RATE_FRACTION, self.rate * RATE_BACKOFF)
+
+    def recover(self):
+        """Step the refill rate back towards the configured one"""
+        if self.rate < self.max_rate:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_RECOVERY)
+
+@dataclass
+class _Waiter:
+    tokens: int
+    tag: CallTag
+    seq: int
+    future: asyncio.Future
+    enqueued: float = field(default_factory=time.monotonic)
+
+class LLMScheduler:
+    """Admits LLM calls against requests-per-minute and tokens-per-minute budgets"""
+
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0, burst_seconds: float = 10.0,
+                 max_retries: int = 3, chars_per_token: float = 4.0, default_completion_tokens: int = 512):
+        # Bursts are capped at a few seconds of quota so that a cold start does not spend a whole minute at once
+        self.requests = (
+            TokenBucket(requests_per_minute, max(1.0, requests_per_minute * burst_seconds / 60))
+            if requests_per_minute > 0 else None
+        )
+        self.token_budget = (
+            TokenBucket(tokens_per_minute, max(1.0, tokens_per_minute * burst_seconds / 60))
+            if tokens_per_minute > 0 else None
+        )
+        self.max_retries = max_retries
+        self.chars_per_token = chars_per_token
+        self.default_completion_tokens = default_completion_tokens
+
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+
+        self.calls = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.wait_time = 0.0
+        self.estimated_tokens = 0
+        self.actual_tokens = 0
+
+    def estimate_tokens(self, kind: str, request: Dict[str, Any]) -> int:
+        """Upper estimate of the tokens a call will be charged"""
+        if kind == "embeddings":
+            inputs = request.get("input", "")
+            texts = inputs if isinstance(inputs, list) else [inputs]
+            return max(1, int(sum(len(str(text)) for text in texts) / self.chars_per_token))
+
+        prompt_chars = sum(len(str(message.get("content") or "")) for message in request.get("messages", []))
+        # Roughly four tokens of framing per message
+        prompt = int(prompt_chars / self.chars_per_token) + 4 * len(request.get("messages", []))
+        completion = request.get("max_tokens") or request.get("max_completion_tokens") or self.default_completion_tokens
+        return prompt + completion
+
+    async def call(self, kind: str, request: Dict[str, Any], invoke: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `invoke` once the budgets allow, retrying after rate-limit responses"""
+        estimate = self.estimate_tokens(kind, request)
+        tag = llm_call_tag.get()
+        attempt = 0
+        while True:
+            await self._acquire(estimate, tag)
+            self.calls += 1
+            try:
+                result = await invoke()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    self.failed += 1
+                    raise
+                self.rate_limited += 1
+                pause = retry_after_from(e) or DEFAULT_RATE_LIMIT_PAUSE * 2 ** attempt
+                self._pause(pause * (1 + 0.1 * random.random()))
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.failed += 1
+                    raise
+                logger.warning(f"LLM rate limited, retrying in {pause:.2f}s (attempt {attempt}/{self.max_retries})")
+                continue
+
+            self._settle(estimate, result)
+            for bucket in (self.requests, self.token_budget):
+                if bucket is not None:
+                    bucket.recover()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "waiting": len(self._waiters),
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "mean_wait": self.wait_time / self.calls if self.calls else 0.0,
+            "estimated_tokens": self.estimated_tokens,
+            "actual_tokens": self.actual_tokens,
+            "paused_for": max(0.0, self._paused_until - time.monotonic()),
+            "request_rate_per_minute": self.requests.rate * 60 if self.requests is not None else None,
+            "token_rate_per_minute": self.token_budget.rate * 60 if self.token_budget is not None else None,
+        }
+
+    async def _acquire(self, tokens: int, tag: CallTag):
+        if not self._waiters and self._delay(tokens) <= 0:
+            self._take(tokens)
+            return
+
+        waiter = _Waiter(tokens, tag, next(self._seq), asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._dispatch()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._dispatch()
+            raise
+        self.wait_time += time.monotonic() - waiter.enqueued
+
+    def _delay(self, tokens: int) -> float:
+        delay = self._paused_until - time.monotonic()
+        if self.requests is not None:
+            delay = max(delay, self.requests.delay(1))
+        if self.token_budget is not None:
+            delay = max(delay, self.token_budget.delay(tokens))
+        return delay
+
+    def _take(self, tokens: int):
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.token_budget is not None:
+            self.token_budget.take(tokens)
+        self.estimated_tokens += tokens
+
+    def _dispatch(self):
+        """Grant the budget to waiters in priority order, or wake up when the next one can go"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._waiters:
+            # Tags can change while waiting, so the order is taken afresh every time
+            head = min(self._waiters, key=lambda w: (w.tag.priority, not w.tag.critical, w.seq))
+            delay = self._delay(head.tokens)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            self._waiters.remove(head)
+            self._take(head.tokens)
+            head.future.set_result(None)
+
+    def _settle(self, estimate: int, result: Any):
+        """Correct the token budget with the usage the provider reported"""
+        usage = getattr(result, "usage", None)
+        actual = getattr(usage, "total_tokens", None)
+        if actual is None:
+            # Streams and clients without usage keep the estimate
+            return
+        self.actual_tokens += actual
+        if self.token_budget is not None:
+            self.token_budget.adjust(actual - estimate)
+
+    def _pause(self, seconds: float):
+        """Hold every call back after a rate-limit response"""
+        now = time.monotonic()
+        # Calls that were already in flight fail together; only the first of a burst lowers the rate
+        first_of_burst = now >= self._paused_until
+        self._paused_until = max(self._paused_until, now + seconds)
+        for bucket in (self.requests, self.token_budget):
+            if bucket is not None:
+                bucket.drain()
+                if first_of_burst:
+                    bucket.back_off()
+
+class ScheduledLLMClient:
+    """AsyncOpenAI stand-in that routes chat completions and embeddings through an LLMScheduler"""
+
+    def __init__(self, client: Any, scheduler: LLMScheduler):
+        self._client = client
+        self.scheduler = scheduler
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create_completion))
+        self.embeddings = SimpleNamespace(create=self._create_embedding)
+
+    def __getattr__(self, name: str):
+        return getattr(self._client, name)
+
+    async def _create_completion(self, **kwargs):
+        return await self.scheduler.call("chat", kwargs, lambda: self._client.chat.completions.create(**kwargs))
+
+    async def _create_embedding(self, **kwargs):
+        return await self.scheduler.call("embeddings", kwargs, lambda: self._client.embeddings.create(**kwargs))
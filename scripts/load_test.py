@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Load generator for RAGPipeline and ProductionARGOLLMAgent.
+
+Replays a query mix from TestQueryLibrary or a JSONL trace against local
+stub LLM and MCP backends and steps the offered load up level by level,
+either as a closed loop (a fixed number of concurrent clients issuing
+back-to-back requests) or an open loop (Poisson arrivals at a target rate).
+Each level reports throughput, latency percentiles and histogram, queueing
+delay and error rate; the knee of the curve is located as the level that
+maximizes throughput / latency.
+
+Usage:
+    python load_test.py --target pipeline --mode closed --levels 1 2 4 8 16 32
+    python load_test.py --target agent --mode open --levels 5 10 20 40 --duration 20
+    python load_test.py --trace queries.jsonl --json load_report.json
+    python load_test.py --admission-concurrency 8 --batch-fraction 0.5 --levels 8 16 32
+    python load_test.py --llm-rpm 600 --llm-tpm 400000 --schedule-llm --levels 4 8 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from admission import AdmissionRejected, Priority
+from llm_scheduler import LLMScheduler
+from memory_profiler import MemoryAggregate
+from rag_config import RAGConfig
+from stub_backends import (
+    BackendProfile, StubLLM, StubMCPSession, StubToolClient, build_stub_agent, build_stub_pipeline
+)
+from test_queries import TestQueryLibrary
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+HISTOGRAM_BOUNDS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, math.inf]
+
+@dataclass
+class LevelResult:
+    """Measurements for one offered load level"""
+    mode: str
+    level: float
+    requests: int
+    errors: int
+    degraded: int
+    duration: float
+    throughput: float
+    error_rate: float
+    latency: Dict[str, float]
+    queue_delay: Dict[str, float]
+    backend_queue_wait: Dict[str, float]
+    histogram: Dict[str, int]
+    rejected: int = 0
+    rate_limited: int = 0
+    latency_by_priority: Dict[str, Dict[str, float]] = field(default_factory=dict)
+
+@dataclass
+class _Sample:
+    latency: float
+    queue_delay: float = 0.0
+    error: bool = False
+    degraded: bool = False
+    rejected: bool = False
+    retry_after: float = 0.0
+    priority: str = "interactive"
+
+@dataclass
+class LoadTestReport:
+    """Results of a load sweep"""
+    target: str
+    mode: str
+    levels: List[LevelResult] = field(default_factory=list)
+    knee: Optional[float] = None
+    saturation_throughput: float = 0.0
+    memory: Optional[Dict[str, Any]] = None
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of pre-sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def latency_histogram(latencies: List[float]) -> Dict[str, int]:
+    """Bucket latencies by HISTOGRAM_BOUNDS"""
+    counts = {f"<={bound}s" if bound != math.inf else ">10s": 0 for bound in HISTOGRAM_BOUNDS}
+    labels = list(counts)
+    for latency in latencies:
+        for label, bound in zip(labels, HISTOGRAM_BOUNDS):
+            if latency <= bound:
+                counts[label] += 1
+                break
+    return counts
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    values = sorted(values)
+    return {
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p90": percentile(values, 90),
+        "p99": percentile(values, 99),
+        "max": values[-1] if values else 0.0,
+    }
+
+def find_knee(levels: List[LevelResult]) -> Optional[float]:
+    """Level maximizing power (throughput / mean latency), the classic optimal operating point"""
+    candidates = [level for level in levels if level.requests and level.latency["mean"] > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda level: level.throughput / level.latency["mean"]).level
+
+def load_queries(trace: Optional[str] = None, categories: Optional[List[str]] = None) -> List[str]:
+    """Query mix from a JSONL trace ({"query": ...} per line) or the test query library"""
+    if trace:
+        queries = []
+        with open(trace, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    queries.append(json.loads(line)["query"])
+        return queries
+
+    library = TestQueryLibrary.get_all_test_queries()
+    return [
+        case["query"]
+        for category, cases in library.items()
+        if not categories or category in categories
+        for case in cases
+    ]
+
+class LoadGenerator:
+    """Drives a target coroutine at increasing closed- or open-loop load"""
+
+    def __init__(self, call: Callable[[str, int, Priority], Awaitable[bool]], queries: List[str],
+                 backends: Dict[str, Any], warmup: float = 1.0, seed: int = 0, batch_fraction: float = 0.0):
+        self.call = call
+        self.queries = queries
+        self.backends = backends
+        self.warmup = warmup
+        self.batch_fraction = batch_fraction
+        self.rng = random.Random(seed)
+        self._request_ids = 0
+
+    def _next_query(self) -> tuple[str, int, Priority]:
+        self._request_ids += 1
+        priority = Priority.BATCH if self.rng.random() < self.batch_fraction else Priority.INTERACTIVE
+        return self.rng.choice(self.queries), self._request_ids, priority
+
+    async def _timed_call(self, scheduled: float, started: float) -> _Sample:
+        query, request_id, priority = self._next_query()
+        degraded, error, retry_after = False, False, None
+        try:
+            degraded = await self.call(query, request_id, priority)
+        except AdmissionRejected as e:
+            logger.debug(f"Request rejected: {e}")
+            retry_after = e.retry_after
+        except Exception as e:
+            logger.debug(f"Request failed: {e}")
+            error = True
+        return _Sample(latency=time.monotonic() - scheduled, queue_delay=started - scheduled,
+                       error=error, degraded=bool(degraded), rejected=retry_after is not None,
+                       retry_after=retry_after or 0.0, priority=priority.name.lower())
+
+    async def run_closed(self, concurrency: int, duration: float) -> LevelResult:
+        """`concurrency` clients each issue requests back to back"""
+        samples: List[_Sample] = []
+        measure_from = time.monotonic() + self.warmup
+        stop_at = measure_from + duration
+
+        async def client():
+            while time.monotonic() < stop_at:
+                now = time.monotonic()
+                sample = await self._timed_call(now, now)
+                if now >= measure_from:
+                    samples.append(sample)
+                if sample.rejected:
+                    # Back off as asked instead of spinning on an instant rejection
+                    await asyncio.sleep(min(sample.retry_after, max(0.0, stop_at - time.monotonic())))
+
+        await self._run_level(lambda: asyncio.gather(*(client() for _ in range(concurrency))), measure_from)
+        return self._result("closed", concurrency, samples, duration)
+
+    async def run_open(self, rate: float, duration: float, max_in_flight: Optional[int] = None) -> LevelResult:
+        """Poisson arrivals at `rate` per second, optionally admitting at most `max_in_flight` at once"""
+        samples: List[_Sample] = []
+        slots = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+        measure_from = time.monotonic() + self.warmup
+        stop_at = measure_from + duration
+
+        async def request(scheduled: float):
+            if slots is None:
+                sample = await self._timed_call(scheduled, time.monotonic())
+            else:
+                async with slots:
+                    sample = await self._timed_call(scheduled, time.monotonic())
+            if scheduled >= measure_from:
+                samples.append(sample)
+
+        async def arrivals():
+            tasks = []
+            next_arrival = time.monotonic()
+            while next_arrival < stop_at:
+                await asyncio.sleep(max(0.0, next_arrival - time.monotonic()))
+                tasks.append(asyncio.create_task(request(next_arrival)))
+                next_arrival += self.rng.expovariate(rate)
+            await asyncio.gather(*tasks)
+
+        await self._run_level(arrivals, measure_from)
+        # Throughput is measured over the arrival window, not the drain after it
+        return self._result("open", rate, samples, duration)
+
+    async def _run_level(self, run: Callable[[], Awaitable[Any]], measure_from: float):
+        """Run one level, resetting backend counters once warm-up ends"""
+        async def reset_after_warmup():
+            await asyncio.sleep(max(0.0, measure_from - time.monotonic()))
+            for backend in self.backends.values():
+                backend.reset_stats()
+
+        resetter = asyncio.create_task(reset_after_warmup())
+        try:
+            await run()
+        finally:
+            resetter.cancel()
+
+    def _result(self, mode: str, level: float, samples: List[_Sample], duration: float) -> LevelResult:
+        rejected = sum(1 for sample in samples if sample.rejected)
+        # Latency and throughput describe the requests that were served
+        samples = [sample for sample in samples if not sample.rejected]
+        latencies = [sample.latency for sample in samples]
+        errors = sum(1 for sample in samples if sample.error)
+        priorities = sorted({sample.priority for sample in samples})
+        return LevelResult(
+            mode=mode,
+            level=level,
+            requests=len(samples),
+            errors=errors,
+            degraded=sum(1 for sample in samples if sample.degraded),
+            duration=duration,
+            throughput=(len(samples) - errors) / duration if duration else 0.0,
+            error_rate=errors / len(samples) if samples else 0.0,
+            latency=_summary(latencies),
+            queue_delay=_summary([sample.queue_delay for sample in samples]),
+            backend_queue_wait={name: backend.stats()["mean_queue_wait"] for name, backend in self.backends.items()},
+            histogram=latency_histogram(latencies),
+            rejected=rejected,
+            rate_limited=sum(backend.stats().get("rate_limited", 0) for backend in self.backends.values()),
+            latency_by_priority={
+                priority: _summary([sample.latency for sample in samples if sample.priority == priority])
+                for priority in priorities
+            } if len(priorities) > 1 else {},
+        )
+
+def build_target(args, memory: Optional[MemoryAggregate] = None
+                 ) -> tuple[Callable[[str, int, Priority], Awaitable[bool]], Dict[str, Any], Callable[[], Awaitable[None]]]:
+    """Create the system under test on stub backends, folding pipeline memory figures into `memory`"""
+    llm = StubLLM(BackendProfile(args.llm_latency, args.llm_sigma, args.llm_capacity, args.error_rate), seed=args.seed,
+                  requests_per_minute=args.llm_rpm, tokens_per_minute=args.llm_tpm)
+    # The scheduler is given the same quota the stub provider enforces
+    scheduled = args.schedule_llm and (args.llm_rpm or args.llm_tpm)
+
+    if args.target == "pipeline":
+        mcp = StubMCPSession(BackendProfile(args.mcp_latency, args.mcp_sigma, args.mcp_capacity, args.error_rate),
+                             seed=args.seed)
+        config = RAGConfig(openai_api_key="stub", query_latency_budget=args.budget,
+                           speculative_retrieval=args.speculative, memory_profiling=memory is not None,
+                           admission_max_concurrent=args.admission_concurrency,
+                           admission_max_queue=args.admission_queue,
+                           llm_requests_per_minute=args.llm_rpm if scheduled else 0,
+                           llm_tokens_per_minute=args.llm_tpm if scheduled else 0)
+        pipeline = build_stub_pipeline(llm, mcp, config)
+
+        async def call(query: str, request_id: int, priority: Priority) -> bool:
+            response = await pipeline.process_query(query, priority=priority)
+            if memory is not None:
+                memory.add(response.metadata.get("memory"))
+            return bool(response.metadata.get("degraded_stages"))
+
+        return call, {"llm": llm, "mcp": mcp}, pipeline.shutdown
+
+    tools = StubToolClient(BackendProfile(args.mcp_latency, args.mcp_sigma, args.mcp_capacity, args.error_rate),
+                           seed=args.seed)
+    scheduler = LLMScheduler(requests_per_minute=args.llm_rpm, tokens_per_minute=args.llm_tpm) if scheduled else None
+    agent = build_stub_agent(llm, tools, llm_scheduler=scheduler)
+
+    async def call(query: str, request_id: int, priority: Priority) -> bool:
+        response = await agent.process_query(query, session_id=f"load-{request_id % args.sessions}")
+        if response.startswith("I encountered an error"):
+            raise RuntimeError(response)
+        return False
+
+    return call, {"llm": llm, "mcp": tools}, agent.close
+
+def print_report(report: LoadTestReport):
+    """Human-readable sweep summary"""
+    unit = "clients" if report.mode == "closed" else "req/s"
+    print(f"\nLoad test: {report.target}, {report.mode} loop")
+    print(f"{unit:>8} {'reqs':>6} {'thr/s':>8} {'p50':>7} {'p90':>7} {'p99':>7} {'max':>7} "
+          f"{'err%':>6} {'degr%':>6} {'queue':>7} {'llm q':>7} {'mcp q':>7}")
+    print("-" * 96)
+    for level in report.levels:
+        marker = "  <- knee" if level.level == report.knee else ""
+        degraded = level.degraded / level.requests * 100 if level.requests else 0.0
+        print(f"{level.level:>8g} {level.requests:>6} {level.throughput:>8.2f} "
+              f"{level.latency['p50']:>7.3f} {level.latency['p90']:>7.3f} {level.latency['p99']:>7.3f} "
+              f"{level.latency['max']:>7.3f} {level.error_rate * 100:>6.1f} {degraded:>6.1f} "
+              f"{level.queue_delay['p50']:>7.3f} {level.backend_queue_wait.get('llm', 0):>7.3f} "
+              f"{level.backend_queue_wait.get('mcp', 0):>7.3f}{marker}")
+
+    knee = next((level for level in report.levels if level.level == report.knee), None)
+    if knee and knee.requests:
+        print(f"\nLatency histogram at the knee ({knee.level:g} {unit}):")
+        for label, count in knee.histogram.items():
+            if count:
+                print(f"  {label:>8} {'#' * max(1, round(40 * count / knee.requests))} {count}")
+    print(f"\nPeak throughput: {report.saturation_throughput:.2f} req/s")
+
+    if any(level.rejected or level.latency_by_priority for level in report.levels):
+        print(f"\nAdmission by level:")
+        for level in report.levels:
+            by_priority = ", ".join(
+                f"{priority} p50 {summary['p50']:.3f}s p99 {summary['p99']:.3f}s"
+                for priority, summary in level.latency_by_priority.items()
+            )
+            print(f"  {level.level:>8g}: rejected {level.rejected}{'; ' + by_priority if by_priority else ''}")
+
+    if report.memory:
+        print(f"\nMemory by stage over {report.memory['queries']} queries:")
+        for name, stage in report.memory["stages"].items():
+            print(f"  {name:<20} peak mean {stage['peak_bytes_mean'] / 1024:>9.1f} KiB, "
+                  f"p95 {stage['peak_bytes_p95'] / 1024:>9.1f} KiB, max {stage['peak_bytes_max'] / 1024:>9.1f} KiB")
+            for site in stage["top_sites"][:3]:
+                print(f"    {site['site']:<32} {site['size_bytes'] / 1024:>9.1f} KiB in {site['queries']} queries")
+
+async def run(args) -> LoadTestReport:
+    """Run the configured sweep"""
+    memory = MemoryAggregate() if args.profile_memory else None
+    call, backends, close = build_target(args, memory)
+    generator = LoadGenerator(call, load_queries(args.trace, args.categories), backends,
+                              warmup=args.warmup, seed=args.seed, batch_fraction=args.batch_fraction)
+    report = LoadTestReport(target=args.target, mode=args.mode)
+
+    try:
+        for level in args.levels:
+            if args.mode == "closed":
+                result = await generator.run_closed(int(level), args.duration)
+            else:
+                result = await generator.run_open(level, args.duration, args.max_in_flight)
+            report.levels.append(result)
+            print(f"  level {level:g}: {result.throughput:.2f} req/s, p50 {result.latency['p50']:.3f}s, "
+                  f"p99 {result.latency['p99']:.3f}s, errors {result.error_rate:.1%}, rejected {result.rejected}, "
+                  f"429s {result.rate_limited}")
+    finally:
+        await close()
+
+    report.knee = find_knee(report.levels)
+    report.saturation_throughput = max((level.throughput for level in report.levels), default=0.0)
+    report.memory = memory.to_dict() if memory is not None else None
+    return report
+
+def main():
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Closed/open-loop load test against stub backends")
+    parser.add_argument("--target", choices=["pipeline", "agent"], default="pipeline")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--levels", type=float, nargs="+", default=[1, 2, 4, 8, 16, 32, 64],
+                        help="concurrency (closed) or arrival rate per second (open) for each step")
+    parser.add_argument("--duration", type=float, default=10.0, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=1.0, help="unmeasured seconds before each level")
+    parser.add_argument("--trace", help="JSONL file with one {\"query\": ...} object per line")
+    parser.add_argument("--categories", nargs="+", help="TestQueryLibrary categories to replay")
+    parser.add_argument("--max-in-flight", type=int, help="open loop: admit at most this many requests at once")
+    parser.add_argument("--sessions", type=int, default=100, help="agent: distinct conversation sessions")
+    parser.add_argument("--budget", type=float, default=0.0, help="pipeline latency budget (0 = unbounded)")
+    parser.add_argument("--speculative", action="store_true", help="pipeline: enable speculative retrieval")
+    parser.add_argument("--admission-concurrency", type=int, default=0,
+                        help="pipeline: admit at most this many queries at once (0 = no admission control)")
+    parser.add_argument("--admission-queue", type=int, default=64, help="pipeline: admission queue bound")
+    parser.add_argument("--batch-fraction", type=float, default=0.0,
+                        help="pipeline: fraction of requests sent at batch priority")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="pipeline: record per-stage allocations with tracemalloc (slows the pipeline)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="median stub LLM latency (s)")
+    parser.add_argument("--llm-sigma", type=float, default=0.3, help="log-normal sigma of LLM latency")
+    parser.add_argument("--llm-capacity", type=int, default=32, help="concurrent LLM requests before queueing")
+    parser.add_argument("--mcp-latency", type=float, default=0.05, help="median stub MCP latency (s)")
+    parser.add_argument("--mcp-sigma", type=float, default=0.3, help="log-normal sigma of MCP latency")
+    parser.add_argument("--mcp-capacity", type=int, default=8, help="concurrent MCP calls before queueing")
+    parser.add_argument("--llm-rpm", type=int, default=0, help="stub LLM requests-per-minute quota (0 = none)")
+    parser.add_argument("--llm-tpm", type=int, default=0, help="stub LLM tokens-per-minute quota (0 = none)")
+    parser.add_argument("--schedule-llm", action="store_true",
+                        help="route LLM calls through the rate-limit scheduler at the stub's quota")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected backend failure rate")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # The pipeline modules log every query at INFO
+    logging.getLogger().setLevel(logging.WARNING)
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(asdict(report), f, indent=2)
+        print(f"Report written to {args.json}")
+
+if __name__ == "__main__":
+    main()
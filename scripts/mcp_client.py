@@ -1,10 +1,21 @@
 import asyncio
 import json
 import logging
-from typing import Dict, Any, Optional
-import aiohttp
+import random
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Deque, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
+from llm_agent import ARGOLLMAgent, MCPToolCall, MCPToolResponse
+from llm_scheduler import LLMScheduler
+from session_store import SessionStore
+from telemetry import Telemetry
+
+# aiohttp is imported when a client session is opened, not at module import
+if TYPE_CHECKING:
+    import aiohttp
+
 logger = logging.getLogger(__name__)
 
 @dataclass
@@ -13,16 +24,148 @@ class MCPClientConfig:
     server_url: str = "http://localhost:3001"  # MCP server endpoint
     timeout: int = 30
     max_retries: int = 3
+    
+    # Adaptive retries: full-jitter exponential backoff, capped by a retry
+    # budget so retries and hedges never exceed a fraction of normal traffic
+    backoff_base: float = 0.2
+    backoff_max: float = 5.0
+    retry_budget_ratio: float = 0.2
+    retry_budget_burst: float = 10.0
+    
+    # Hedging: fire a duplicate request for idempotent tools once the first
+    # one is slower than this latency percentile of recent calls
+    hedge_percentile: float = 0.95
+    hedge_min_samples: int = 20
+    idempotent_tools: Tuple[str, ...] = ("queryARGO", "retrieveARGO", "getARGOByLocation", "getARGOByDateRange")
+    
+    # Circuit breaker: fail fast per tool after consecutive failures
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 10.0
+
+class MCPCallError(Exception):
+    """MCP tool call failure"""
+    
+    def __init__(self, message: str, status: Optional[int] = None, retryable: bool = True,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class CircuitOpenError(MCPCallError):
+    """Raised without calling the server while a tool's circuit is open"""
+    
+    def __init__(self, tool_name: str, retry_after: float):
+        super().__init__(f"Circuit open for MCP tool {tool_name}", retryable=False, retry_after=retry_after)
+        self.tool_name = tool_name
+
+class CircuitBreaker:
+    """Per-tool circuit breaker with a single half-open probe"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+    
+    def retry_after(self) -> float:
+        """Seconds until an open circuit admits a probe"""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+    
+    def allow_request(self) -> bool:
+        """Whether a call may be sent to the server now"""
+        if self.state == self.CLOSED:
+            return True
+        
+        if self.state == self.OPEN and self.retry_after() == 0:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        
+        return False
+    
+    def release_probe(self):
+        """Free the half-open probe slot of a call that ended without an outcome"""
+        self._probe_in_flight = False
+    
+    def record_success(self):
+        """Close the circuit after a successful call"""
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+    
+    def record_failure(self):
+        """Count a failure and open the circuit when the threshold is reached"""
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Opening MCP circuit after {self.consecutive_failures} consecutive failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+class LatencyTracker:
+    """Sliding window of recent successful call latencies"""
+    
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = deque(maxlen=window)
+    
+    def record(self, latency: float):
+        """Add one latency sample in seconds"""
+        self.samples.append(latency)
+    
+    def percentile(self, p: float) -> Optional[float]:
+        """Latency at percentile p (0-1) of the window"""
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class RetryBudget:
+    """Token bucket that limits retries and hedges to a fraction of requests"""
+    
+    def __init__(self, ratio: float, burst: float):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+    
+    def deposit(self):
+        """Earn a fraction of a token for every first attempt"""
+        self.tokens = min(self.burst, self.tokens + self.ratio)
+    
+    def try_spend(self) -> bool:
+        """Spend a token for one extra request if available"""
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
 
 class MCPClient:
     """Client for communicating with MCP Server"""
     
     def __init__(self, config: MCPClientConfig = None):
         self.config = config or MCPClientConfig()
-        self.session: Optional[aiohttp.ClientSession] = None
+        self.session: Optional["aiohttp.ClientSession"] = None
+        self.retry_budget = RetryBudget(self.config.retry_budget_ratio, self.config.retry_budget_burst)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self.hedges_sent = 0
+        self.hedges_won = 0
     
     async def __aenter__(self):
         """Async context manager entry"""
+        import aiohttp
+        
         self.session = aiohttp.ClientSession(
             timeout=aiohttp.ClientTimeout(total=self.config.timeout)
         )
@@ -32,6 +175,21 @@ class MCPClient:
         """Async context manager exit"""
         if self.session:
             await self.session.close()
+            self.session = None
+    
+    def breaker(self, tool_name: str) -> CircuitBreaker:
+        """Circuit breaker for a tool"""
+        if tool_name not in self._breakers:
+            self._breakers[tool_name] = CircuitBreaker(
+                self.config.breaker_failure_threshold, self.config.breaker_reset_timeout
+            )
+        return self._breakers[tool_name]
+    
+    def latency(self, tool_name: str) -> LatencyTracker:
+        """Latency tracker for a tool"""
+        if tool_name not in self._latencies:
+            self._latencies[tool_name] = LatencyTracker()
+        return self._latencies[tool_name]
     
     async def call_tool(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Call an MCP tool with the given arguments"""
@@ -46,33 +204,135 @@ class MCPClient:
             }
         }
         
-        for attempt in range(self.config.max_retries):
-            try:
-                async with self.session.post(
-                    f"{self.config.server_url}/mcp",
-                    json=payload,
-                    headers={"Content-Type": "application/json"}
-                ) as response:
+        breaker = self.breaker(tool_name)
+        if not breaker.allow_request():
+            raise CircuitOpenError(tool_name, breaker.retry_after())
+        
+        self.retry_budget.deposit()
+        
+        # True while this call holds the breaker's admission without having reported an outcome
+        admitted = True
+        try:
+            for attempt in range(self.config.max_retries):
+                try:
+                    result = await self._send(tool_name, payload, hedge=breaker.state == CircuitBreaker.CLOSED)
                     
-                    if response.status == 200:
-                        result = await response.json()
-                        return result
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"MCP call failed with status {response.status}: {error_text}")
-                        
-                        if attempt == self.config.max_retries - 1:
-                            raise Exception(f"MCP call failed: {error_text}")
-                        
-            except aiohttp.ClientError as e:
-                logger.error(f"Network error on attempt {attempt + 1}: {e}")
-                if attempt == self.config.max_retries - 1:
-                    raise Exception(f"Network error: {e}")
-                
-                # Wait before retry
-                await asyncio.sleep(2 ** attempt)
+                except MCPCallError as e:
+                    if not e.retryable:
+                        # Client errors say nothing about server health: neither a failure
+                        # nor a success, so the finally below only frees a half-open probe
+                        raise
+                    
+                    admitted = False
+                    breaker.record_failure()
+                    logger.error(f"MCP call {tool_name} failed on attempt {attempt + 1}: {e}")
+                    
+                    if attempt == self.config.max_retries - 1:
+                        raise
+                    if not breaker.allow_request():
+                        raise CircuitOpenError(tool_name, breaker.retry_after()) from e
+                    admitted = True
+                    if not self.retry_budget.try_spend():
+                        logger.warning(f"Retry budget exhausted, not retrying {tool_name}")
+                        raise
+                    
+                    await asyncio.sleep(self._backoff(attempt, e.retry_after))
+                    
+                except Exception:
+                    admitted = False
+                    breaker.record_failure()
+                    raise
+                    
+                else:
+                    admitted = False
+                    breaker.record_success()
+                    return result
+        finally:
+            if admitted:
+                # Cancelled (or out of budget) with the admission unused: a half-open
+                # probe slot must not stay taken, or the tool is rejected forever
+                breaker.release_probe()
+    
+    def _backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, honouring a server Retry-After"""
+        delay = random.uniform(0, min(self.config.backoff_max, self.config.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.config.backoff_max))
+        return delay
+    
+    async def _send(self, tool_name: str, payload: Dict[str, Any], hedge: bool) -> Dict[str, Any]:
+        """Send one logical request, hedging it when the tool allows"""
+        hedge_delay = None
+        if hedge and tool_name in self.config.idempotent_tools:
+            tracker = self.latency(tool_name)
+            if len(tracker.samples) >= self.config.hedge_min_samples:
+                hedge_delay = tracker.percentile(self.config.hedge_percentile)
+        
+        if hedge_delay is None:
+            return await self._post(tool_name, payload)
         
-        raise Exception("Max retries exceeded")
+        primary = asyncio.create_task(self._post(tool_name, payload))
+        tasks = [primary]
+        
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=hedge_delay)
+            if done or not self.retry_budget.try_spend():
+                return await primary
+            
+            self.hedges_sent += 1
+            hedged = asyncio.create_task(self._post(tool_name, payload))
+            tasks.append(hedged)
+            pending = {primary, hedged}
+            error: Optional[BaseException] = None
+            
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedged:
+                            self.hedges_won += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Losers, and every request if this call is cancelled while waiting
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def _post(self, tool_name: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a single HTTP request and classify failures"""
+        import aiohttp
+        
+        start = time.monotonic()
+        try:
+            async with self.session.post(
+                f"{self.config.server_url}/mcp",
+                json=payload,
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                
+                if response.status == 200:
+                    result = await response.json()
+                    self.latency(tool_name).record(time.monotonic() - start)
+                    return result
+                
+                error_text = await response.text()
+                logger.error(f"MCP call failed with status {response.status}: {error_text}")
+                
+                retry_after = response.headers.get("Retry-After")
+                raise MCPCallError(
+                    f"MCP call failed: {error_text}",
+                    status=response.status,
+                    retryable=response.status >= 500 or response.status in (408, 429),
+                    retry_after=float(retry_after) if retry_after and retry_after.isdigit() else None,
+                )
+                
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise MCPCallError(f"Network error: {e}") from e
+        except ValueError as e:
+            # Malformed or undecodable response body (JSONDecodeError, UnicodeDecodeError)
+            raise MCPCallError(f"Invalid response from MCP server: {e}") from e
     
     async def query_argo(self, sql: str, page: int = 1, page_size: int = 100) -> Dict[str, Any]:
         """Execute SQL query on ARGO data"""
@@ -110,44 +370,61 @@ class MCPClient:
 class ProductionARGOLLMAgent(ARGOLLMAgent):
     """Production version of ARGO LLM Agent that uses real MCP Client"""
     
-    def __init__(self, openai_api_key: str, mcp_config: MCPClientConfig = None, model: str = "gpt-4"):
-        super().__init__(openai_api_key, model)
+    def __init__(self, openai_api_key: str, mcp_config: MCPClientConfig = None, model: str = "gpt-4",
+                 session_store: Optional[SessionStore] = None, telemetry: Optional[Telemetry] = None,
+                 llm_scheduler: Optional[LLMScheduler] = None):
+        super().__init__(openai_api_key, model, session_store=session_store, telemetry=telemetry,
+                         llm_scheduler=llm_scheduler)
         self.mcp_config = mcp_config or MCPClientConfig()
+        # One long-lived client so breaker state and latency history persist
+        self._mcp_client: Optional[MCPClient] = None
+    
+    async def _get_mcp_client(self) -> MCPClient:
+        """Open the shared MCP client on first use"""
+        if self._mcp_client is None:
+            self._mcp_client = await MCPClient(self.mcp_config).__aenter__()
+        return self._mcp_client
+    
+    async def close(self):
+        """Close the shared MCP client"""
+        if self._mcp_client is not None:
+            await self._mcp_client.__aexit__(None, None, None)
+            self._mcp_client = None
     
     async def _simulate_mcp_call(self, tool_call: MCPToolCall) -> MCPToolResponse:
         """Replace simulation with actual MCP client calls"""
-        async with MCPClient(self.mcp_config) as client:
-            try:
-                if tool_call.tool_name == "queryARGO":
-                    result = await client.query_argo(**tool_call.arguments)
-                elif tool_call.tool_name == "retrieveARGO":
-                    result = await client.retrieve_argo(**tool_call.arguments)
-                elif tool_call.tool_name == "getARGOByLocation":
-                    result = await client.get_argo_by_location(**tool_call.arguments)
-                elif tool_call.tool_name == "getARGOByDateRange":
-                    result = await client.get_argo_by_date_range(**tool_call.arguments)
-                else:
-                    return MCPToolResponse(
-                        call_id=tool_call.call_id,
-                        success=False,
-                        error=f"Unknown tool: {tool_call.tool_name}"
-                    )
-                
-                return MCPToolResponse(
-                    call_id=tool_call.call_id,
-                    success=result.get("success", True),
-                    data=result.get("data"),
-                    error=result.get("error"),
-                    metadata=result.get("metadata", {})
-                )
-                
-            except Exception as e:
-                logger.error(f"MCP call failed: {e}")
+        client = await self._get_mcp_client()
+        try:
+            if tool_call.tool_name == "queryARGO":
+                result = await client.query_argo(**tool_call.arguments)
+            elif tool_call.tool_name == "retrieveARGO":
+                result = await client.retrieve_argo(**tool_call.arguments)
+            elif tool_call.tool_name == "getARGOByLocation":
+                result = await client.get_argo_by_location(**tool_call.arguments)
+            elif tool_call.tool_name == "getARGOByDateRange":
+                result = await client.get_argo_by_date_range(**tool_call.arguments)
+            else:
                 return MCPToolResponse(
                     call_id=tool_call.call_id,
                     success=False,
-                    error=str(e)
+                    error=f"Unknown tool: {tool_call.tool_name}"
                 )
+            
+            return MCPToolResponse(
+                call_id=tool_call.call_id,
+                success=result.get("success", True),
+                data=result.get("data"),
+                error=result.get("error"),
+                metadata=result.get("metadata", {})
+            )
+            
+        except Exception as e:
+            logger.error(f"MCP call failed: {e}")
+            return MCPToolResponse(
+                call_id=tool_call.call_id,
+                success=False,
+                error=str(e)
+            )
 
 # Example usage with real MCP client
 async def production_example():
@@ -166,12 +443,15 @@ async def production_example():
         mcp_config=mcp_config
     )
     
-    # Process query
-    response = await agent.process_query(
-        "Find warm water ARGO profiles in the tropical Pacific Ocean from 2023"
-    )
-    
-    print(response)
+    try:
+        # Process query
+        response = await agent.process_query(
+            "Find warm water ARGO profiles in the tropical Pacific Ocean from 2023"
+        )
+        
+        print(response)
+    finally:
+        await agent.close()
 
 if __name__ == "__main__":
     # Run production example
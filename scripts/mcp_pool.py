@@ -0,0 +1,320 @@
+"""
+Pool of MCP stdio server sessions.
+
+Each pool member owns its own `node server/mcp/index.js` subprocess, so tool
+calls from concurrent queries are spread across several server processes
+instead of serializing on a single stdio pipe. Calls are dispatched to the
+member with the fewest outstanding requests, members are health checked and
+restarted when their subprocess dies, and the pool grows or shrinks between
+its minimum and maximum size based on queue depth.
+
+Every member's session is opened, held and closed by one long-lived owner
+task: the MCP stdio transport runs inside anyio cancel scopes, which must
+be exited by the task that entered them. A failing member is marked
+unhealthy, its in-flight calls drain, and its owner task then reconnects.
+"""
+
+import asyncio
+import itertools
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class PoolMember:
+    """One MCP client session managed by the pool"""
+    member_id: int
+    client: Any
+    outstanding: int = 0
+    healthy: bool = False
+    restarts: int = 0
+    calls: int = 0
+    failures: int = 0
+    stopping: bool = False
+    # Set once the first start attempt has finished, successfully or not
+    ready: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    # Set to make the owner task close the session, then reconnect unless stopping
+    wake: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    owner: Optional[asyncio.Task] = field(default=None, repr=False)
+    checking: Optional[asyncio.Task] = field(default=None, repr=False)
+
+class MCPSessionPool:
+    """Least-outstanding-requests pool of MCP stdio sessions"""
+
+    def __init__(self, client_factory: Callable[[], Any], min_size: int = 1, max_size: int = 4,
+                 health_check_interval: float = 10.0, scale_up_threshold: float = 2.0,
+                 scale_down_threshold: float = 0.25, scale_down_checks: int = 3,
+                 acquire_timeout: float = 30.0, drain_timeout: float = 30.0):
+        if min_size < 1 or max_size < min_size:
+            raise ValueError("MCP pool sizes must satisfy 1 <= min_size <= max_size")
+
+        self.client_factory = client_factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.scale_up_threshold = scale_up_threshold
+        self.scale_down_threshold = scale_down_threshold
+        self.scale_down_checks = scale_down_checks
+        self.acquire_timeout = acquire_timeout
+        self.drain_timeout = drain_timeout
+
+        self.members: List[PoolMember] = []
+        self._ids = itertools.count(1)
+        self._member_available = asyncio.Condition()
+        self._maintenance_task: Optional[asyncio.Task] = None
+        self._grow_task: Optional[asyncio.Task] = None
+        self._idle_checks = 0
+        self._closed = True
+
+    @property
+    def size(self) -> int:
+        """Number of members currently in the pool"""
+        return len(self.members)
+
+    @property
+    def queue_depth(self) -> int:
+        """Total outstanding tool calls across the pool"""
+        return sum(member.outstanding for member in self.members)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report per-member load and health"""
+        return {
+            "size": self.size,
+            "queue_depth": self.queue_depth,
+            "members": [
+                {
+                    "id": member.member_id,
+                    "healthy": member.healthy,
+                    "outstanding": member.outstanding,
+                    "calls": member.calls,
+                    "failures": member.failures,
+                    "restarts": member.restarts,
+                }
+                for member in self.members
+            ],
+        }
+
+    async def connect(self):
+        """Start the minimum number of sessions and the maintenance loop"""
+        self._closed = False
+        await asyncio.gather(*(self._add_member() for _ in range(self.min_size)))
+
+        if not any(member.healthy for member in self.members):
+            await self.disconnect()
+            raise RuntimeError("No MCP session in the pool could be started")
+
+        self._maintenance_task = asyncio.create_task(self._maintain())
+        logger.info(f"MCP session pool started with {self.size} session(s)")
+
+    async def disconnect(self):
+        """Stop the maintenance loop and close every session"""
+        self._closed = True
+        if self._maintenance_task:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        if self._grow_task:
+            self._grow_task.cancel()
+
+        members, self.members = self.members, []
+        await asyncio.gather(*(self._stop_member(member) for member in members))
+
+    async def query_argo_sql(self, sql: str, page: int = 1, page_size: int = 100) -> Dict[str, Any]:
+        """Execute SQL query via the least loaded MCP session"""
+        return await self._dispatch("query_argo_sql", sql, page=page, page_size=page_size)
+
+    async def retrieve_argo_semantic(self, query: str, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        """Perform semantic search via the least loaded MCP session"""
+        return await self._dispatch("retrieve_argo_semantic", query, limit=limit, offset=offset)
+
+    async def _dispatch(self, method: str, *args, **kwargs) -> Any:
+        """Run a client method on the member with the fewest outstanding calls"""
+        member = await self._acquire()
+        member.outstanding += 1
+        member.calls += 1
+        self._maybe_grow()
+
+        try:
+            return await getattr(member.client, method)(*args, **kwargs)
+        except Exception:
+            member.failures += 1
+            # A failed call may mean the subprocess died; confirm before restarting
+            self._schedule_check(member)
+            raise
+        finally:
+            member.outstanding -= 1
+            await self._notify()
+
+    async def _acquire(self) -> PoolMember:
+        """Pick the healthy member with the fewest outstanding requests"""
+        async with self._member_available:
+            member = await asyncio.wait_for(
+                self._member_available.wait_for(self._least_loaded), timeout=self.acquire_timeout
+            )
+        return member
+
+    def _least_loaded(self) -> Optional[PoolMember]:
+        """Return the least loaded healthy member, if any"""
+        if self._closed:
+            raise RuntimeError("MCP session pool is closed")
+
+        healthy = [member for member in self.members if member.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda member: (member.outstanding, member.calls))
+
+    def _maybe_grow(self):
+        """Grow the pool as soon as queue depth crosses the threshold"""
+        if self._grow_task and not self._grow_task.done():
+            return
+        if self.size < self.max_size and self._load() > self.scale_up_threshold:
+            self._grow_task = asyncio.create_task(self._grow())
+
+    async def _grow(self):
+        """Add one member in response to load"""
+        logger.info(f"MCP pool load {self._load():.1f} per session, growing to {self.size + 1}")
+        self._idle_checks = 0
+        await self._add_member()
+
+    def _load(self) -> float:
+        """Outstanding calls per healthy member"""
+        healthy = sum(1 for member in self.members if member.healthy)
+        return self.queue_depth / max(healthy, 1)
+
+    async def _add_member(self) -> PoolMember:
+        """Start a new session and add it to the pool"""
+        member = PoolMember(member_id=next(self._ids), client=self.client_factory())
+        self.members.append(member)
+        member.owner = asyncio.create_task(self._own(member))
+        await member.ready.wait()
+        return member
+
+    async def _remove_member(self, member: PoolMember):
+        """Drain and close one member"""
+        member.healthy = False
+        self.members.remove(member)
+        await self._stop_member(member)
+        logger.info(f"MCP pool shrunk to {self.size} session(s)")
+
+    async def _stop_member(self, member: PoolMember):
+        """Have a member's owner task drain and close its session, and wait for it"""
+        member.healthy = False
+        member.stopping = True
+        member.wake.set()
+        if member.checking:
+            member.checking.cancel()
+        if member.owner:
+            await asyncio.gather(member.owner, return_exceptions=True)
+
+    async def _own(self, member: PoolMember):
+        """Open, hold and close a member's session, reconnecting with backoff, all in this task"""
+        delay = 0.5
+        connected_before = False
+        while not member.stopping:
+            try:
+                await member.client.connect()
+            except Exception as e:
+                logger.error(f"MCP pool member {member.member_id} failed to start: {e}")
+                member.ready.set()
+                await self._sleep_unless_woken(member, delay)
+                delay = min(delay * 2, 30.0)
+                continue
+
+            if connected_before:
+                member.restarts += 1
+                logger.info(f"MCP pool member {member.member_id} restarted")
+            connected_before = True
+            delay = 0.5
+
+            try:
+                member.healthy = not member.stopping
+                member.ready.set()
+                await self._notify()
+                await member.wake.wait()
+                member.wake.clear()
+                member.healthy = False
+                await self._drain(member)
+            finally:
+                member.healthy = False
+                try:
+                    await member.client.disconnect()
+                except Exception as e:
+                    logger.warning(f"Error while closing MCP pool member {member.member_id}: {e}")
+
+    async def _sleep_unless_woken(self, member: PoolMember, delay: float):
+        """Back off before reconnecting, returning early when the member is stopped"""
+        try:
+            await asyncio.wait_for(member.wake.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        member.wake.clear()
+
+    async def _drain(self, member: PoolMember):
+        """Wait for a member's in-flight calls to finish before its session is closed"""
+        async with self._member_available:
+            try:
+                await asyncio.wait_for(
+                    self._member_available.wait_for(lambda: member.outstanding == 0), timeout=self.drain_timeout
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    f"MCP pool member {member.member_id} still has {member.outstanding} call(s) in flight, closing"
+                )
+
+    async def _notify(self):
+        """Wake callers waiting for a member and owners waiting for a drain"""
+        async with self._member_available:
+            self._member_available.notify_all()
+
+    def _request_restart(self, member: PoolMember):
+        """Take a member out of rotation and have its owner task reconnect once it has drained"""
+        if member.stopping or not member.healthy:
+            return
+        member.healthy = False
+        member.wake.set()
+
+    def _schedule_check(self, member: PoolMember):
+        """Ping a member in the background after a failed call, restarting it if it is dead"""
+        if self._closed or not member.healthy or (member.checking and not member.checking.done()):
+            return
+        member.checking = asyncio.create_task(self._check(member))
+
+    async def _check(self, member: PoolMember):
+        """Restart a member whose subprocess no longer answers"""
+        if not await member.client.ping():
+            logger.warning(f"MCP pool member {member.member_id} is not responding, restarting")
+            self._request_restart(member)
+
+    async def _maintain(self):
+        """Periodically health check members and resize the pool"""
+        while not self._closed:
+            await asyncio.sleep(self.health_check_interval)
+
+            for member in list(self.members):
+                if member.healthy and member.outstanding == 0 and not await member.client.ping():
+                    self._request_restart(member)
+
+            await self._resize()
+
+    async def _resize(self):
+        """Grow under sustained queue depth, shrink after sustained idleness"""
+        load = self._load()
+
+        if load > self.scale_up_threshold and self.size < self.max_size:
+            await self._grow()
+            return
+
+        if load < self.scale_down_threshold and self.size > self.min_size:
+            self._idle_checks += 1
+            if self._idle_checks >= self.scale_down_checks:
+                idle = [member for member in self.members if member.outstanding == 0]
+                if idle:
+                    self._idle_checks = 0
+                    await self._remove_member(max(idle, key=lambda member: member.member_id))
+        else:
+            self._idle_checks = 0
@@ -0,0 +1,160 @@
+"""
+Opt-in per-query memory accounting for the RAG pipeline.
+
+With `memory_profiling` enabled, every pipeline stage runs inside a
+`tracemalloc` window that records the stage's peak allocation above its
+starting point, the memory it left allocated, and the source lines that
+allocated the most during the stage. The per-query figures are attached to
+`RAGResponse.metadata["memory"]`; `MemoryAggregate` folds them across a
+benchmark run.
+
+tracemalloc traces the whole process, so the figures are exact when queries
+run one at a time and overlap between queries that run concurrently.
+Tracing itself slows allocation-heavy code noticeably, so this mode is
+meant for benchmark and diagnosis runs rather than production traffic.
+"""
+
+import logging
+import os
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Allocations made by the profiler itself are not attributed to stages
+_IGNORED_FILES = (tracemalloc.__file__, __file__)
+
+@dataclass
+class AllocationSite:
+    """Net allocation at one source line during a stage"""
+    site: str
+    size_bytes: int
+    count: int
+
+@dataclass
+class StageMemory:
+    """Memory figures for one pipeline stage of one query"""
+    peak_bytes: int
+    net_bytes: int
+    top_sites: List[AllocationSite] = field(default_factory=list)
+
+class MemoryProfiler:
+    """Records tracemalloc figures for the stages of one query"""
+
+    _users = 0
+    _started_tracing = False
+
+    def __init__(self, top_sites: int = 5):
+        self.top_sites = top_sites
+        self.stages: Dict[str, StageMemory] = {}
+
+    @classmethod
+    def acquire(cls, frames: int = 1):
+        """Start tracing, unless something else already traces the process"""
+        if cls._users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            cls._started_tracing = True
+        cls._users += 1
+
+    @classmethod
+    def release(cls):
+        """Stop tracing once the last user that started it is done"""
+        cls._users = max(0, cls._users - 1)
+        if cls._users == 0 and cls._started_tracing:
+            tracemalloc.stop()
+            cls._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure allocations made while the block runs"""
+        if not tracemalloc.is_tracing():
+            yield
+            return
+
+        before = self._snapshot()
+        start_current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            current, peak = tracemalloc.get_traced_memory()
+            after = self._snapshot()
+            self.stages[name] = StageMemory(
+                peak_bytes=max(0, peak - start_current),
+                net_bytes=current - start_current,
+                top_sites=self._top_sites(before, after),
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-stage figures for RAGResponse.metadata"""
+        return {
+            "peak_bytes": max((stage.peak_bytes for stage in self.stages.values()), default=0),
+            "stages": {name: asdict(stage) for name, stage in self.stages.items()},
+        }
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        # Snapshot.filter_traces matches every trace in Python, so ignored files are skipped when ranking instead
+        return tracemalloc.take_snapshot()
+
+    def _top_sites(self, before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> List[AllocationSite]:
+        """Source lines whose allocations grew the most"""
+        sites = []
+        for stat in after.compare_to(before, "lineno"):
+            frame = stat.traceback[0]
+            if stat.size_diff <= 0 or frame.filename in _IGNORED_FILES:
+                continue
+            sites.append(AllocationSite(
+                site=f"{os.path.basename(frame.filename)}:{frame.lineno}",
+                size_bytes=stat.size_diff,
+                count=stat.count_diff,
+            ))
+            if len(sites) >= self.top_sites:
+                break
+        return sites
+
+class MemoryAggregate:
+    """Folds per-query memory figures across a benchmark run"""
+
+    def __init__(self, top_sites: int = 10):
+        self.top_sites = top_sites
+        self.queries = 0
+        self._peaks: Dict[str, List[int]] = {}
+        self._net: Dict[str, List[int]] = {}
+        self._sites: Dict[str, Dict[str, List[int]]] = {}
+
+    def add(self, memory: Optional[Dict[str, Any]]):
+        """Fold in one response's metadata["memory"]"""
+        if not memory:
+            return
+        self.queries += 1
+        for name, stage in memory.get("stages", {}).items():
+            self._peaks.setdefault(name, []).append(stage["peak_bytes"])
+            self._net.setdefault(name, []).append(stage["net_bytes"])
+            sites = self._sites.setdefault(name, {})
+            for site in stage.get("top_sites", []):
+                totals = sites.setdefault(site["site"], [0, 0, 0])
+                totals[0] += site["size_bytes"]
+                totals[1] += site["count"]
+                totals[2] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Per-stage peak distribution and the heaviest allocation sites"""
+        stages = {}
+        for name, peaks in self._peaks.items():
+            ordered = sorted(peaks)
+            net = self._net[name]
+            sites = sorted(self._sites.get(name, {}).items(), key=lambda item: item[1][0], reverse=True)
+            stages[name] = {
+                "queries": len(peaks),
+                "peak_bytes_mean": sum(peaks) / len(peaks),
+                "peak_bytes_p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+                "peak_bytes_max": ordered[-1],
+                "net_bytes_mean": sum(net) / len(net),
+                "top_sites": [
+                    {"site": site, "size_bytes": size, "count": count, "queries": queries}
+                    for site, (size, count, queries) in sites[:self.top_sites]
+                ],
+            }
+        return {"queries": self.queries, "stages": stages}
@@ -0,0 +1,163 @@
+"""
+Process-pool offload for CPU-bound pipeline work.
+
+Decoding large MCP payloads, converting and merging thousands of rows and
+serializing large responses are pure-Python CPU work that would otherwise
+hold the event loop and stall every other in-flight query. `CPUOffloader`
+runs such a function in a worker process once its input crosses a size
+threshold and inline below it, where the cost of shipping the arguments to
+a worker would exceed the work itself.
+
+Functions must be importable module-level callables so that workers can
+unpickle them. NumPy arrays can be passed through shared memory with
+`run_arrays` instead of being pickled.
+"""
+
+import asyncio
+import importlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import partial
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class SharedArray:
+    """Picklable handle to a NumPy array placed in shared memory"""
+    name: str
+    shape: Tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def create(cls, array) -> Tuple["SharedArray", shared_memory.SharedMemory]:
+        """Copy an array into a new shared memory block; the caller unlinks the block"""
+        np = importlib.import_module("numpy")
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        return cls(block.name, array.shape, array.dtype.str), block
+
+    @contextmanager
+    def attach(self) -> Iterator[Any]:
+        """Zero-copy view of the shared array, valid inside the block"""
+        np = importlib.import_module("numpy")
+        block = shared_memory.SharedMemory(name=self.name)
+        try:
+            view = np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=block.buf)
+            yield view
+            del view
+        finally:
+            block.close()
+
+def _call_with_shared_arrays(func: Callable, handles: Dict[str, SharedArray], args: tuple) -> Any:
+    """Worker side of run_arrays: attach the arrays, call, detach"""
+    views = {}
+    contexts = []
+    try:
+        for key, handle in handles.items():
+            context = handle.attach()
+            views[key] = context.__enter__()
+            contexts.append(context)
+        return func(views, *args)
+    finally:
+        views.clear()
+        for context in reversed(contexts):
+            context.__exit__(None, None, None)
+
+def _noop() -> None:
+    return None
+
+class CPUOffloader:
+    """Runs large CPU-bound calls in a process pool and small ones inline"""
+
+    def __init__(self, max_workers: int = 2):
+        self.max_workers = max_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.inline_calls = 0
+        self.offloaded_calls = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    async def run(self, func: Callable, *args: Any, size: int = 0, threshold: int = 0) -> Any:
+        """Call func(*args) in a worker when `size` reaches `threshold`, otherwise inline"""
+        if not self.enabled or size < threshold:
+            self.inline_calls += 1
+            return func(*args)
+
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._get_pool(), partial(func, *args))
+            self.offloaded_calls += 1
+            return result
+        except BrokenProcessPool as e:
+            # A crashed worker takes the pool down with it; start afresh next time
+            logger.error(f"Offload worker pool broke, running {func.__name__} inline: {e}")
+            self.failures += 1
+            self._discard_pool()
+            self.inline_calls += 1
+            return func(*args)
+
+    async def run_arrays(self, func: Callable, arrays: Dict[str, Any], *args: Any, threshold: int = 0) -> Any:
+        """Call func(arrays, *args), passing large arrays to the worker through shared memory"""
+        size = sum(array.nbytes for array in arrays.values())
+        if not self.enabled or size < threshold:
+            self.inline_calls += 1
+            return func(arrays, *args)
+
+        blocks = []
+        try:
+            handles = {}
+            for key, array in arrays.items():
+                handles[key], block = SharedArray.create(array)
+                blocks.append(block)
+            return await self.run(_call_with_shared_arrays, func, handles, args, size=size, threshold=threshold)
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+
+    async def warm_up(self):
+        """Start the worker processes ahead of the first large query"""
+        if not self.enabled:
+            return
+        pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+        try:
+            await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.max_workers)))
+        except BrokenProcessPool as e:
+            # Typically a main module without an `if __name__ == "__main__"` guard
+            logger.error(f"Offload workers failed to start, running CPU-bound stages inline: {e}")
+            self._discard_pool()
+            self.max_workers = 0
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        self._discard_pool()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "max_workers": self.max_workers,
+            "inline_calls": self.inline_calls,
+            "offloaded_calls": self.offloaded_calls,
+            "failures": self.failures,
+        }
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned workers do not inherit the event loop or the telemetry and profiler threads
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return self._pool
+
+    def _discard_pool(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Resident ARGO RAG pipeline service.
+
+Keeps one initialized RAGPipeline (MCP session, LLM clients, caches and
+indexes) alive for the lifetime of the process and serves concurrent
+queries over a small local HTTP/1.1 interface, either on a TCP port or on a
+Unix domain socket.
+
+Endpoints:
+    GET  /health  - liveness and basic counters
+    POST /query   - {"query": "...", "budget": 5.0, "priority": "interactive"} -> serialized RAGResponse
+    POST /profile - {"seconds": 30} -> sample every query's stacks for a window
+
+A /query body may add "binning": {"zoom": 5, "viewport": [south, west,
+north, east]} to receive per-tile aggregates for the map in
+merged_data.spatial_bins instead of the individual profiles, or
+"downsampling": {"metric": "surface_temperature", "points": 500,
+"method": "lttb" | "minmax"} to receive a chart series in
+merged_data.time_series.
+
+With admission control enabled, /query answers 429 when a query is
+rejected up front (queue full, or the estimated wait does not fit its
+budget) and 503 when a queued query is shed or waits too long; both carry
+a Retry-After header.
+
+Usage:
+    python pipeline_service.py [--host 127.0.0.1] [--port 8765]
+    python pipeline_service.py --unix-socket /tmp/argo-rag.sock
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import signal
+import time
+from dataclasses import asdict
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple, Union
+
+from admission import AdmissionRejected, Priority
+from memory_profiler import MemoryProfiler
+from rag_config import RAGConfig
+from rag_pipeline import RAGPipeline, RAGResponse
+from spatial_binning import BinningRequest
+from timeseries_downsampling import DownsamplingRequest
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+HEADER_READ_TIMEOUT = 10.0
+MAX_PROFILE_WINDOW = 600.0
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+    504: "Gateway Timeout",
+}
+
+class HTTPError(Exception):
+    """Error that maps directly onto an HTTP error response"""
+
+    def __init__(self, status: int, message: str, headers: Optional[Dict[str, str]] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+def _json_default(value: Any) -> Any:
+    """JSON encoder fallback for enums and other non-native values"""
+    if isinstance(value, Enum):
+        return value.value
+    return str(value)
+
+def serialize_response(response: RAGResponse) -> Dict[str, Any]:
+    """Convert a RAGResponse into a JSON-compatible dictionary"""
+    data = asdict(response)
+    data["intent"] = response.intent.value
+    return data
+
+def encode_response(response: RAGResponse) -> bytes:
+    """Serialize a RAGResponse straight to a JSON body"""
+    return json.dumps(serialize_response(response), default=_json_default).encode("utf-8")
+
+class PipelineService:
+    """Long-lived asyncio service that owns one initialized RAGPipeline"""
+
+    def __init__(self, pipeline: RAGPipeline, config: Optional[RAGConfig] = None):
+        self.pipeline = pipeline
+        self.config = config or pipeline.config
+        self._server: Optional[asyncio.AbstractServer] = None
+        request_slots = self.config.service_max_concurrent_requests
+        if pipeline.admission is not None:
+            # Requests beyond the admission queue must reach it to be rejected, not wait here
+            request_slots = max(request_slots, self.config.admission_max_concurrent + self.config.admission_max_queue + 1)
+        self._request_slots = asyncio.Semaphore(request_slots)
+        self._started_at: Optional[float] = None
+        self._in_flight = 0
+        self._requests_served = 0
+        self._requests_failed = 0
+        self._requests_rejected = 0
+
+    async def start(self):
+        """Initialize the pipeline once and start listening"""
+        await self.pipeline.initialize()
+
+        if self.config.service_socket_path:
+            if os.path.exists(self.config.service_socket_path):
+                os.unlink(self.config.service_socket_path)
+            self._server = await asyncio.start_unix_server(
+                self._handle_connection, path=self.config.service_socket_path
+            )
+            logger.info(f"Pipeline service listening on unix:{self.config.service_socket_path}")
+        else:
+            self._server = await asyncio.start_server(
+                self._handle_connection, host=self.config.service_host, port=self.config.service_port
+            )
+            logger.info(f"Pipeline service listening on http://{self.config.service_host}:{self.config.service_port}")
+
+        self._started_at = time.monotonic()
+
+    async def serve_forever(self):
+        """Serve requests until the server is closed"""
+        if not self._server:
+            raise RuntimeError("Pipeline service not started")
+
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    async def stop(self):
+        """Stop accepting connections and shut the pipeline down"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+        if self.config.service_socket_path and os.path.exists(self.config.service_socket_path):
+            os.unlink(self.config.service_socket_path)
+
+        await self.pipeline.shutdown()
+        logger.info("Pipeline service stopped")
+
+    def health(self) -> Dict[str, Any]:
+        """Report liveness and request counters"""
+        return {
+            "status": "ok",
+            "uptime": time.monotonic() - self._started_at if self._started_at else 0.0,
+            "in_flight": self._in_flight,
+            "requests_served": self._requests_served,
+            "requests_failed": self._requests_failed,
+            "requests_rejected": self._requests_rejected,
+            "admission": self.pipeline.admission.stats() if self.pipeline.admission else None,
+            "llm_scheduler": self.pipeline.llm_scheduler.stats() if self.pipeline.llm_scheduler else None,
+            "offload": self.pipeline.offloader.stats(),
+        }
+
+    async def handle_query(self, payload: Dict[str, Any]) -> Union[Dict[str, Any], bytes]:
+        """Run one query through the shared pipeline, returning the encoded response body"""
+        query = payload.get("query")
+        if not isinstance(query, str) or not query.strip():
+            raise HTTPError(400, "Request body must contain a non-empty 'query' string")
+
+        budget = payload.get("budget")
+        if budget is not None and (not isinstance(budget, (int, float)) or budget <= 0):
+            raise HTTPError(400, "'budget' must be a positive number of seconds")
+
+        try:
+            priority = Priority.parse(payload.get("priority", "interactive"))
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+
+        binning = None
+        if payload.get("binning") is not None:
+            try:
+                binning = BinningRequest.parse(payload["binning"])
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+
+        downsampling = None
+        if payload.get("downsampling") is not None:
+            try:
+                downsampling = DownsamplingRequest.parse(payload["downsampling"], self.config.downsampling_max_points)
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+
+        async with self._request_slots:
+            self._in_flight += 1
+            try:
+                response = await asyncio.wait_for(
+                    self.pipeline.process_query(query, budget=budget, priority=priority, binning=binning,
+                                               downsampling=downsampling),
+                    timeout=self.config.service_request_timeout
+                )
+                self._requests_served += 1
+                if self.config.memory_profiling:
+                    return self._serialize_profiled(response)
+                # asdict and JSON encoding of a large response would hold the loop for hundreds of ms
+                return await self.pipeline.offloader.run(
+                    encode_response, response, size=len(response.results), threshold=self.config.offload_min_rows
+                )
+            except asyncio.TimeoutError:
+                self._requests_failed += 1
+                raise HTTPError(504, "Query exceeded the service request timeout")
+            except AdmissionRejected as e:
+                self._requests_rejected += 1
+                # Rejected before queueing: the client sent too much; after queueing: we could not serve it
+                status = 429 if e.reason in ("queue_full", "wait_exceeds_budget") else 503
+                raise HTTPError(status, str(e), headers={"Retry-After": str(math.ceil(e.retry_after))})
+            except Exception:
+                self._requests_failed += 1
+                raise
+            finally:
+                self._in_flight -= 1
+
+    def _serialize_profiled(self, response: RAGResponse) -> Dict[str, Any]:
+        """Serialize a response, adding the cost of asdict and JSON encoding to its memory figures"""
+        profiler = MemoryProfiler(top_sites=self.config.memory_profiling_top_sites)
+        with profiler.stage("serialization"):
+            data = serialize_response(response)
+            # Encoded again when the response is written; measured here to account for it
+            json.dumps(data, default=_json_default)
+
+        memory = data["metadata"].get("memory")
+        if isinstance(memory, dict):
+            serialization = profiler.summary()
+            memory["stages"].update(serialization["stages"])
+            memory["peak_bytes"] = max(memory["peak_bytes"], serialization["peak_bytes"])
+        return data
+
+    async def _route(self, method: str, path: str, body: bytes) -> Tuple[int, Union[Dict[str, Any], bytes]]:
+        """Dispatch a parsed request to its handler"""
+        path = path.split("?", 1)[0]
+
+        if path == "/health":
+            if method != "GET":
+                raise HTTPError(405, "Use GET for /health")
+            return 200, self.health()
+
+        if path == "/query":
+            if method != "POST":
+                raise HTTPError(405, "Use POST for /query")
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise HTTPError(400, f"Invalid JSON body: {e}")
+            if not isinstance(payload, dict):
+                raise HTTPError(400, "Request body must be a JSON object")
+            return 200, await self.handle_query(payload)
+
+        if path == "/profile":
+            if method != "POST":
+                raise HTTPError(405, "Use POST for /profile")
+            try:
+                payload = json.loads(body or b"{}")
+            except json.JSONDecodeError as e:
+                raise HTTPError(400, f"Invalid JSON body: {e}")
+            seconds = payload.get("seconds", 30) if isinstance(payload, dict) else None
+            if not isinstance(seconds, (int, float)) or not 0 < seconds <= MAX_PROFILE_WINDOW:
+                raise HTTPError(400, f"'seconds' must be a number between 0 and {MAX_PROFILE_WINDOW}")
+            self.pipeline.profiler.enable_for(seconds)
+            return 200, {"profiling": self.pipeline.profiler.stats(), "output_dir": self.pipeline.profiler.output_dir}
+
+        raise HTTPError(404, f"Unknown path: {path}")
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        """Read one HTTP/1.1 request, or None when the client closed the connection"""
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=HEADER_READ_TIMEOUT)
+        except asyncio.IncompleteReadError as e:
+            if e.partial:
+                raise HTTPError(400, "Incomplete request")
+            return None
+        except asyncio.LimitOverrunError:
+            raise HTTPError(413, "Request headers too large")
+
+        if len(head) > MAX_HEADER_BYTES:
+            raise HTTPError(413, "Request headers too large")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, _version = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get("content-length", "0"))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+
+        body = await reader.readexactly(length) if length else b""
+        return method.upper(), path, headers, body
+
+    async def _write_response(self, writer: asyncio.StreamWriter, status: int,
+                              payload: Union[Dict[str, Any], bytes], keep_alive: bool,
+                              headers: Optional[Dict[str, str]] = None):
+        """Write a JSON HTTP response; bytes payloads are already encoded"""
+        if isinstance(payload, bytes):
+            body = payload
+        else:
+            body = json.dumps(payload, default=_json_default).encode("utf-8")
+        head = (
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'Unknown')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            + "".join(f"{name}: {value}\r\n" for name, value in (headers or {}).items())
+            + "\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one client connection, honouring keep-alive"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "keep-alive").lower() != "close"
+                    status, payload = await self._route(method, path, body)
+                    extra_headers = None
+                except HTTPError as e:
+                    status, payload, keep_alive = e.status, {"error": e.message}, False
+                    extra_headers = e.headers
+                except asyncio.TimeoutError:
+                    break
+                except Exception as e:
+                    logger.error(f"Request handling failed: {e}")
+                    status, payload, keep_alive = 500, {"error": str(e)}, False
+                    extra_headers = None
+
+                await self._write_response(writer, status, payload, keep_alive, extra_headers)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, BrokenPipeError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
+
+async def main():
+    """Run the pipeline service until interrupted"""
+    parser = argparse.ArgumentParser(description="Resident ARGO RAG pipeline service")
+    parser.add_argument("--host", help="TCP host to bind (default from SERVICE_HOST)")
+    parser.add_argument("--port", type=int, help="TCP port to bind (default from SERVICE_PORT)")
+    parser.add_argument("--unix-socket", help="serve on a Unix domain socket instead of TCP")
+    args = parser.parse_args()
+
+    config = RAGConfig.from_env()
+    if args.host:
+        config.service_host = args.host
+    if args.port:
+        config.service_port = args.port
+    if args.unix_socket:
+        config.service_socket_path = args.unix_socket
+
+    logging.basicConfig(level=config.log_level, format=config.log_format)
+
+    service = PipelineService(RAGPipeline.from_config(config), config)
+    await service.start()
+
+    loop = asyncio.get_running_loop()
+    serve_task = asyncio.create_task(service.serve_forever())
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, serve_task.cancel)
+
+    try:
+        await serve_task
+    finally:
+        await service.stop()
+
+if __name__ == "__main__":
+    asyncio.run(main())
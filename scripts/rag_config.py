@@ -18,16 +18,98 @@ class RAGConfig:
     # MCP Server Configuration
     mcp_server_path: str = "node server/mcp/index.js"
     mcp_timeout: int = 30
+    mcp_pool_min_size: int = 1
+    mcp_pool_max_size: int = min(4, os.cpu_count() or 1)
+    mcp_health_check_interval: float = 10.0
+    mcp_pool_scale_up_threshold: float = 2.0
     
     # Query Processing Configuration
     default_sql_limit: int = 100
     default_semantic_limit: int = 10
     intent_confidence_threshold: float = 0.7
+    sql_max_page_size: int = 500
+    sql_unbounded_scan_limit: int = 50
+    
+    # Hybrid queries rank-fuse both branches (RRF), reading pages of hybrid_page_size
+    # until the top-k is settled or a branch reaches hybrid_max_depth results
+    hybrid_top_k: int = 20
+    hybrid_page_size: int = 25
+    hybrid_max_depth: int = 50
+    hybrid_rrf_k: int = 60
+    hybrid_sql_weight: float = 1.0
+    hybrid_semantic_weight: float = 1.0
+    
+    # Map requests get per-tile aggregates instead of profiles; the zoom is lowered
+    # until the viewport spans at most this many tiles
+    spatial_binning_max_cells: int = 1024
+    
+    # Chart requests get a downsampled time series of at most this many points
+    downsampling_max_points: int = 2000
+    
+    # Latency Budget Configuration (seconds; a budget of 0 disables deadlines)
+    query_latency_budget: float = 20.0
+    llm_classify_min_budget: float = 4.0
+    sql_generation_min_budget: float = 4.0
+    retrieval_min_budget: float = 0.5
+    response_generation_min_budget: float = 4.0
+    degraded_page_budget: float = 6.0
+    degraded_page_size: int = 20
+    stage_reserve: float = 0.25
+    
+    # Speculatively start retrieval and SQL generation while an ambiguous
+    # query waits on the LLM classifier
+    speculative_retrieval: bool = False
+    
+    # Aggregate Cube Configuration (refresh interval in seconds)
+    aggregate_cube: bool = False
+    aggregate_cube_refresh_interval: float = 300.0
+    
+    # Record per-stage peak allocation and top allocation sites with tracemalloc
+    memory_profiling: bool = False
+    memory_profiling_top_sites: int = 5
+    
+    # Sample event loop stacks for this fraction of queries (seconds between samples)
+    profiling_sample_rate: float = 0.0
+    profiling_interval: float = 0.005
+    profiling_output_dir: str = "profiles"
+    
+    # Structured telemetry (JSON lines; no path hands records to the logger).
+    # Sample rates are "event=rate,..." and default to keeping every event.
+    telemetry_path: Optional[str] = None
+    telemetry_batch_size: int = 256
+    telemetry_flush_interval: float = 1.0
+    telemetry_queue_size: int = 10000
+    telemetry_sample_rates: str = ""
+    
+    # CPU-bound stages run in worker processes above these sizes (0 workers runs everything inline)
+    offload_workers: int = min(2, os.cpu_count() or 1)
+    offload_min_payload_bytes: int = 64 * 1024
+    offload_min_rows: int = 100
+    
+    # Provider rate limits shared by every LLM call (0 leaves that limit unenforced)
+    llm_requests_per_minute: int = 0
+    llm_tokens_per_minute: int = 0
+    llm_rate_limit_retries: int = 3
+    
+    # Admission control in front of the pipeline (0 concurrent queries disables it).
+    # Batch queries may use batch_share of the slots; queue times are the longest waits allowed.
+    admission_max_concurrent: int = 0
+    admission_max_queue: int = 64
+    admission_interactive_queue_time: float = 2.0
+    admission_batch_queue_time: float = 30.0
+    admission_batch_share: float = 0.75
     
     # Response Generation Configuration
     max_response_tokens: int = 1000
     response_temperature: float = 0.3
     
+    # Pipeline Service Configuration
+    service_host: str = "127.0.0.1"
+    service_port: int = 8765
+    service_socket_path: Optional[str] = None
+    service_max_concurrent_requests: int = 64
+    service_request_timeout: float = 120.0
+    
     # Logging Configuration
     log_level: str = "INFO"
     log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -41,11 +123,62 @@ class RAGConfig:
             embedding_model=os.getenv("EMBEDDING_MODEL", "text-embedding-3-small"),
             mcp_server_path=os.getenv("MCP_SERVER_PATH", "node server/mcp/index.js"),
             mcp_timeout=int(os.getenv("MCP_TIMEOUT", "30")),
+            mcp_pool_min_size=int(os.getenv("MCP_POOL_MIN_SIZE", "1")),
+            mcp_pool_max_size=int(os.getenv("MCP_POOL_MAX_SIZE", str(min(4, os.cpu_count() or 1)))),
+            mcp_health_check_interval=float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "10")),
+            mcp_pool_scale_up_threshold=float(os.getenv("MCP_POOL_SCALE_UP_THRESHOLD", "2")),
             default_sql_limit=int(os.getenv("DEFAULT_SQL_LIMIT", "100")),
             default_semantic_limit=int(os.getenv("DEFAULT_SEMANTIC_LIMIT", "10")),
             intent_confidence_threshold=float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.7")),
+            sql_max_page_size=int(os.getenv("SQL_MAX_PAGE_SIZE", "500")),
+            sql_unbounded_scan_limit=int(os.getenv("SQL_UNBOUNDED_SCAN_LIMIT", "50")),
+            hybrid_top_k=int(os.getenv("HYBRID_TOP_K", "20")),
+            hybrid_page_size=int(os.getenv("HYBRID_PAGE_SIZE", "25")),
+            hybrid_max_depth=int(os.getenv("HYBRID_MAX_DEPTH", "50")),
+            hybrid_rrf_k=int(os.getenv("HYBRID_RRF_K", "60")),
+            hybrid_sql_weight=float(os.getenv("HYBRID_SQL_WEIGHT", "1")),
+            hybrid_semantic_weight=float(os.getenv("HYBRID_SEMANTIC_WEIGHT", "1")),
+            spatial_binning_max_cells=int(os.getenv("SPATIAL_BINNING_MAX_CELLS", "1024")),
+            downsampling_max_points=int(os.getenv("DOWNSAMPLING_MAX_POINTS", "2000")),
+            query_latency_budget=float(os.getenv("QUERY_LATENCY_BUDGET", "20")),
+            llm_classify_min_budget=float(os.getenv("LLM_CLASSIFY_MIN_BUDGET", "4")),
+            sql_generation_min_budget=float(os.getenv("SQL_GENERATION_MIN_BUDGET", "4")),
+            retrieval_min_budget=float(os.getenv("RETRIEVAL_MIN_BUDGET", "0.5")),
+            response_generation_min_budget=float(os.getenv("RESPONSE_GENERATION_MIN_BUDGET", "4")),
+            degraded_page_budget=float(os.getenv("DEGRADED_PAGE_BUDGET", "6")),
+            degraded_page_size=int(os.getenv("DEGRADED_PAGE_SIZE", "20")),
+            stage_reserve=float(os.getenv("STAGE_RESERVE", "0.25")),
+            speculative_retrieval=os.getenv("SPECULATIVE_RETRIEVAL", "false").lower() in ("1", "true", "yes"),
+            aggregate_cube=os.getenv("AGGREGATE_CUBE", "false").lower() in ("1", "true", "yes"),
+            aggregate_cube_refresh_interval=float(os.getenv("AGGREGATE_CUBE_REFRESH_INTERVAL", "300")),
+            memory_profiling=os.getenv("MEMORY_PROFILING", "false").lower() in ("1", "true", "yes"),
+            memory_profiling_top_sites=int(os.getenv("MEMORY_PROFILING_TOP_SITES", "5")),
+            profiling_sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+            profiling_interval=float(os.getenv("PROFILING_INTERVAL", "0.005")),
+            profiling_output_dir=os.getenv("PROFILING_OUTPUT_DIR", "profiles"),
+            telemetry_path=os.getenv("TELEMETRY_PATH") or None,
+            telemetry_batch_size=int(os.getenv("TELEMETRY_BATCH_SIZE", "256")),
+            telemetry_flush_interval=float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1")),
+            telemetry_queue_size=int(os.getenv("TELEMETRY_QUEUE_SIZE", "10000")),
+            telemetry_sample_rates=os.getenv("TELEMETRY_SAMPLE_RATES", ""),
+            offload_workers=int(os.getenv("OFFLOAD_WORKERS", str(min(2, os.cpu_count() or 1)))),
+            offload_min_payload_bytes=int(os.getenv("OFFLOAD_MIN_PAYLOAD_BYTES", str(64 * 1024))),
+            offload_min_rows=int(os.getenv("OFFLOAD_MIN_ROWS", "100")),
+            llm_requests_per_minute=int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0")),
+            llm_tokens_per_minute=int(os.getenv("LLM_TOKENS_PER_MINUTE", "0")),
+            llm_rate_limit_retries=int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3")),
+            admission_max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", "0")),
+            admission_max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "64")),
+            admission_interactive_queue_time=float(os.getenv("ADMISSION_INTERACTIVE_QUEUE_TIME", "2")),
+            admission_batch_queue_time=float(os.getenv("ADMISSION_BATCH_QUEUE_TIME", "30")),
+            admission_batch_share=float(os.getenv("ADMISSION_BATCH_SHARE", "0.75")),
             max_response_tokens=int(os.getenv("MAX_RESPONSE_TOKENS", "1000")),
             response_temperature=float(os.getenv("RESPONSE_TEMPERATURE", "0.3")),
+            service_host=os.getenv("SERVICE_HOST", "127.0.0.1"),
+            service_port=int(os.getenv("SERVICE_PORT", "8765")),
+            service_socket_path=os.getenv("SERVICE_SOCKET_PATH") or None,
+            service_max_concurrent_requests=int(os.getenv("SERVICE_MAX_CONCURRENT_REQUESTS", "64")),
+            service_request_timeout=float(os.getenv("SERVICE_REQUEST_TIMEOUT", "120")),
             log_level=os.getenv("LOG_LEVEL", "INFO"),
         )
     
@@ -13,28 +13,65 @@ A comprehensive backend RAG system that:
 
 import json
 import asyncio
+import importlib
 import logging
+import math
+import time
 from datetime import datetime
-from typing import Dict, List, Any, Optional, Union
-from dataclasses import dataclass, asdict
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Tuple, Union
+from dataclasses import dataclass, asdict, field
 from enum import Enum
 import re
+from contextlib import AsyncExitStack, contextmanager
 
-# MCP and AI SDK imports
-try:
-    from mcp import ClientSession, StdioServerParameters
-    from mcp.client.stdio import stdio_client
-    from openai import OpenAI
-    import numpy as np
-except ImportError as e:
-    print(f"Missing required dependencies: {e}")
-    print("Install with: pip install mcp openai numpy")
-    exit(1)
+from admission import AdmissionController, AdmissionRejected, Priority
+from aggregate_cube import AggregateCube, CubeAnswer
+from mcp_pool import MCPSessionPool
+from llm_scheduler import LLMScheduler, ScheduledLLMClient, llm_call_scope
+from memory_profiler import MemoryProfiler
+from offload import CPUOffloader
+from rag_config import RAGConfig
+from rank_fusion import FusionResult, RankedStream, reciprocal_rank_fusion
+from sampling_profiler import SamplingProfiler
+from spatial_binning import BinningRequest, bin_profiles, profile_arrays
+from sql_compiler import RuleBasedSQLCompiler
+from sql_guard import GuardedSQL, SQLGuard, SQLGuardrailError
+from telemetry import Telemetry, correlation, correlation_id, parse_sample_rates
+from timeseries_downsampling import DownsamplingRequest, downsample_series, series_arrays
+
+# MCP and AI SDK imports are deferred until first use so that tools which only
+# need the enums, dataclasses or configuration do not pay for them at import time
+if TYPE_CHECKING:
+    from mcp import ClientSession
+    from openai import AsyncOpenAI
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def _import_dependency(module_name: str):
+    """Import a heavy dependency on first use with an actionable error"""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(
+            f"Missing required dependency: {e}. Install with: pip install mcp openai numpy"
+        ) from e
+
+def _first_present(row: Dict[str, Any], *names: str, default: Any = None) -> Any:
+    """Value of the first column present in a row, accepting legacy column names"""
+    for name in names:
+        if row.get(name) is not None:
+            return row[name]
+    return default
+
+def _parse_profile_file(file_name: Optional[str]) -> tuple[str, int]:
+    """Extract the float WMO number and cycle from an ARGO profile file name (e.g. D1901393_045.nc)"""
+    match = re.search(r'(\d{5,7})_(\d{1,4})D?\.nc$', file_name or '')
+    if not match:
+        return '', 0
+    return match.group(1), int(match.group(2))
+
 class QueryIntent(Enum):
     """Query intent classification"""
     SQL_QUERY = "sql"
@@ -50,7 +87,37 @@ class QueryContext:
     confidence: float
     extracted_entities: Dict[str, Any]
     sql_query: Optional[str] = None
+    sql_source: Optional[str] = None
     semantic_query: Optional[str] = None
+    degraded_stages: List[str] = field(default_factory=list)
+    fusion: Optional[Dict[str, Any]] = None
+
+class Deadline:
+    """Per-query latency budget shared by every pipeline stage"""
+    
+    def __init__(self, budget: Optional[float] = None):
+        self.budget = budget
+        self.started = time.monotonic()
+    
+    def elapsed(self) -> float:
+        """Seconds spent since the query started"""
+        return time.monotonic() - self.started
+    
+    def remaining(self) -> float:
+        """Seconds left in the budget (infinite when unbounded)"""
+        if self.budget is None:
+            return math.inf
+        return max(0.0, self.budget - self.elapsed())
+    
+    def allows(self, seconds: float) -> bool:
+        """Whether at least `seconds` of budget are left"""
+        return self.remaining() >= seconds
+    
+    def timeout(self, reserve: float = 0.0) -> Optional[float]:
+        """Timeout for the next awaited call, keeping `reserve` seconds back"""
+        if self.budget is None:
+            return None
+        return max(0.0, self.remaining() - reserve)
 
 @dataclass
 class ARGOResult:
@@ -75,10 +142,141 @@ class RAGResponse:
     natural_language_response: str
     metadata: Dict[str, Any]
 
+# Conversion and merging are module-level so that offload worker processes can unpickle them
+def profile_fields(profile: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """Map an argo_profiles row onto ARGOResult fields"""
+    float_id, cycle_number = _parse_profile_file(profile.get('file'))
+    return dict(
+        id=str(profile.get('id', '')),
+        float_id=_first_present(profile, 'platform_number') or float_id,
+        cycle_number=_first_present(profile, 'cycle_number') or cycle_number,
+        location={
+            'latitude': _first_present(profile, 'lat', 'latitude', default=0.0),
+            'longitude': _first_present(profile, 'lon', 'longitude', default=0.0)
+        },
+        timestamp=profile.get('date', ''),
+        variables={
+            'temperature': {
+                'surface': _first_present(profile, 'surfacetemp', 'surface_temp'),
+                'thermocline_depth': _first_present(profile, 'thermoclinedepth', 'thermocline_depth')
+            },
+            'salinity': {
+                'surface': _first_present(profile, 'surfacesal', 'surface_sal'),
+                'min_depth': _first_present(profile, 'salinitymindepth', 'salinity_min_depth'),
+                'max_depth': _first_present(profile, 'salinitymaxdepth', 'salinity_max_depth')
+            },
+            'mixed_layer_depth': profile.get('mld'),
+            'heat_content_0_200m': profile.get('ohc_0_200m'),
+            'stratification': _first_present(profile, 'meanstratification', 'mean_stratification')
+        },
+        metadata={
+            'file': profile.get('file', ''),
+            'quality_flag': profile.get('quality_flag', ''),
+            'data_mode': profile.get('data_mode', ''),
+            'source': source
+        }
+    )
+
+def convert_sql_results(raw_results: Union[str, Dict[str, Any]]) -> List[ARGOResult]:
+    """Convert SQL results to structured format"""
+    results = []
+    
+    try:
+        data = json.loads(raw_results) if isinstance(raw_results, str) else raw_results
+        profiles = data.get('data', {}).get('data', [])
+        
+        for profile in profiles:
+            result = ARGOResult(**profile_fields(profile, 'sql_query'))
+            results.append(result)
+            
+    except Exception as e:
+        logger.error(f"Failed to convert SQL results: {e}")
+    
+    return results
+
+def convert_semantic_results(raw_results: Union[str, Dict[str, Any]]) -> List[ARGOResult]:
+    """Convert semantic search results to structured format"""
+    results = []
+    
+    try:
+        data = json.loads(raw_results) if isinstance(raw_results, str) else raw_results
+        search_results = data.get('data', {}).get('profiles', [])
+        similarities = data.get('data', {}).get('similarities', [])
+        
+        for i, profile in enumerate(search_results):
+            similarity = similarities[i] if i < len(similarities) else 0.0
+            
+            result = ARGOResult(
+                **profile_fields(profile, 'semantic_search'),
+                similarity_score=similarity,
+                rag_context=f"Semantic similarity: {similarity:.3f}"
+            )
+            results.append(result)
+            
+    except Exception as e:
+        logger.error(f"Failed to convert semantic results: {e}")
+    
+    return results
+
+def combine_hybrid_results(sql_result: ARGOResult, semantic_result: ARGOResult) -> ARGOResult:
+    """Fold a semantic match into the SQL row for the same profile, keeping its similarity"""
+    sql_result.similarity_score = semantic_result.similarity_score
+    sql_result.rag_context = semantic_result.rag_context
+    return sql_result
+
+def merge_results(results: List[ARGOResult], context: QueryContext) -> Dict[str, Any]:
+    """Merge results into structured JSON output"""
+    
+    # Calculate summary statistics
+    if results:
+        latitudes = [r.location['latitude'] for r in results]
+        longitudes = [r.location['longitude'] for r in results]
+        
+        temps = [r.variables.get('temperature', {}).get('surface') 
+                for r in results if r.variables.get('temperature', {}).get('surface') is not None]
+        
+        salts = [r.variables.get('salinity', {}).get('surface') 
+                for r in results if r.variables.get('salinity', {}).get('surface') is not None]
+    else:
+        latitudes = longitudes = temps = salts = []
+    
+    merged = {
+        "query_context": {
+            "original_query": context.original_query,
+            "intent": context.intent.value,
+            "confidence": context.confidence,
+            "sql_query": context.sql_query,
+            "sql_source": context.sql_source,
+            "semantic_query": context.semantic_query
+        },
+        "results_summary": {
+            "total_profiles": len(results),
+            "geographic_bounds": {
+                "lat_range": [min(latitudes), max(latitudes)] if latitudes else [0, 0],
+                "lon_range": [min(longitudes), max(longitudes)] if longitudes else [0, 0]
+            },
+            "variable_ranges": {
+                "temperature": {
+                    "min": min(temps) if temps else None,
+                    "max": max(temps) if temps else None,
+                    "mean": sum(temps) / len(temps) if temps else None
+                },
+                "salinity": {
+                    "min": min(salts) if salts else None,
+                    "max": max(salts) if salts else None,
+                    "mean": sum(salts) / len(salts) if salts else None
+                }
+            }
+        },
+        "profiles": [asdict(result) for result in results]
+    }
+    
+    return merged
+
 class IntentClassifier:
     """Classifies user queries into SQL or semantic search intents"""
     
-    def __init__(self, openai_client: OpenAI):
+    def __init__(self, openai_client: "AsyncOpenAI"):
         self.openai = openai_client
         
         # SQL intent patterns
@@ -100,32 +298,70 @@ class IntentClassifier:
             r'\b(seasonal|winter|summer|spring|fall|autumn)',
         ]
 
-    async def classify_intent(self, query: str) -> QueryContext:
-        """Classify query intent using pattern matching and LLM"""
-        
-        # Pattern-based classification
+    def pattern_scores(self, query: str) -> tuple[int, int]:
+        """Count SQL and semantic pattern matches in a query"""
         sql_score = sum(1 for pattern in self.sql_patterns 
                        if re.search(pattern, query.lower()))
         semantic_score = sum(1 for pattern in self.semantic_patterns 
                            if re.search(pattern, query.lower()))
+        return sql_score, semantic_score
+
+    @staticmethod
+    def is_ambiguous(sql_score: int, semantic_score: int) -> bool:
+        """Whether pattern scores are too close to decide without the LLM"""
+        return abs(sql_score - semantic_score) <= 1
+
+    @staticmethod
+    def pattern_intent(sql_score: int, semantic_score: int) -> tuple[QueryIntent, float]:
+        """Decide intent from pattern scores alone"""
+        if not IntentClassifier.is_ambiguous(sql_score, semantic_score):
+            if sql_score > semantic_score:
+                return QueryIntent.SQL_QUERY, 0.8
+            return QueryIntent.SEMANTIC_SEARCH, 0.8
+        
+        # Best guess for ambiguous queries when the LLM cannot be consulted
+        if sql_score > semantic_score:
+            return QueryIntent.SQL_QUERY, 0.5
+        if semantic_score > sql_score:
+            return QueryIntent.SEMANTIC_SEARCH, 0.5
+        if sql_score > 0:
+            return QueryIntent.HYBRID, 0.5
+        return QueryIntent.SEMANTIC_SEARCH, 0.5
+
+    async def classify_intent(self, query: str, deadline: Optional[Deadline] = None,
+                              min_llm_budget: float = 0.0, reserve: float = 0.0) -> QueryContext:
+        """Classify query intent using pattern matching and LLM, leaving `reserve` seconds for later stages"""
+        
+        # Pattern-based classification
+        sql_score, semantic_score = self.pattern_scores(query)
         
         # Extract entities
         entities = await self._extract_entities(query)
+        degraded_stages = []
         
-        # LLM-based classification for ambiguous cases
-        if abs(sql_score - semantic_score) <= 1:
-            intent, confidence = await self._llm_classify(query)
-        else:
-            if sql_score > semantic_score:
-                intent, confidence = QueryIntent.SQL_QUERY, 0.8
+        # LLM-based classification for ambiguous cases, budget permitting
+        if self.is_ambiguous(sql_score, semantic_score):
+            if deadline is None or deadline.allows(min_llm_budget + reserve):
+                try:
+                    intent, confidence = await asyncio.wait_for(
+                        self._llm_classify(query), timeout=deadline.timeout(reserve) if deadline else None
+                    )
+                except asyncio.TimeoutError:
+                    logger.warning("LLM classification timed out, using pattern scores")
+                    intent, confidence = self.pattern_intent(sql_score, semantic_score)
+                    degraded_stages.append("classification_timeout")
             else:
-                intent, confidence = QueryIntent.SEMANTIC_SEARCH, 0.8
+                intent, confidence = self.pattern_intent(sql_score, semantic_score)
+                degraded_stages.append("classification_skipped_llm")
+        else:
+            intent, confidence = self.pattern_intent(sql_score, semantic_score)
         
         return QueryContext(
             original_query=query,
             intent=intent,
             confidence=confidence,
-            extracted_entities=entities
+            extracted_entities=entities,
+            degraded_stages=degraded_stages
         )
 
     async def _extract_entities(self, query: str) -> Dict[str, Any]:
@@ -194,28 +430,60 @@ class IntentClassifier:
 class SQLQueryGenerator:
     """Generates SQL queries from natural language"""
     
-    def __init__(self, openai_client: OpenAI):
+    def __init__(self, openai_client: "AsyncOpenAI", compiler: Optional[RuleBasedSQLCompiler] = None):
         self.openai = openai_client
+        self.compiler = compiler or RuleBasedSQLCompiler()
 
-    async def generate_sql(self, query: str, context: QueryContext) -> str:
-        """Generate SQL query from natural language"""
+    FALLBACK_SQL = "SELECT * FROM argo_profiles ORDER BY date DESC LIMIT 10"
+
+    async def generate_sql(self, query: str, context: QueryContext, deadline: Optional[Deadline] = None,
+                           min_llm_budget: float = 0.0, reserve: float = 0.0) -> str:
+        """Generate SQL query from natural language, leaving `reserve` seconds for later stages"""
+        
+        # Common query shapes compile deterministically without an LLM round trip
+        compiled = self.compiler.compile(query)
+        if compiled is not None:
+            context.sql_source = "compiler"
+            context.extracted_entities["query_shape"] = asdict(compiled.shape)
+            return compiled.render()
+        
+        if deadline is not None and not deadline.allows(min_llm_budget + reserve):
+            context.degraded_stages.append("sql_generation_skipped_llm")
+            context.sql_source = "fallback"
+            return self.FALLBACK_SQL
+        
+        try:
+            sql_query = await asyncio.wait_for(
+                self._llm_generate_sql(query, context), timeout=deadline.timeout(reserve) if deadline else None
+            )
+            context.sql_source = "llm"
+            return sql_query
+        except asyncio.TimeoutError:
+            logger.warning("SQL generation timed out, using fallback query")
+            context.degraded_stages.append("sql_generation_timeout")
+            context.sql_source = "fallback"
+            return self.FALLBACK_SQL
+
+    async def _llm_generate_sql(self, query: str, context: QueryContext) -> str:
+        """Ask the LLM for a SQL query"""
         
         schema_info = """
-        ARGO Profiles Table Schema:
-        - id: string (primary key)
-        - platform_number: string (float identifier)
-        - cycle_number: integer
-        - latitude: float (-90 to 90)
-        - longitude: float (-180 to 180)
+        argo_profiles Table Schema:
+        - id: integer (primary key)
+        - file: string (source NetCDF file, encodes float and cycle)
         - date: timestamp
-        - thermocline_depth: float (meters)
-        - salinity_min_depth: float (meters)
-        - salinity_max_depth: float (meters)
-        - mean_stratification: float
-        - surface_temp: float (Celsius)
-        - surface_sal: float (PSU)
-        - quality_flag: string
-        - data_mode: string
+        - lat: float (-90 to 90)
+        - lon: float (-180 to 180)
+        - mld: float (mixed layer depth, meters)
+        - thermoclinedepth: float (meters)
+        - salinitymindepth: float (meters)
+        - salinitymaxdepth: float (meters)
+        - meanstratification: float
+        - ohc_0_200m: float (ocean heat content 0-200m)
+        - surfacetemp: float (Celsius)
+        - surfacesal: float (PSU)
+        - n_levels: integer
+        - direction: string
         """
         
         try:
@@ -250,35 +518,73 @@ class SQLQueryGenerator:
         except Exception as e:
             logger.error(f"SQL generation failed: {e}")
             # Fallback to basic query
-            return "SELECT * FROM argo_profiles ORDER BY date DESC LIMIT 10"
+            return self.FALLBACK_SQL
 
 class MCPClient:
     """MCP Client for communicating with ARGO MCP Server"""
     
-    def __init__(self, server_path: str = "node server/mcp/index.js"):
+    def __init__(self, server_path: str = "node server/mcp/index.js", timeout: Optional[float] = None):
         self.server_path = server_path
-        self.session: Optional[ClientSession] = None
+        self.timeout = timeout
+        self.session: Optional["ClientSession"] = None
+        self._exit_stack: Optional[AsyncExitStack] = None
+
+    @property
+    def is_connected(self) -> bool:
+        """Whether a live MCP session is held"""
+        return self.session is not None
 
     async def connect(self):
         """Connect to MCP server"""
+        mcp = _import_dependency("mcp")
+        mcp_stdio = _import_dependency("mcp.client.stdio")
+        
+        command, *args = self.server_path.split()
+        exit_stack = AsyncExitStack()
+        
         try:
-            server_params = StdioServerParameters(
-                command=self.server_path.split(),
+            server_params = mcp.StdioServerParameters(
+                command=command,
+                args=args,
                 env=None
             )
             
-            self.session = await stdio_client(server_params)
+            read_stream, write_stream = await exit_stack.enter_async_context(
+                mcp_stdio.stdio_client(server_params)
+            )
+            session = await exit_stack.enter_async_context(mcp.ClientSession(read_stream, write_stream))
+            await session.initialize()
+            
+            self.session = session
+            self._exit_stack = exit_stack
             logger.info("Connected to MCP server")
             
         except Exception as e:
+            await exit_stack.aclose()
             logger.error(f"Failed to connect to MCP server: {e}")
             raise
 
     async def disconnect(self):
         """Disconnect from MCP server"""
-        if self.session:
-            await self.session.close()
-            self.session = None
+        exit_stack, self._exit_stack = self._exit_stack, None
+        self.session = None
+        if exit_stack:
+            try:
+                await exit_stack.aclose()
+            except Exception as e:
+                logger.warning(f"Error while closing MCP session: {e}")
+
+    async def ping(self) -> bool:
+        """Check that the MCP server subprocess still answers"""
+        if not self.session:
+            return False
+        
+        try:
+            await asyncio.wait_for(self.session.send_ping(), timeout=self.timeout or 5)
+            return True
+        except Exception as e:
+            logger.warning(f"MCP health check failed: {e}")
+            return False
 
     async def query_argo_sql(self, sql: str, page: int = 1, page_size: int = 100) -> Dict[str, Any]:
         """Execute SQL query via MCP"""
@@ -292,7 +598,8 @@ class MCPClient:
                     "sql": sql,
                     "page": page,
                     "pageSize": page_size
-                }
+                },
+                read_timeout_seconds=self.timeout
             )
             
             return result.content[0].text if result.content else {}
@@ -301,18 +608,19 @@ class MCPClient:
             logger.error(f"SQL query via MCP failed: {e}")
             raise
 
-    async def retrieve_argo_semantic(self, query: str, limit: int = 10) -> Dict[str, Any]:
-        """Perform semantic search via MCP"""
+    async def retrieve_argo_semantic(self, query: str, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        """Perform semantic search via MCP, skipping the `offset` best matches"""
         if not self.session:
             raise RuntimeError("MCP client not connected")
         
+        arguments: Dict[str, Any] = {"query": query, "limit": limit}
+        if offset:
+            arguments["offset"] = offset
         try:
             result = await self.session.call_tool(
                 "retrieveARGO",
-                {
-                    "query": query,
-                    "limit": limit
-                }
+                arguments,
+                read_timeout_seconds=self.timeout
             )
             
             return result.content[0].text if result.content else {}
@@ -321,267 +629,670 @@ class MCPClient:
             logger.error(f"Semantic search via MCP failed: {e}")
             raise
 
+class _SpeculativeBranch:
+    """A speculatively started pipeline task and how long it ran"""
+    
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self.completed = False
+        task.add_done_callback(self._on_done)
+    
+    @classmethod
+    def start(cls, coro) -> "_SpeculativeBranch":
+        """Schedule a coroutine as a speculative branch"""
+        return cls(asyncio.create_task(coro))
+    
+    def _on_done(self, task: asyncio.Task):
+        self.finished = time.monotonic()
+        self.completed = not task.cancelled()
+        if self.completed:
+            # Retrieve the exception so discarded failures are not reported as unhandled
+            task.exception()
+    
+    def cancel(self):
+        """Cancel the branch if it is still running"""
+        if not self.task.done():
+            self.task.cancel()
+    
+    def elapsed(self) -> float:
+        """Seconds of work the branch performed"""
+        return (self.finished or time.monotonic()) - self.started
+
 class RAGPipeline:
     """Main RAG Pipeline orchestrator"""
     
-    def __init__(self, openai_api_key: str, mcp_server_path: str = "node server/mcp/index.js"):
-        self.openai = OpenAI(api_key=openai_api_key)
+    def __init__(self, openai_api_key: str, mcp_server_path: str = "node server/mcp/index.js",
+                 config: Optional[RAGConfig] = None):
+        self.config = config or RAGConfig(openai_api_key=openai_api_key, mcp_server_path=mcp_server_path)
+        
+        # The async client keeps LLM round trips off the event loop so that a
+        # resident pipeline can serve concurrent queries
+        openai = _import_dependency("openai")
+        self.llm_scheduler = (
+            LLMScheduler(
+                requests_per_minute=self.config.llm_requests_per_minute,
+                tokens_per_minute=self.config.llm_tokens_per_minute,
+                max_retries=self.config.llm_rate_limit_retries,
+            )
+            if self.config.llm_requests_per_minute or self.config.llm_tokens_per_minute else None
+        )
+        if self.llm_scheduler is None:
+            self.openai = openai.AsyncOpenAI(api_key=openai_api_key)
+        else:
+            # The scheduler retries 429s itself; the SDK's own retries would bypass its budgets
+            self.openai = ScheduledLLMClient(
+                openai.AsyncOpenAI(api_key=openai_api_key, max_retries=0), self.llm_scheduler
+            )
         self.intent_classifier = IntentClassifier(self.openai)
         self.sql_generator = SQLQueryGenerator(self.openai)
-        self.mcp_client = MCPClient(mcp_server_path)
+        self.sql_guard = SQLGuard(
+            max_page_size=self.config.sql_max_page_size,
+            unbounded_scan_limit=self.config.sql_unbounded_scan_limit,
+        )
+        
+        # Tool calls are spread over a pool of MCP stdio server subprocesses
+        self.speculation_stats = {"queries": 0, "speculated": 0, "branches_discarded": 0, "wasted_seconds": 0.0}
+        self.mcp_client = MCPSessionPool(
+            client_factory=lambda: MCPClient(self.config.mcp_server_path, timeout=self.config.mcp_timeout),
+            min_size=self.config.mcp_pool_min_size,
+            max_size=max(self.config.mcp_pool_min_size, self.config.mcp_pool_max_size),
+            health_check_interval=self.config.mcp_health_check_interval,
+            scale_up_threshold=self.config.mcp_pool_scale_up_threshold,
+        )
+        
+        # Statistical questions are answered from precomputed aggregates when enabled
+        self.aggregate_cube = AggregateCube() if self.config.aggregate_cube else None
+        self._cube_refresh_task: Optional[asyncio.Task] = None
+        
+        # Opt-in tracemalloc accounting of every stage's allocations
+        if self.config.memory_profiling:
+            MemoryProfiler.acquire()
+        
+        # Per-query events go through a background writer instead of the logger
+        self.telemetry = Telemetry(
+            path=self.config.telemetry_path,
+            batch_size=self.config.telemetry_batch_size,
+            flush_interval=self.config.telemetry_flush_interval,
+            max_queue=self.config.telemetry_queue_size,
+            sample_rates=parse_sample_rates(self.config.telemetry_sample_rates),
+        )
+        
+        # Stack sampling for a fraction of queries, or for a window opened on demand
+        self.profiler = SamplingProfiler(
+            interval=self.config.profiling_interval,
+            sample_rate=self.config.profiling_sample_rate,
+            output_dir=self.config.profiling_output_dir,
+        )
+        
+        # Bounded, prioritized queueing in front of process_query
+        self.admission = (
+            AdmissionController(
+                max_concurrent=self.config.admission_max_concurrent,
+                max_queue=self.config.admission_max_queue,
+                interactive_queue_time=self.config.admission_interactive_queue_time,
+                batch_queue_time=self.config.admission_batch_queue_time,
+                batch_share=self.config.admission_batch_share,
+            )
+            if self.config.admission_max_concurrent > 0 else None
+        )
+        
+        # Decoding, conversion and merging of large result sets leave the event loop thread.
+        # tracemalloc only sees this process, so memory profiling keeps them inline.
+        self.offloader = CPUOffloader(
+            max_workers=0 if self.config.memory_profiling else self.config.offload_workers
+        )
+
+    @classmethod
+    def from_config(cls, config: RAGConfig) -> "RAGPipeline":
+        """Create a pipeline from a RAGConfig"""
+        return cls(config.openai_api_key, config.mcp_server_path, config=config)
 
     async def initialize(self):
         """Initialize the RAG pipeline"""
         await self.mcp_client.connect()
+        await self.offloader.warm_up()
+        
+        if self.aggregate_cube is not None:
+            try:
+                await self.aggregate_cube.refresh(self.mcp_client)
+            except Exception as e:
+                logger.error(f"Initial aggregate cube refresh failed: {e}")
+            self._cube_refresh_task = asyncio.create_task(self._refresh_cube_periodically())
+        
         logger.info("RAG Pipeline initialized")
 
     async def shutdown(self):
         """Shutdown the RAG pipeline"""
+        if self._cube_refresh_task:
+            self._cube_refresh_task.cancel()
+            try:
+                await self._cube_refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._cube_refresh_task = None
+        if self.config.memory_profiling:
+            MemoryProfiler.release()
+        self.profiler.stop()
+        self.offloader.shutdown()
         await self.mcp_client.disconnect()
+        self.telemetry.close()
         logger.info("RAG Pipeline shutdown")
 
-    async def process_query(self, query: str) -> RAGResponse:
-        """Process a natural language query through the RAG pipeline"""
+    async def process_query(self, query: str, budget: Optional[float] = None,
+                            priority: Priority = Priority.INTERACTIVE,
+                            binning: Optional[BinningRequest] = None,
+                            downsampling: Optional[DownsamplingRequest] = None) -> RAGResponse:
+        """Process a natural language query through the RAG pipeline
+        
+        `budget` is the end-to-end latency budget in seconds; it defaults to
+        `query_latency_budget` from the configuration (0 means unbounded).
+        Every stage adapts to the budget that is left rather than overrunning it.
+        A correlation ID already set by the caller is kept for the query's telemetry.
+        
+        With admission control enabled the query first waits for a slot in its
+        `priority` class, and the wait counts against the budget. AdmissionRejected
+        is raised when the query cannot be admitted in time.
+        
+        With `binning`, the profiles are returned as per-tile aggregates for the
+        map (`merged_data["spatial_bins"]`) instead of individually; with
+        `downsampling`, as a downsampled time series for charts
+        (`merged_data["time_series"]`).
+        """
+        if budget is None:
+            budget = self.config.query_latency_budget or None
+        
+        # LLM calls made for the query are scheduled in its priority class
+        with correlation(correlation_id.get()), llm_call_scope(priority, critical=True):
+            if self.admission is None:
+                return await self._profiled_query(query, budget, binning, downsampling)
+            
+            try:
+                async with self.admission.admit(priority, budget) as slot:
+                    if budget is not None:
+                        budget = max(0.0, budget - slot.queue_time)
+                    response = await self._profiled_query(query, budget, binning, downsampling)
+            except AdmissionRejected as e:
+                self.telemetry.emit("query_rejected", priority=priority.name.lower(), reason=e.reason,
+                                    retry_after=e.retry_after)
+                raise
+            
+            response.metadata["admission"] = {"priority": priority.name.lower(), "queue_time": slot.queue_time}
+            return response
+
+    async def _profiled_query(self, query: str, budget: Optional[float],
+                              binning: Optional[BinningRequest] = None,
+                              downsampling: Optional[DownsamplingRequest] = None) -> RAGResponse:
+        """Run a query, sampling its stacks when the profiler selects it"""
+        if not self.profiler.should_sample():
+            return await self._process_query(query, budget, binning, downsampling)
+        
+        with self.profiler.profile_query() as profile:
+            response = await self._process_query(query, budget, binning, downsampling)
+            profile.intent = response.intent.value
+            return response
+
+    async def _process_query(self, query: str, budget: Optional[float],
+                             binning: Optional[BinningRequest] = None,
+                             downsampling: Optional[DownsamplingRequest] = None) -> RAGResponse:
+        """Run one query through the pipeline stages"""
         start_time = datetime.now()
+        deadline = Deadline(budget)
+        stage_timings: Dict[str, float] = {}
+        memory = (
+            MemoryProfiler(top_sites=self.config.memory_profiling_top_sites)
+            if self.config.memory_profiling else None
+        )
         
         try:
-            # Step 1: Classify intent
-            logger.info(f"Processing query: {query}")
-            context = await self.intent_classifier.classify_intent(query)
-            logger.info(f"Classified intent: {context.intent.value} (confidence: {context.confidence:.2f})")
+            self.telemetry.emit("query_started", query=query, budget=deadline.budget)
             
-            # Step 2: Execute retrieval strategy
-            if context.intent == QueryIntent.SQL_QUERY:
-                results = await self._execute_sql_mode(query, context)
-            elif context.intent == QueryIntent.SEMANTIC_SEARCH:
-                results = await self._execute_semantic_mode(query, context)
-            elif context.intent == QueryIntent.HYBRID:
-                results = await self._execute_hybrid_mode(query, context)
+            cube_response = self._answer_from_cube(query, start_time)
+            if cube_response is not None:
+                return cube_response
+            
+            self.speculation_stats["queries"] += 1
+            
+            if self._should_speculate(query, deadline):
+                # Steps 1 and 2 overlap: retrieval starts while the LLM classifies
+                context, results, speculation = await self._speculative_retrieval(
+                    query, deadline, stage_timings, memory
+                )
             else:
-                # Default to semantic search
-                results = await self._execute_semantic_mode(query, context)
+                speculation = {"speculated": False}
+                
+                # Step 1: Classify intent
+                with self._stage("classification", stage_timings, memory):
+                    context = await self.intent_classifier.classify_intent(
+                        query, deadline, min_llm_budget=self.config.llm_classify_min_budget,
+                        reserve=self._downstream_reserve()
+                    )
+                self.telemetry.emit("intent_classified", intent=context.intent.value, confidence=context.confidence)
+                
+                # Step 2: Execute retrieval strategy
+                with self._stage("retrieval", stage_timings, memory):
+                    if context.intent == QueryIntent.SQL_QUERY:
+                        results = await self._execute_sql_mode(query, context, deadline)
+                    elif context.intent == QueryIntent.SEMANTIC_SEARCH:
+                        results = await self._execute_semantic_mode(query, context, deadline)
+                    elif context.intent == QueryIntent.HYBRID:
+                        results = await self._execute_hybrid_mode(query, context, deadline)
+                    else:
+                        # Default to semantic search
+                        results = await self._execute_semantic_mode(query, context, deadline)
+            
+            speculation["speculation_rate"] = (
+                self.speculation_stats["speculated"] / self.speculation_stats["queries"]
+            )
             
             # Step 3: Merge results into structured format
-            merged_data = self._merge_results(results, context)
+            with self._stage("merge", stage_timings, memory):
+                merged_data = await self.offloader.run(
+                    merge_results, results, context, size=len(results), threshold=self.config.offload_min_rows
+                )
             
             # Step 4: Generate natural language response
-            nl_response = await self._generate_response(query, merged_data, context)
+            with self._stage("response_generation", stage_timings, memory):
+                nl_response = await self._generate_response(query, merged_data, context, deadline)
+            
+            # Step 5: Replace the individual profiles with map tiles or a chart series when requested
+            returned_results = results
+            if binning is not None:
+                with self._stage("spatial_binning", stage_timings, memory):
+                    merged_data["spatial_bins"] = await self.offloader.run_arrays(
+                        bin_profiles, profile_arrays(results), binning, self.config.spatial_binning_max_cells,
+                        threshold=self.config.offload_min_payload_bytes
+                    )
+                    merged_data.pop("profiles", None)
+                    returned_results = []
+            if downsampling is not None:
+                with self._stage("downsampling", stage_timings, memory):
+                    merged_data["time_series"] = await self.offloader.run_arrays(
+                        downsample_series, series_arrays(results, downsampling.metric), downsampling,
+                        threshold=self.config.offload_min_payload_bytes
+                    )
+                    merged_data.pop("profiles", None)
+                    returned_results = []
             
             execution_time = (datetime.now() - start_time).total_seconds()
+            self.telemetry.emit(
+                "query_completed", intent=context.intent.value, execution_time=execution_time,
+                result_count=len(results), stage_timings=stage_timings, degraded_stages=context.degraded_stages
+            )
             
             return RAGResponse(
                 query=query,
                 intent=context.intent,
-                results=results,
+                results=returned_results,
                 merged_data=merged_data,
                 natural_language_response=nl_response,
                 metadata={
                     "execution_time": execution_time,
                     "timestamp": datetime.now().isoformat(),
                     "confidence": context.confidence,
-                    "result_count": len(results)
+                    "result_count": len(results),
+                    "latency_budget": deadline.budget,
+                    "budget_remaining": deadline.remaining() if deadline.budget is not None else None,
+                    "degraded_stages": context.degraded_stages,
+                    "sql_source": context.sql_source,
+                    "stage_timings": stage_timings,
+                    "speculation": speculation,
+                    "fusion": context.fusion,
+                    "memory": memory.summary() if memory is not None else None,
+                    "correlation_id": correlation_id.get()
                 }
             )
             
         except Exception as e:
-            logger.error(f"Query processing failed: {e}")
+            logger.error(f"Query processing failed [{correlation_id.get()}]: {e}")
+            self.telemetry.emit("query_failed", error=f"{type(e).__name__}: {e}")
             raise
 
-    async def _execute_sql_mode(self, query: str, context: QueryContext) -> List[ARGOResult]:
-        """Execute SQL-based retrieval"""
-        logger.info("Executing SQL mode")
+    async def _refresh_cube_periodically(self):
+        """Fold newly arrived profiles into the aggregate cube"""
+        while True:
+            await asyncio.sleep(self.config.aggregate_cube_refresh_interval)
+            try:
+                await self.aggregate_cube.refresh(self.mcp_client)
+            except Exception as e:
+                logger.error(f"Aggregate cube refresh failed: {e}")
+
+    def _answer_from_cube(self, query: str, start_time: datetime) -> Optional[RAGResponse]:
+        """Answer a matching aggregation directly from the aggregate cube"""
+        if self.aggregate_cube is None or not self.aggregate_cube.is_ready:
+            return None
+
+        # This runs before classification, so only a query the compiler understood in full
+        # (no negation, disjunction or unparsed qualifier) may skip the pipeline
+        shape = self.sql_generator.compiler.parse(query)
+        if shape is None or not shape.is_aggregate:
+            return None
         
-        # Generate SQL query
-        sql_query = await self.sql_generator.generate_sql(query, context)
-        context.sql_query = sql_query
-        logger.info(f"Generated SQL: {sql_query}")
+        answer = self.aggregate_cube.answer(shape)
+        if answer is None:
+            return None
         
-        # Execute via MCP
-        raw_results = await self.mcp_client.query_argo_sql(sql_query)
+        self.telemetry.emit("cube_answered", query=query, metric=answer.metric, elapsed_us=answer.elapsed_us)
+        merged_data = {
+            "query_context": {
+                "original_query": query,
+                "intent": QueryIntent.SQL_QUERY.value,
+                "confidence": 1.0,
+                "sql_query": None,
+                "sql_source": "aggregate_cube",
+                "semantic_query": None
+            },
+            "aggregate": asdict(answer),
+            "profiles": []
+        }
         
-        # Convert to structured format
-        return self._convert_sql_results(raw_results)
+        return RAGResponse(
+            query=query,
+            intent=QueryIntent.SQL_QUERY,
+            results=[],
+            merged_data=merged_data,
+            natural_language_response=self._describe_cube_answer(answer),
+            metadata={
+                "execution_time": (datetime.now() - start_time).total_seconds(),
+                "timestamp": datetime.now().isoformat(),
+                "confidence": 1.0,
+                "result_count": len(answer.rows),
+                "latency_budget": None,
+                "budget_remaining": None,
+                "degraded_stages": [],
+                "sql_source": "aggregate_cube",
+                "stage_timings": {"aggregate_cube": round(answer.elapsed_us / 1e6, 6)},
+                "speculation": {"speculated": False},
+                "memory": None,
+                "correlation_id": correlation_id.get()
+            }
+        )
 
-    async def _execute_semantic_mode(self, query: str, context: QueryContext) -> List[ARGOResult]:
-        """Execute semantic search retrieval"""
-        logger.info("Executing semantic mode")
-        
-        context.semantic_query = query
+    def _describe_cube_answer(self, answer: CubeAnswer) -> str:
+        """Templated answer for an aggregation served from the cube"""
+        region = "all regions" if answer.region == "all" else f"the {answer.region.title()}"
+        subject = "Profile count" if answer.aggregate == "count" else f"{answer.aggregate.upper()} of {answer.metric}"
+        lines = [f"{subject} in {region}, from {self.aggregate_cube.profiles} aggregated ARGO profiles:"]
         
-        # Execute semantic search via MCP
-        raw_results = await self.mcp_client.retrieve_argo_semantic(query)
+        for row in answer.rows:
+            value = row.get("count") if answer.aggregate == "count" else row.get(f"{answer.aggregate}_{answer.metric}")
+            label = f"{row[answer.group_by]}: " if answer.group_by else ""
+            shown = "no data" if value is None else (f"{value:.3f}" if isinstance(value, float) else str(value))
+            suffix = "" if answer.aggregate == "count" else f" (n={row['count']})"
+            lines.append(f"- {label}{shown}{suffix}")
         
-        # Convert to structured format
-        return self._convert_semantic_results(raw_results)
+        return "\n".join(lines)
 
-    async def _execute_hybrid_mode(self, query: str, context: QueryContext) -> List[ARGOResult]:
-        """Execute hybrid SQL + semantic retrieval"""
-        logger.info("Executing hybrid mode")
-        
-        # Execute both strategies
-        sql_results = await self._execute_sql_mode(query, context)
-        semantic_results = await self._execute_semantic_mode(query, context)
+    def _should_speculate(self, query: str, deadline: Deadline) -> bool:
+        """Speculate only for ambiguous queries that will wait on the LLM classifier"""
+        if not self.config.speculative_retrieval:
+            return False
+        if not self.intent_classifier.is_ambiguous(*self.intent_classifier.pattern_scores(query)):
+            return False
+        return deadline.allows(self.config.llm_classify_min_budget + self._downstream_reserve())
+
+    def _downstream_reserve(self) -> float:
+        """Budget an LLM stage must leave for retrieval and response generation"""
+        return self.config.retrieval_min_budget + self.config.response_generation_min_budget + self.config.stage_reserve
+
+    async def _speculative_retrieval(self, query: str, deadline: Deadline, stage_timings: Dict[str, float],
+                                     memory: Optional[MemoryProfiler] = None):
+        """Classify while semantic retrieval and SQL generation run speculatively
         
-        # Merge and deduplicate results
-        combined_results = {}
+        Once the classifier decides, the branch it did not choose is cancelled
+        and hybrid queries reuse both branches. Returns the query context, the
+        results and a speculation report for the response metadata.
+        """
+        self.speculation_stats["speculated"] += 1
+        entities = await self.intent_classifier._extract_entities(query)
+        sql_context = QueryContext(query, QueryIntent.SQL_QUERY, 0.0, entities)
+        semantic_context = QueryContext(query, QueryIntent.SEMANTIC_SEARCH, 0.0, entities)
         
-        # Add SQL results
-        for result in sql_results:
-            combined_results[result.id] = result
+        semantic_limit = self._page_size(self.config.default_semantic_limit, deadline)
+        branches = {
+            "semantic_retrieval": _SpeculativeBranch.start(
+                self._execute_semantic_mode(query, semantic_context, deadline, limit=semantic_limit)
+            ),
+        }
+        # Speculative SQL generation yields the LLM budget to critical-path calls until it is chosen
+        with llm_call_scope(critical=False) as sql_generation_tag:
+            branches["sql_generation"] = _SpeculativeBranch.start(
+                self.sql_generator.generate_sql(
+                    query, sql_context, deadline, min_llm_budget=self.config.sql_generation_min_budget,
+                    reserve=self._downstream_reserve()
+                )
+            )
         
-        # Add semantic results, preserving similarity scores
-        for result in semantic_results:
-            if result.id in combined_results:
-                # Update with similarity score
-                combined_results[result.id].similarity_score = result.similarity_score
-                combined_results[result.id].rag_context = result.rag_context
+        try:
+            with self._stage("classification", stage_timings, memory):
+                context = await self.intent_classifier.classify_intent(
+                    query, deadline, min_llm_budget=self.config.llm_classify_min_budget,
+                    reserve=self._downstream_reserve()
+                )
+            self.telemetry.emit("intent_classified", intent=context.intent.value, confidence=context.confidence,
+                                speculated=True)
+            
+            if context.intent == QueryIntent.SQL_QUERY:
+                used = ["sql_generation"]
+            elif context.intent == QueryIntent.HYBRID:
+                used = ["sql_generation", "semantic_retrieval"]
             else:
-                combined_results[result.id] = result
+                used = ["semantic_retrieval"]
+            
+            if "sql_generation" in used:
+                sql_generation_tag.critical = True
+            discarded = [name for name in branches if name not in used]
+            for name in discarded:
+                branches[name].cancel()
+            
+            with self._stage("retrieval", stage_timings, memory):
+                if context.intent == QueryIntent.HYBRID:
+                    # The speculative semantic results become the first page of the semantic stream
+                    sql_query = await branches["sql_generation"].task
+                    semantic_results = await branches["semantic_retrieval"].task
+                    fusion = await self._fuse_hybrid(query, sql_query, sql_context, semantic_context, deadline,
+                                                     semantic_first_page=(semantic_results, semantic_limit))
+                    results = fusion.items
+                    context.fusion = fusion.summary()
+                elif "sql_generation" in used:
+                    sql_query = await branches["sql_generation"].task
+                    results = await self._run_sql(sql_query, sql_context, deadline)
+                else:
+                    results = await branches["semantic_retrieval"].task
+                
+                if "sql_generation" in used:
+                    context.sql_query = sql_context.sql_query
+                if "semantic_retrieval" in used:
+                    context.semantic_query = semantic_context.semantic_query
+                for branch_context in (sql_context, semantic_context):
+                    context.degraded_stages.extend(branch_context.degraded_stages)
+        finally:
+            for branch in branches.values():
+                branch.cancel()
+        
+        wasted = sum(branches[name].elapsed() for name in discarded)
+        self.speculation_stats["branches_discarded"] += len(discarded)
+        self.speculation_stats["wasted_seconds"] += wasted
         
-        return list(combined_results.values())
+        speculation = {
+            "speculated": True,
+            "branches": list(branches),
+            "used": used,
+            "discarded": discarded,
+            "discarded_completed": [name for name in discarded if branches[name].completed],
+            "wasted_seconds": round(wasted, 4),
+        }
+        return context, results, speculation
+
+    @contextmanager
+    def _stage(self, name: str, timings: Dict[str, float], memory: Optional[MemoryProfiler] = None):
+        """Time one pipeline stage, accounting for its allocations when memory profiling"""
+        start = time.monotonic()
+        try:
+            if memory is None:
+                yield
+            else:
+                with memory.stage(name):
+                    yield
+        finally:
+            timings[name] = round(time.monotonic() - start, 4)
 
-    def _convert_sql_results(self, raw_results: Dict[str, Any]) -> List[ARGOResult]:
-        """Convert SQL results to structured format"""
-        results = []
+    async def _bounded(self, call, context: QueryContext, deadline: Deadline, stage: str) -> Optional[Any]:
+        """Await an MCP call within the remaining budget, or None when it cannot fit"""
+        timeout = deadline.timeout(reserve=self.config.stage_reserve)
+        if timeout is not None and timeout < self.config.retrieval_min_budget:
+            context.degraded_stages.append(f"{stage}_skipped")
+            return None
         
         try:
-            data = json.loads(raw_results) if isinstance(raw_results, str) else raw_results
-            profiles = data.get('data', {}).get('data', [])
-            
-            for profile in profiles:
-                result = ARGOResult(
-                    id=profile.get('id', ''),
-                    float_id=profile.get('platform_number', ''),
-                    cycle_number=profile.get('cycle_number', 0),
-                    location={
-                        'latitude': profile.get('latitude', 0.0),
-                        'longitude': profile.get('longitude', 0.0)
-                    },
-                    timestamp=profile.get('date', ''),
-                    variables={
-                        'temperature': {
-                            'surface': profile.get('surface_temp'),
-                            'thermocline_depth': profile.get('thermocline_depth')
-                        },
-                        'salinity': {
-                            'surface': profile.get('surface_sal'),
-                            'min_depth': profile.get('salinity_min_depth'),
-                            'max_depth': profile.get('salinity_max_depth')
-                        },
-                        'stratification': profile.get('mean_stratification')
-                    },
-                    metadata={
-                        'quality_flag': profile.get('quality_flag', ''),
-                        'data_mode': profile.get('data_mode', ''),
-                        'source': 'sql_query'
-                    }
-                )
-                results.append(result)
-                
-        except Exception as e:
-            logger.error(f"Failed to convert SQL results: {e}")
+            return await asyncio.wait_for(call(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{stage} exceeded the latency budget")
+            context.degraded_stages.append(f"{stage}_timeout")
+            return None
+
+    def _page_size(self, default: int, deadline: Deadline) -> int:
+        """Cap result pages when the remaining budget is short"""
+        if deadline.budget is not None and not deadline.allows(self.config.degraded_page_budget):
+            return min(default, self.config.degraded_page_size)
+        return default
+
+    async def _execute_sql_mode(self, query: str, context: QueryContext,
+                                deadline: Optional[Deadline] = None) -> List[ARGOResult]:
+        """Execute SQL-based retrieval"""
+        self.telemetry.emit("retrieval_started", mode="sql")
+        deadline = deadline or Deadline()
         
-        return results
+        # Generate SQL query
+        sql_query = await self.sql_generator.generate_sql(
+            query, context, deadline, min_llm_budget=self.config.sql_generation_min_budget,
+            reserve=self._downstream_reserve()
+        )
+        return await self._run_sql(sql_query, context, deadline)
 
-    def _convert_semantic_results(self, raw_results: Dict[str, Any]) -> List[ARGOResult]:
-        """Convert semantic search results to structured format"""
-        results = []
+    async def _run_sql(self, sql_query: str, context: QueryContext, deadline: Deadline) -> List[ARGOResult]:
+        """Execute generated SQL via MCP and convert the rows"""
+        guarded = self._guard_sql(sql_query, context, self._page_size(self.config.default_sql_limit, deadline))
+        
+        # Execute via MCP
+        raw_results = await self._bounded(
+            lambda: self.mcp_client.query_argo_sql(guarded.sql, page=guarded.page, page_size=guarded.page_size),
+            context, deadline, "sql_retrieval"
+        )
+        if raw_results is None:
+            return []
+        
+        # Convert to structured format
+        return await self._convert(convert_sql_results, raw_results)
+
+    def _guard_sql(self, sql_query: str, context: QueryContext, page_size: int) -> GuardedSQL:
+        """Validate and rewrite generated SQL before anything reaches the database"""
+        self.telemetry.emit("sql_generated", sql=sql_query, source=context.sql_source)
         
         try:
-            data = json.loads(raw_results) if isinstance(raw_results, str) else raw_results
-            search_results = data.get('data', {}).get('profiles', [])
-            similarities = data.get('data', {}).get('similarities', [])
-            
-            for i, profile in enumerate(search_results):
-                similarity = similarities[i] if i < len(similarities) else 0.0
-                
-                result = ARGOResult(
-                    id=profile.get('id', ''),
-                    float_id=profile.get('platform_number', ''),
-                    cycle_number=profile.get('cycle_number', 0),
-                    location={
-                        'latitude': profile.get('latitude', 0.0),
-                        'longitude': profile.get('longitude', 0.0)
-                    },
-                    timestamp=profile.get('date', ''),
-                    variables={
-                        'temperature': {
-                            'surface': profile.get('surface_temp'),
-                            'thermocline_depth': profile.get('thermocline_depth')
-                        },
-                        'salinity': {
-                            'surface': profile.get('surface_sal'),
-                            'min_depth': profile.get('salinity_min_depth'),
-                            'max_depth': profile.get('salinity_max_depth')
-                        },
-                        'stratification': profile.get('mean_stratification')
-                    },
-                    metadata={
-                        'quality_flag': profile.get('quality_flag', ''),
-                        'data_mode': profile.get('data_mode', ''),
-                        'source': 'semantic_search'
-                    },
-                    similarity_score=similarity,
-                    rag_context=f"Semantic similarity: {similarity:.3f}"
-                )
-                results.append(result)
-                
-        except Exception as e:
-            logger.error(f"Failed to convert semantic results: {e}")
+            guarded = self.sql_guard.rewrite(sql_query, page_size=page_size)
+        except SQLGuardrailError as e:
+            logger.warning(f"SQL rejected by guardrail, using fallback query: {e}")
+            context.degraded_stages.append("sql_guardrail_rejected")
+            guarded = self.sql_guard.rewrite(SQLQueryGenerator.FALLBACK_SQL, page_size=page_size)
+        context.sql_query = guarded.sql
+        return guarded
+
+    async def _execute_semantic_mode(self, query: str, context: QueryContext,
+                                     deadline: Optional[Deadline] = None,
+                                     limit: Optional[int] = None) -> List[ARGOResult]:
+        """Execute semantic search retrieval"""
+        self.telemetry.emit("retrieval_started", mode="semantic")
+        deadline = deadline or Deadline()
+        
+        context.semantic_query = query
+        
+        # Execute semantic search via MCP
+        limit = limit or self._page_size(self.config.default_semantic_limit, deadline)
+        raw_results = await self._bounded(
+            lambda: self.mcp_client.retrieve_argo_semantic(query, limit=limit),
+            context, deadline, "semantic_retrieval"
+        )
+        if raw_results is None:
+            return []
         
-        return results
+        # Convert to structured format
+        return await self._convert(convert_semantic_results, raw_results)
 
-    def _merge_results(self, results: List[ARGOResult], context: QueryContext) -> Dict[str, Any]:
-        """Merge results into structured JSON output"""
+    async def _execute_hybrid_mode(self, query: str, context: QueryContext,
+                                   deadline: Optional[Deadline] = None) -> List[ARGOResult]:
+        """Execute hybrid SQL + semantic retrieval"""
+        self.telemetry.emit("retrieval_started", mode="hybrid")
+        deadline = deadline or Deadline()
         
-        # Calculate summary statistics
-        if results:
-            latitudes = [r.location['latitude'] for r in results]
-            longitudes = [r.location['longitude'] for r in results]
-            
-            temps = [r.variables.get('temperature', {}).get('surface') 
-                    for r in results if r.variables.get('temperature', {}).get('surface') is not None]
-            
-            salts = [r.variables.get('salinity', {}).get('surface') 
-                    for r in results if r.variables.get('salinity', {}).get('surface') is not None]
-        else:
-            latitudes = longitudes = temps = salts = []
+        sql_query = await self.sql_generator.generate_sql(
+            query, context, deadline, min_llm_budget=self.config.sql_generation_min_budget,
+            reserve=self._downstream_reserve()
+        )
+        fusion = await self._fuse_hybrid(query, sql_query, context, context, deadline)
+        context.fusion = fusion.summary()
+        return fusion.items
+
+    async def _fuse_hybrid(self, query: str, sql_query: str, sql_context: QueryContext,
+                           semantic_context: QueryContext, deadline: Deadline,
+                           semantic_first_page: Optional[Tuple[List[ARGOResult], int]] = None) -> FusionResult:
+        """Rank-fuse the SQL and semantic branches, reading pages until the top-k is settled"""
+        max_depth = self._page_size(self.config.hybrid_max_depth, deadline)
+        guarded = self._guard_sql(sql_query, sql_context, max_depth)
+        semantic_context.semantic_query = query
         
-        merged = {
-            "query_context": {
-                "original_query": context.original_query,
-                "intent": context.intent.value,
-                "confidence": context.confidence,
-                "sql_query": context.sql_query,
-                "semantic_query": context.semantic_query
-            },
-            "results_summary": {
-                "total_profiles": len(results),
-                "geographic_bounds": {
-                    "lat_range": [min(latitudes), max(latitudes)] if latitudes else [0, 0],
-                    "lon_range": [min(longitudes), max(longitudes)] if longitudes else [0, 0]
-                },
-                "variable_ranges": {
-                    "temperature": {
-                        "min": min(temps) if temps else None,
-                        "max": max(temps) if temps else None,
-                        "mean": sum(temps) / len(temps) if temps else None
-                    },
-                    "salinity": {
-                        "min": min(salts) if salts else None,
-                        "max": max(salts) if salts else None,
-                        "mean": sum(salts) / len(salts) if salts else None
-                    }
-                }
-            },
-            "profiles": [asdict(result) for result in results]
-        }
+        # queryARGO pages are aligned to their size, so an explicit OFFSET may force a single page
+        base = (guarded.page - 1) * guarded.page_size
+        sql_page_size = min(self.config.hybrid_page_size, guarded.page_size)
+        if base % sql_page_size:
+            sql_page_size = guarded.page_size
+        
+        async def sql_page(offset: int, limit: int) -> Optional[List[ARGOResult]]:
+            page = (base + offset) // limit + 1
+            raw_results = await self._bounded(
+                lambda: self.mcp_client.query_argo_sql(guarded.sql, page=page, page_size=limit),
+                sql_context, deadline, "sql_retrieval"
+            )
+            return None if raw_results is None else await self._convert(convert_sql_results, raw_results)
         
-        return merged
+        async def semantic_page(offset: int, limit: int) -> Optional[List[ARGOResult]]:
+            raw_results = await self._bounded(
+                lambda: self.mcp_client.retrieve_argo_semantic(query, limit=limit, offset=offset),
+                semantic_context, deadline, "semantic_retrieval"
+            )
+            return None if raw_results is None else await self._convert(convert_semantic_results, raw_results)
+        
+        sql_stream = RankedStream("sql", sql_page, sql_page_size, guarded.page_size,
+                                  weight=self.config.hybrid_sql_weight)
+        semantic_stream = RankedStream("semantic", semantic_page, self.config.hybrid_page_size, max_depth,
+                                       weight=self.config.hybrid_semantic_weight)
+        if semantic_first_page is not None:
+            semantic_stream.seed(*semantic_first_page)
+        
+        fusion = await reciprocal_rank_fusion(
+            [sql_stream, semantic_stream], top_k=self.config.hybrid_top_k, k=self.config.hybrid_rrf_k,
+            combine=combine_hybrid_results
+        )
+        for result, score in zip(fusion.items, fusion.scores):
+            result.metadata["fusion_score"] = round(score, 6)
+        self.telemetry.emit("hybrid_fused", **fusion.summary())
+        return fusion
 
-    async def _generate_response(self, query: str, merged_data: Dict[str, Any], context: QueryContext) -> str:
+    async def _convert(self, converter, raw_results: Union[str, Dict[str, Any]]) -> List[ARGOResult]:
+        """Decode and convert an MCP payload, in a worker process when it is large"""
+        size = len(raw_results) if isinstance(raw_results, str) else 0
+        return await self.offloader.run(converter, raw_results, size=size,
+                                        threshold=self.config.offload_min_payload_bytes)
+
+    async def _generate_response(self, query: str, merged_data: Dict[str, Any], context: QueryContext,
+                                 deadline: Optional[Deadline] = None) -> str:
         """Generate natural language response using LLM"""
         
+        if deadline is not None and not deadline.allows(self.config.response_generation_min_budget):
+            context.degraded_stages.append("response_generation_templated")
+            return self._fallback_response(query, merged_data)
+        
         try:
             # Create a concise summary for the LLM
             summary = {
@@ -595,7 +1306,7 @@ class RAGPipeline:
             # Include sample profiles for context
             sample_profiles = merged_data["profiles"][:3]  # First 3 profiles
             
-            response = await self.openai.chat.completions.create(
+            response = await asyncio.wait_for(self.openai.chat.completions.create(
                 model="gpt-4",
                 messages=[
                     {
@@ -623,16 +1334,23 @@ class RAGPipeline:
                 ],
                 temperature=0.3,
                 max_tokens=1000
-            )
+            ), timeout=deadline.timeout() if deadline else None)
             
             return response.choices[0].message.content
             
+        except asyncio.TimeoutError:
+            logger.warning("Response generation exceeded the latency budget")
+            context.degraded_stages.append("response_generation_timeout")
+            return self._fallback_response(query, merged_data)
+            
         except Exception as e:
             logger.error(f"Response generation failed: {e}")
-            
-            # Fallback response
-            total = merged_data["results_summary"]["total_profiles"]
-            return f"Found {total} ARGO profiles matching your query '{query}'. The data includes oceanographic measurements from various locations and time periods. Please check the detailed results for specific values and metadata."
+            return self._fallback_response(query, merged_data)
+
+    def _fallback_response(self, query: str, merged_data: Dict[str, Any]) -> str:
+        """Templated answer used when the LLM is unavailable or out of budget"""
+        total = merged_data["results_summary"]["total_profiles"]
+        return f"Found {total} ARGO profiles matching your query '{query}'. The data includes oceanographic measurements from various locations and time periods. Please check the detailed results for specific values and metadata."
 
 # Example usage and testing
 async def main():
@@ -0,0 +1,157 @@
+"""
+Reciprocal-rank fusion of paged result streams with early termination.
+
+Hybrid queries combine SQL rows, which come back in the query's ORDER BY
+order but carry no score, with semantic results ranked by similarity.
+Reciprocal-rank fusion scores a document by the sum of weight / (k + rank)
+over the streams it appears in, so only ranks matter and the branches need
+no common score scale.
+
+Each branch is read as a stream of pages. After every round of fetches the
+fuser bounds what the unread part of the streams could still contribute,
+as in the no-random-access variant of the threshold algorithm: a document
+can gain at most weight / (k + depth + 1) from a stream it has not been seen
+in yet, and a document not seen at all at most the sum of that over the
+streams that are not exhausted. Once the k-th best score so far is at least
+the best score anything outside the top-k could still reach, the top-k set
+is settled and no further pages are fetched.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Standard RRF damping constant; larger values flatten the rank curve
+DEFAULT_RRF_K = 60
+
+# fetch(offset, limit) returns the next page of ranked items, or None when the source failed
+PageFetcher = Callable[[int, int], Awaitable[Optional[List[Any]]]]
+
+class RankedStream:
+    """A ranked result source read page by page, up to `max_depth` items"""
+
+    def __init__(self, name: str, fetch: PageFetcher, page_size: int, max_depth: int, weight: float = 1.0):
+        self.name = name
+        self.fetch = fetch
+        self.page_size = max(1, page_size)
+        self.max_depth = max_depth
+        self.weight = weight
+        self.items: List[Any] = []
+        self.exhausted = max_depth <= 0
+        self.pages = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.items)
+
+    def frontier(self, k: int) -> float:
+        """Most that a document not yet seen in this stream can still gain from it"""
+        return 0.0 if self.exhausted else self.weight / (k + self.depth + 1)
+
+    def seed(self, items: List[Any], requested: int):
+        """Use items that were already fetched, with a page of `requested`, as the first page"""
+        self._accept(items, requested)
+
+    async def pull(self):
+        """Fetch the next page"""
+        self._accept(await self.fetch(self.depth, self.page_size), self.page_size)
+
+    def _accept(self, page: Optional[List[Any]], requested: int):
+        self.pages += 1
+        page = page or []
+        self.items.extend(page[:self.max_depth - self.depth])
+        if len(page) < requested or self.depth >= self.max_depth:
+            self.exhausted = True
+
+@dataclass
+class FusionResult:
+    """Fused top-k, best first"""
+    items: List[Any]
+    scores: List[float]
+    settled_early: bool
+    depths: Dict[str, int] = field(default_factory=dict)
+    pages: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "method": "rrf",
+            "settled_early": self.settled_early,
+            "depths": self.depths,
+            "pages": self.pages,
+        }
+
+def _first_wins(kept: Any, other: Any) -> Any:
+    return kept
+
+async def reciprocal_rank_fusion(streams: Sequence[RankedStream], top_k: int, k: int = DEFAULT_RRF_K,
+                                 key: Callable[[Any], Any] = lambda item: item.id,
+                                 combine: Callable[[Any, Any], Any] = _first_wins) -> FusionResult:
+    """Fuse the streams, fetching pages only until the top-k is settled
+
+    A document found by several streams is folded with `combine(kept, other)`,
+    in stream order. The top-k set is exact; within it, documents are ordered
+    by the scores observed when reading stopped.
+    """
+    settled_early = False
+    while True:
+        scores, upper, items = _score(streams, k, key)
+        ranking = sorted(scores, key=lambda doc: -scores[doc])
+        active = [stream for stream in streams if not stream.exhausted]
+        if not active:
+            break
+        if _settled(ranking, scores, upper, streams, top_k, k):
+            settled_early = True
+            break
+        # Every unexhausted stream leaves the ranking open, so they are read side by side
+        await asyncio.gather(*(stream.pull() for stream in active))
+
+    top = ranking[:top_k]
+    fused = []
+    for doc in top:
+        found = items[doc]
+        merged = found[0]
+        for other in found[1:]:
+            merged = combine(merged, other)
+        fused.append(merged)
+
+    result = FusionResult(
+        items=fused,
+        scores=[scores[doc] for doc in top],
+        settled_early=settled_early,
+        depths={stream.name: stream.depth for stream in streams},
+        pages={stream.name: stream.pages for stream in streams},
+    )
+    logger.debug(f"Rank fusion read {result.depths} in {result.pages} pages (settled early: {settled_early})")
+    return result
+
+def _score(streams: Sequence[RankedStream], k: int, key: Callable[[Any], Any]):
+    """Scores seen so far, their upper bounds, and each document's items in stream order"""
+    scores: Dict[Any, float] = {}
+    seen: Dict[Any, List[int]] = {}
+    items: Dict[Any, List[Any]] = {}
+    for index, stream in enumerate(streams):
+        for rank, item in enumerate(stream.items, start=1):
+            doc = key(item)
+            if index in seen.get(doc, ()):
+                continue
+            scores[doc] = scores.get(doc, 0.0) + stream.weight / (k + rank)
+            seen.setdefault(doc, []).append(index)
+            items.setdefault(doc, []).append(item)
+
+    upper = {
+        doc: score + sum(stream.frontier(k) for index, stream in enumerate(streams) if index not in seen[doc])
+        for doc, score in scores.items()
+    }
+    return scores, upper, items
+
+def _settled(ranking: List[Any], scores: Dict[Any, float], upper: Dict[Any, float],
+             streams: Sequence[RankedStream], top_k: int, k: int) -> bool:
+    """True when nothing outside the current top-k can still overtake its last member"""
+    if len(ranking) < top_k:
+        return False
+    unseen = sum(stream.frontier(k) for stream in streams)
+    challenger = max([upper[doc] for doc in ranking[top_k:]] + [unseen])
+    return scores[ranking[top_k - 1]] >= challenger
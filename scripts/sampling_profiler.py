@@ -0,0 +1,221 @@
+"""
+Low-overhead sampling profiler for RAGPipeline queries.
+
+A daemon thread wakes every `interval` seconds, reads the event loop
+thread's current stack from `sys._current_frames()` and, when the task
+running on the loop belongs to a profiled query, counts the collapsed stack
+against that query. Tasks spawned by a profiled query (gathered tool calls,
+speculative branches) inherit its tag through a loop task factory. When a
+query finishes its samples are folded under its intent, and `flush()`
+writes one collapsed-stack file per intent (`frame;frame;frame count` per
+line), the input format of flamegraph.pl, speedscope and inferno.
+
+Queries are profiled with probability `sample_rate`, or all of them while
+a window opened with `enable_for()` is running; the window's stacks are
+flushed when it closes. While no profiled query is in flight the sampling
+thread is idle.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Stacks deeper than this are truncated at the root end
+MAX_STACK_DEPTH = 128
+
+class QueryProfile:
+    """Samples collected for one profiled query"""
+
+    def __init__(self):
+        self.intent = "failed"
+        self.samples: Counter = Counter()
+        self.closed = False
+
+def collapse_stack(frame) -> str:
+    """Root-first `file:function` frames joined by semicolons"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler:
+    """Samples the event loop thread's stacks for a fraction of queries"""
+
+    def __init__(self, interval: float = 0.005, sample_rate: float = 0.0, output_dir: str = "profiles",
+                 seed: Optional[int] = None):
+        self.interval = interval
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.rng = random.Random(seed)
+
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._previous_factory = None
+
+        self._tasks: "weakref.WeakKeyDictionary[asyncio.Task, QueryProfile]" = weakref.WeakKeyDictionary()
+        self._in_flight = 0
+        self._by_intent: Dict[str, Counter] = {}
+        self._window_end = 0.0
+        self.queries_profiled = 0
+        self.samples_taken = 0
+
+    def enable_for(self, seconds: float):
+        """Profile every query for the next `seconds`"""
+        self._window_end = time.monotonic() + seconds
+        logger.info(f"Sampling profiler enabled for {seconds:.0f}s")
+
+    def should_sample(self) -> bool:
+        """Decide whether the next query is profiled"""
+        if self._window_end and time.monotonic() < self._window_end:
+            return True
+        return self.sample_rate > 0 and self.rng.random() < self.sample_rate
+
+    @contextmanager
+    def profile_query(self) -> Iterator[QueryProfile]:
+        """Sample the calling task, and tasks it spawns, until the block exits"""
+        task = asyncio.current_task()
+        if task is None:
+            raise RuntimeError("profile_query must be used from within a task")
+
+        self._attach(task.get_loop())
+        profile = QueryProfile()
+        with self._lock:
+            self._tasks[task] = profile
+            self._in_flight += 1
+        self._wake.set()
+
+        try:
+            yield profile
+        finally:
+            with self._lock:
+                self._tasks.pop(task, None)
+                self._in_flight -= 1
+                profile.closed = True
+                self._by_intent.setdefault(profile.intent, Counter()).update(profile.samples)
+                self.queries_profiled += 1
+
+    def flush(self) -> List[str]:
+        """Write and reset the collapsed stacks gathered so far, one file per intent"""
+        with self._lock:
+            by_intent, self._by_intent = self._by_intent, {}
+
+        paths = []
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        for intent, stacks in by_intent.items():
+            if not stacks:
+                continue
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{intent}.{stamp}.collapsed")
+            with open(path, "a", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(path)
+            logger.info(f"Wrote {sum(stacks.values())} samples for intent {intent} to {path}")
+        return paths
+
+    def stop(self) -> List[str]:
+        """Stop sampling, restore the loop's task factory and flush"""
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.set_task_factory(self._previous_factory)
+        self._loop = None
+        return self.flush()
+
+    def stats(self):
+        return {
+            "queries_profiled": self.queries_profiled,
+            "samples_taken": self.samples_taken,
+            "in_flight": self._in_flight,
+            "window_remaining": max(0.0, self._window_end - time.monotonic()),
+        }
+
+    def _attach(self, loop: asyncio.AbstractEventLoop):
+        """Hook the loop on first use and start the sampling thread"""
+        if self._loop is loop:
+            return
+
+        self._loop = loop
+        self._loop_thread_id = threading.get_ident()
+        self._previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _task_factory(self, loop, coro, **kwargs):
+        """Create a task, tagging it with its parent's query profile"""
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+
+        parent = asyncio.current_task(loop)
+        if parent is not None:
+            profile = self._tasks.get(parent)
+            if profile is not None:
+                with self._lock:
+                    self._tasks[task] = profile
+        return task
+
+    def _run(self):
+        """Sampling thread"""
+        while not self._stopped.is_set():
+            if self._window_end and time.monotonic() >= self._window_end:
+                # Queries still in flight are written by a later flush
+                self._window_end = 0.0
+                self.flush()
+
+            if not self._in_flight:
+                self._wake.wait(timeout=1.0)
+                self._wake.clear()
+                continue
+
+            self._sample()
+            time.sleep(self.interval)
+
+    def _sample(self):
+        """Attribute the loop thread's current stack to the query whose task is running"""
+        loop = self._loop
+        if loop is None:
+            return
+        task = asyncio.current_task(loop)
+        if task is None:
+            # The loop is idle, waiting on I/O
+            return
+
+        with self._lock:
+            profile = self._tasks.get(task)
+        if profile is None or profile.closed:
+            return
+
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return
+        stack = collapse_stack(frame)
+        with self._lock:
+            if not profile.closed:
+                profile.samples[stack] += 1
+                self.samples_taken += 1
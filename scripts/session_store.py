@@ -0,0 +1,287 @@
+"""
+Multi-tenant conversation session store for the ARGO LLM agent.
+
+Sessions are keyed by session ID and each carries its own lock and a bounded
+message history. The store keeps at most `max_sessions` sessions in memory,
+evicting the least recently used ones and any that have been idle longer
+than `idle_timeout`. With a `spill_dir`, evicted sessions are written to a
+local JSON file and transparently restored on their next request. Inside an
+event loop the spill file reads and writes run in a worker thread, one at a
+time per session, and a session restored before its write lands is taken
+from memory.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ConversationSession:
+    """One user's conversation state"""
+    session_id: str
+    history: Deque[Dict[str, str]]
+    created_at: float = field(default_factory=time.time)
+    last_active: float = field(default_factory=time.monotonic)
+    in_use: int = 0
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False, compare=False)
+
+    def add_message(self, role: str, content: str):
+        """Append a message, dropping the oldest once the history is full"""
+        self.history.append({"role": role, "content": content})
+
+    def messages(self) -> List[Dict[str, str]]:
+        """History as a list suitable for a chat completion request"""
+        return list(self.history)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serializable form used when spilling to disk"""
+        return {"session_id": self.session_id, "created_at": self.created_at, "history": list(self.history)}
+
+class SessionStore:
+    """Bounded, LRU-evicting store of conversation sessions"""
+
+    def __init__(self, max_sessions: int = 10000, max_history_messages: int = 20,
+                 idle_timeout: float = 1800.0, spill_dir: Optional[str] = None):
+        if max_sessions < 1 or max_history_messages < 1:
+            raise ValueError("max_sessions and max_history_messages must be at least 1")
+
+        self.max_sessions = max_sessions
+        self.max_history_messages = max_history_messages
+        self.idle_timeout = idle_timeout
+        self.spill_dir = spill_dir
+
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        # Spill file I/O still in flight, and what each file will hold once it is done (None: no file)
+        self._spill_tasks: Dict[str, asyncio.Task] = {}
+        self._pending_spills: Dict[str, Optional[Dict[str, Any]]] = {}
+        # Restores in flight, shared by concurrent requests for the same session
+        self._loading: Dict[str, asyncio.Task] = {}
+        self.evictions = 0
+        self.spills = 0
+        self.restores = 0
+
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Optional[ConversationSession]:
+        """Return an in-memory session and mark it recently used, or None if it is not loaded"""
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+
+        self._sessions.move_to_end(session_id)
+        session.last_active = time.monotonic()
+        self._evict(keep=session_id)
+        return session
+
+    def peek(self, session_id: str) -> Optional[ConversationSession]:
+        """Return an in-memory session without touching its LRU position"""
+        return self._sessions.get(session_id)
+
+    @asynccontextmanager
+    async def session(self, session_id: str) -> AsyncIterator[ConversationSession]:
+        """Hold a session's lock for the duration of one request, loading the session first if needed"""
+        session = self.get(session_id)
+        # A freshly loaded session can be evicted again before this request resumes
+        while session is None:
+            await self._load(session_id)
+            session = self.get(session_id)
+        # Counted before waiting on the lock so queued requests pin the session too
+        session.in_use += 1
+        try:
+            async with session.lock:
+                yield session
+        finally:
+            session.in_use -= 1
+            session.last_active = time.monotonic()
+            # Keep the map in last-active order, which the idle scan in _evict relies on
+            if self._sessions.get(session_id) is session:
+                self._sessions.move_to_end(session_id)
+            # A burst of concurrent sessions may have pushed the store over capacity
+            if len(self._sessions) > self.max_sessions:
+                self._evict()
+
+    def drop(self, session_id: str):
+        """Forget a session, including any spilled copy"""
+        self._sessions.pop(session_id, None)
+        if self.spill_dir:
+            self._spill_io(session_id, lambda: self._unlink_spill(session_id), None)
+
+    async def flush(self):
+        """Spill every idle in-memory session and wait for the writes, e.g. before shutdown"""
+        for session in list(self._sessions.values()):
+            if not session.in_use:
+                self._remove(session)
+        if self._spill_tasks:
+            await asyncio.wait(set(self._spill_tasks.values()))
+
+    def stats(self) -> Dict[str, Any]:
+        """Report store occupancy and eviction counters"""
+        return {
+            "sessions": len(self._sessions),
+            "active": sum(1 for session in self._sessions.values() if session.in_use),
+            "max_sessions": self.max_sessions,
+            "evictions": self.evictions,
+            "spills": self.spills,
+            "restores": self.restores,
+            "pending_spills": len(self._spill_tasks),
+        }
+
+    def _new_session(self, session_id: str) -> ConversationSession:
+        """Create an empty session"""
+        return ConversationSession(session_id=session_id, history=deque(maxlen=self.max_history_messages))
+
+    async def _load(self, session_id: str):
+        """Bring a session into memory from its spill file, or create it"""
+        if not self.spill_dir:
+            self._sessions[session_id] = self._new_session(session_id)
+            return
+
+        task = self._loading.get(session_id)
+        if task is None:
+            task = asyncio.get_running_loop().create_task(self._load_spilled(session_id))
+            self._loading[session_id] = task
+            task.add_done_callback(lambda done: self._loading.pop(session_id, None))
+        # Shielded so a cancelled request cannot lose a session whose file is already gone
+        await asyncio.shield(task)
+
+    async def _load_spilled(self, session_id: str):
+        """Restore a session, or create it if nothing was spilled"""
+        session = await self._restore(session_id)
+        self._sessions.setdefault(session_id, session or self._new_session(session_id))
+
+    def _evict(self, keep: Optional[str] = None):
+        """Evict idle sessions, then least recently used ones above capacity, sparing `keep`"""
+        now = time.monotonic()
+
+        # The OrderedDict is in access order, so idle sessions sit at the front
+        for session in list(self._sessions.values()):
+            if now - session.last_active < self.idle_timeout:
+                break
+            if not session.in_use and session.session_id != keep:
+                self._remove(session)
+
+        if len(self._sessions) > self.max_sessions:
+            for session in list(self._sessions.values()):
+                if len(self._sessions) <= self.max_sessions:
+                    break
+                # Never evict a session while a request holds or awaits it
+                if not session.in_use and session.session_id != keep:
+                    self._remove(session)
+
+    def _remove(self, session: ConversationSession):
+        """Evict one session, spilling it to disk when configured"""
+        self._sessions.pop(session.session_id, None)
+        self.evictions += 1
+        if self.spill_dir and session.history:
+            self._spill(session)
+
+    def _spill_path(self, session_id: str) -> str:
+        """File used for a spilled session; IDs are hashed to keep paths safe"""
+        digest = hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.json")
+
+    def _spill(self, session: ConversationSession):
+        """Write a cold session to disk"""
+        session_id, payload = session.session_id, session.to_dict()
+        self._spill_io(session_id, lambda: self._write_spill(session_id, payload), payload)
+
+    def _spill_io(self, session_id: str, job: Callable[[], Any],
+                  state: Optional[Dict[str, Any]]) -> Optional[asyncio.Task]:
+        """Run spill file I/O off the event loop, after any earlier I/O for the same session
+
+        `state` is what the spill file holds once `job` is done (None: no file).
+        Returns the task, whose result is the job's; without a running loop the job runs inline.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            job()
+            return None
+
+        previous = self._spill_tasks.get(session_id)
+
+        async def run():
+            if previous is not None:
+                await asyncio.wait({previous})
+            return await asyncio.to_thread(job)
+
+        task = loop.create_task(run())
+        self._spill_tasks[session_id] = task
+        self._pending_spills[session_id] = state
+        task.add_done_callback(lambda done: self._spill_io_done(session_id, done))
+        return task
+
+    def _spill_io_done(self, session_id: str, task: asyncio.Task):
+        """Forget a session's in-flight state once its last queued I/O has finished"""
+        if self._spill_tasks.get(session_id) is task:
+            del self._spill_tasks[session_id]
+            del self._pending_spills[session_id]
+
+    def _write_spill(self, session_id: str, payload: Dict[str, Any]):
+        """Write a spill file atomically"""
+        path = self._spill_path(session_id)
+        try:
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+            self.spills += 1
+        except OSError as e:
+            logger.error(f"Failed to spill session {session_id}: {e}")
+
+    def _unlink_spill(self, session_id: str):
+        """Remove a spill file if there is one"""
+        try:
+            os.unlink(self._spill_path(session_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove spilled session {session_id}: {e}")
+
+    def _read_spill(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Read and remove a spill file, returning None if there is none"""
+        path = self._spill_path(session_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            os.unlink(path)
+            return data
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Failed to restore session {session_id}: {e}")
+            return None
+
+    async def _restore(self, session_id: str) -> Optional[ConversationSession]:
+        """Load a spilled session, reading its file in a worker thread"""
+        if session_id in self._pending_spills:
+            # Its spill file is still being written or removed; the in-memory copy is current
+            data = self._pending_spills[session_id]
+            if data is not None:
+                self._spill_io(session_id, lambda: self._unlink_spill(session_id), None)
+        else:
+            data = await self._spill_io(session_id, lambda: self._read_spill(session_id), None)
+        if data is None:
+            return None
+
+        session = self._new_session(session_id)
+        session.created_at = data.get("created_at", session.created_at)
+        session.history.extend(data.get("history", []))
+        self.restores += 1
+        return session
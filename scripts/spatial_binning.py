@@ -0,0 +1,190 @@
+"""
+Spatial binning of query results into map tiles.
+
+A broad query can return thousands of profiles, and shipping every one of
+them to the geospatial map makes the payload and the rendering cost grow
+with the result count. `bin_profiles` instead groups the profiles into Web
+Mercator tiles (the slippy-map x/y/zoom scheme, identified by quadkey) at
+the requested zoom and returns, per non-empty tile, the profile count, the
+centroid and the mean surface temperature, surface salinity and mixed layer
+depth.
+
+The work is vectorized over column arrays built once from the results. Only
+tiles inside the requested viewport are returned, and the zoom is lowered
+until the viewport spans at most `max_cells` tiles, so the payload is bounded
+by the viewport rather than by the number of profiles.
+"""
+
+import importlib
+import logging
+import math
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Deepest zoom served; tile ids (x * 2^zoom + y) stay well inside int64
+MAX_ZOOM = 23
+
+# Web Mercator is undefined at the poles
+MAX_LATITUDE = 85.05112878
+
+# Columns binned per tile: output name -> profile_arrays key
+BINNED_VARIABLES = {
+    "temperature": "temperature",
+    "salinity": "salinity",
+    "mixed_layer_depth": "mld",
+}
+
+def _numpy():
+    # Deferred like the pipeline's other heavy imports, so that importing the pipeline stays cheap
+    return importlib.import_module("numpy")
+
+@dataclass(frozen=True)
+class Viewport:
+    """Map bounds in degrees; west > east crosses the antimeridian"""
+    south: float
+    west: float
+    north: float
+    east: float
+
+    @classmethod
+    def parse(cls, value: Any) -> "Viewport":
+        """Viewport from [south, west, north, east] or a dict with those keys"""
+        try:
+            if isinstance(value, dict):
+                south, west, north, east = (float(value[key]) for key in ("south", "west", "north", "east"))
+            else:
+                south, west, north, east = (float(v) for v in value)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("'viewport' must be [south, west, north, east] in degrees")
+        if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+            raise ValueError(f"Invalid viewport {[south, west, north, east]}")
+        return cls(south, west, north, east)
+
+@dataclass(frozen=True)
+class BinningRequest:
+    """Per-request spatial binning options"""
+    zoom: int
+    viewport: Optional[Viewport] = None
+
+    @classmethod
+    def parse(cls, value: Any) -> "BinningRequest":
+        """Options from a request payload such as {"zoom": 5, "viewport": [south, west, north, east]}"""
+        if not isinstance(value, dict):
+            raise ValueError("'binning' must be an object with a 'zoom' and an optional 'viewport'")
+        zoom = value.get("zoom")
+        if not isinstance(zoom, int) or isinstance(zoom, bool) or not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError(f"'binning.zoom' must be an integer between 0 and {MAX_ZOOM}")
+        viewport = value.get("viewport")
+        return cls(zoom, Viewport.parse(viewport) if viewport is not None else None)
+
+def profile_arrays(results: Sequence[Any]) -> Dict[str, Any]:
+    """Column arrays of the fields binning needs, NaN where a value is missing"""
+    np = _numpy()
+
+    def column(values) -> Any:
+        return np.fromiter((np.nan if v is None else v for v in values), dtype=np.float64, count=len(results))
+
+    return {
+        "lat": column(r.location.get('latitude') for r in results),
+        "lon": column(r.location.get('longitude') for r in results),
+        "temperature": column(r.variables.get('temperature', {}).get('surface') for r in results),
+        "salinity": column(r.variables.get('salinity', {}).get('surface') for r in results),
+        "mld": column(r.variables.get('mixed_layer_depth') for r in results),
+    }
+
+def tile_xy(lat, lon, zoom: int):
+    """Web Mercator tile coordinates of each point"""
+    np = _numpy()
+    n = 1 << zoom
+    lat_rad = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((np.asarray(lon) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+def quadkeys(x, y, zoom: int) -> List[str]:
+    """Quadkey of each tile, most significant digit first"""
+    np = _numpy()
+    if zoom == 0:
+        return [""] * len(x)
+    shifts = np.arange(zoom - 1, -1, -1, dtype=np.int64)
+    digits = ((x[:, None] >> shifts) & 1) + 2 * ((y[:, None] >> shifts) & 1)
+    return ["".join(map(str, row)) for row in digits.tolist()]
+
+def tiles_spanned(viewport: Optional[Viewport], zoom: int) -> int:
+    """Number of tiles a viewport covers at a zoom level"""
+    np = _numpy()
+    n = 1 << zoom
+    if viewport is None:
+        return n * n
+    x, y = tile_xy(np.array([viewport.north, viewport.south]), np.array([viewport.west, viewport.east]), zoom)
+    columns = int(x[1] - x[0]) + 1 if viewport.west <= viewport.east else int(n - x[0] + x[1]) + 1
+    return min(columns, n) * (int(y[1] - y[0]) + 1)
+
+def fit_zoom(viewport: Optional[Viewport], zoom: int, max_cells: int) -> int:
+    """Highest zoom, at most `zoom`, at which the viewport spans no more than `max_cells` tiles"""
+    zoom = min(zoom, MAX_ZOOM)
+    while zoom > 0 and tiles_spanned(viewport, zoom) > max_cells:
+        zoom -= 1
+    return zoom
+
+def _round(value: float, digits: int = 4) -> Optional[float]:
+    return None if math.isnan(value) else round(value, digits)
+
+def bin_profiles(arrays: Dict[str, Any], request: BinningRequest, max_cells: int) -> Dict[str, Any]:
+    """Aggregate profiles per map tile inside the viewport
+
+    `arrays` are the columns from `profile_arrays`. Module-level so that it
+    can run in an offload worker on shared-memory arrays.
+    """
+    np = _numpy()
+    viewport = request.viewport
+    zoom = fit_zoom(viewport, request.zoom, max_cells)
+    lat, lon = arrays["lat"], arrays["lon"]
+
+    mask = ~(np.isnan(lat) | np.isnan(lon))
+    if viewport is not None:
+        mask &= (lat >= viewport.south) & (lat <= viewport.north)
+        if viewport.west <= viewport.east:
+            mask &= (lon >= viewport.west) & (lon <= viewport.east)
+        else:
+            mask &= (lon >= viewport.west) | (lon <= viewport.east)
+
+    x, y = tile_xy(lat[mask], lon[mask], zoom)
+    tiles, inverse = np.unique(x * (1 << zoom) + y, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(tiles))
+    centroid_lat = np.bincount(inverse, weights=lat[mask], minlength=len(tiles)) / np.maximum(counts, 1)
+    centroid_lon = np.bincount(inverse, weights=lon[mask], minlength=len(tiles)) / np.maximum(counts, 1)
+
+    means = {}
+    for name, key in BINNED_VARIABLES.items():
+        values = arrays[key][mask]
+        present = ~np.isnan(values)
+        sums = np.bincount(inverse[present], weights=values[present], minlength=len(tiles))
+        observed = np.bincount(inverse[present], minlength=len(tiles))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means[name] = np.where(observed > 0, sums / observed, np.nan)
+
+    tile_x, tile_y = tiles // (1 << zoom), tiles % (1 << zoom)
+    cells = []
+    for i, quadkey in enumerate(quadkeys(tile_x, tile_y, zoom)):
+        cell = {
+            "quadkey": quadkey,
+            "x": int(tile_x[i]),
+            "y": int(tile_y[i]),
+            "count": int(counts[i]),
+            "centroid": [_round(float(centroid_lat[i])), _round(float(centroid_lon[i]))],
+        }
+        for name in BINNED_VARIABLES:
+            cell[name] = _round(float(means[name][i]))
+        cells.append(cell)
+
+    return {
+        "zoom": zoom,
+        "requested_zoom": request.zoom,
+        "viewport": [viewport.south, viewport.west, viewport.north, viewport.east] if viewport else None,
+        "total_profiles": int(len(lat)),
+        "binned_profiles": int(mask.sum()),
+        "cells": cells,
+    }
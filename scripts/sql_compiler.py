@@ -0,0 +1,556 @@
+"""
+Deterministic rule-based SQL compiler for common ARGO query shapes.
+
+Turns simple structured questions - thresholds on surface temperature,
+salinity, mixed layer depth or heat content, date ranges, latitude/longitude
+boxes, named basins, monsoon seasons, "top N", counts and averages - into
+parameterized SQL against the real `argo_profiles` columns. Queries the
+compiler cannot fully account for return None so the caller can fall back
+to LLM-based generation.
+"""
+
+import calendar
+import re
+from dataclasses import dataclass, field
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+# Columns of the argo_profiles table (scripts/create_argo_schema.sql)
+PROFILE_COLUMNS = [
+    "id", "file", "date", "lat", "lon", "mld", "thermoclinedepth",
+    "salinitymindepth", "salinitymaxdepth", "meanstratification",
+    "ohc_0_200m", "surfacetemp", "surfacesal", "n_levels", "direction",
+]
+
+# Natural language names for the numeric measurement columns
+METRIC_SYNONYMS = [
+    (r"surface\s+temperature|sea\s+surface\s+temperature|temperature|temp|sst", "surfacetemp"),
+    (r"surface\s+salinity|sea\s+surface\s+salinity|salinity|sss", "surfacesal"),
+    (r"mixed\s+layer\s+depth|mixed\s+layer|mld", "mld"),
+    (r"thermocline\s+depth|thermocline", "thermoclinedepth"),
+    (r"ocean\s+heat\s+content|heat\s+content|ohc", "ohc_0_200m"),
+    (r"stratification", "meanstratification"),
+]
+METRIC_PATTERN = "|".join(f"(?:{pattern})" for pattern, _ in METRIC_SYNONYMS)
+
+# Approximate bounding boxes (lat_min, lat_max, lon_min, lon_max); a box whose
+# lon_min exceeds lon_max wraps across the antimeridian
+REGIONS: Dict[str, Tuple[float, float, float, float]] = {
+    "arabian sea": (0.0, 25.0, 50.0, 78.0),
+    "bay of bengal": (5.0, 23.0, 78.0, 100.0),
+    "andaman sea": (5.0, 20.0, 92.0, 99.0),
+    "laccadive sea": (5.0, 14.0, 71.0, 78.0),
+    "equatorial indian ocean": (-10.0, 10.0, 40.0, 100.0),
+    "northern indian ocean": (-10.0, 30.0, 30.0, 110.0),
+    "southern indian ocean": (-60.0, -20.0, 20.0, 147.0),
+    "indian ocean": (-60.0, 30.0, 20.0, 147.0),
+    "north atlantic": (0.0, 70.0, -80.0, 0.0),
+    "south atlantic": (-60.0, 0.0, -70.0, 20.0),
+    "atlantic": (-60.0, 70.0, -80.0, 20.0),
+    "north pacific": (0.0, 60.0, 120.0, -100.0),
+    "south pacific": (-60.0, 0.0, 150.0, -70.0),
+    "pacific": (-60.0, 60.0, 120.0, -70.0),
+    "southern ocean": (-90.0, -60.0, -180.0, 180.0),
+}
+
+# Monsoon periods by month, as classified by the MCP server
+MONSOON_MONTHS = {
+    "southwest monsoon": (6, 7, 8, 9),
+    "northeast monsoon": (12, 1, 2),
+    "inter-monsoon": (3, 4, 5, 10, 11),
+}
+MONSOON_ALIASES = [
+    (r"(?:sw|south[\s-]?west)\s+monsoon", "southwest monsoon"),
+    (r"(?:ne|north[\s-]?east)\s+monsoon", "northeast monsoon"),
+    (r"inter[\s-]?monsoon", "inter-monsoon"),
+]
+
+MONTHS = {name.lower(): index for index, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): index for index, name in enumerate(calendar.month_abbr) if name})
+MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+
+COMPARATORS = [
+    (r">=|at\s+least|no\s+less\s+than", ">="),
+    (r"<=|at\s+most|no\s+more\s+than", "<="),
+    (r">|above|over|greater\s+than|more\s+than|higher\s+than|exceeding|warmer\s+than", ">"),
+    (r"<|below|under|less\s+than|lower\s+than|colder\s+than|cooler\s+than", "<"),
+    (r"=|equal\s+to|equals", "="),
+]
+COMPARATOR_PATTERN = "|".join(f"(?:{pattern})" for pattern, _ in COMPARATORS)
+
+AGGREGATES = [
+    (r"\b(?:average|mean|avg)\b", "avg"),
+    (r"\b(?:maximum|max)\b", "max"),
+    (r"\b(?:minimum|min)\b", "min"),
+    (r"\b(?:total|sum)\s+(?:of\s+)?(?=" + METRIC_PATTERN + ")", "sum"),
+]
+
+SUPERLATIVES = [
+    (r"warmest|hottest|highest\s+temperature", "surfacetemp", "DESC"),
+    (r"coldest|coolest|lowest\s+temperature", "surfacetemp", "ASC"),
+    (r"saltiest|most\s+saline|highest\s+salinity", "surfacesal", "DESC"),
+    (r"freshest|least\s+saline|lowest\s+salinity", "surfacesal", "ASC"),
+    (r"deepest\s+mixed\s+layers?|deepest\s+mld", "mld", "DESC"),
+    (r"shallowest\s+mixed\s+layers?|shallowest\s+mld", "mld", "ASC"),
+    (r"most\s+recent|latest|newest", "date", "DESC"),
+    (r"oldest|earliest", "date", "ASC"),
+]
+
+# Phrases that need semantic understanding or columns the table does not have
+UNSUPPORTED = re.compile(
+    r"\b(similar|like|compare|comparison|versus|vs\.?|trend|trends|anomal\w*|unusual|why|how\s+does|explain|"
+    r"pattern\w*|correlat\w*|impact|signature\w*|platform|float|cycle|quality|flag|depth\s+of|profile\s+at|"
+    r"upwelling|eddy|eddies|front|current|el\s+ni\w+|la\s+ni\w+)\b"
+)
+
+# Negation, disjunction and exclusion change a query's meaning in ways the
+# conjunctive grammar below cannot express
+NEGATION = re.compile(
+    r"\b(?:or|nor|not|never|none|except|excluding|exclude|without|unless|outside|other\s+than)\b"
+    r"|\bno\b(?!\s+(?:more|less)\s+than)|n't\b"
+)
+
+# Units the stored columns are not in; converting them is left to the LLM
+FOREIGN_UNITS = re.compile(r"\b(?:fahrenheit|kelvin|feet|ft|fathoms?)\b")
+
+# Units accepted after a threshold, per column; the columns are stored in these units
+COLUMN_UNITS = {
+    "surfacetemp": r"degrees?(?:\s+(?:celsius|c))?|celsius|deg\s*c",
+    "surfacesal": r"psu",
+    "mld": r"meters?|metres?|m",
+    "thermoclinedepth": r"meters?|metres?|m",
+}
+UNIT = rf"(?:\s*({'|'.join(dict.fromkeys(COLUMN_UNITS.values()))})\b)?"
+
+# Words that carry no constraint of their own; any other word left over after
+# parsing means the query says something the compiler did not understand
+FILLER_WORDS = frozenset("""
+    a all an and any are area argo at available basin be can could data did do does during entries every fetch
+    find for found from get give had has have having i in is it its list located me measured measurement
+    measurements observations observed of on please profile profiles provide recorded record records region
+    results retrieve return row rows s see show taken that the their there these those to value values want
+    was we were what where which whose with within
+""".split())
+
+NUMBER = r"-?\d+(?:\.\d+)?"
+
+RANGE_PATTERN = rf"({METRIC_PATTERN})\s+(?:is\s+|of\s+)?(?:between|from)\s+({NUMBER}){UNIT}\s*(?:and|to|-)\s*({NUMBER}){UNIT}"
+
+@dataclass
+class Condition:
+    """One WHERE predicate on a column"""
+    column: str
+    op: str
+    value: Any
+
+@dataclass
+class QueryShape:
+    """Structured interpretation of a simple query"""
+    aggregate: Optional[str] = None
+    metric: Optional[str] = None
+    conditions: List[Condition] = field(default_factory=list)
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    region: Optional[str] = None
+    months: Optional[Tuple[int, ...]] = None
+    monsoon: Optional[str] = None
+    group_by: Optional[str] = None
+    order_by: Optional[Tuple[str, str]] = None
+    limit: Optional[int] = None
+
+    @property
+    def is_aggregate(self) -> bool:
+        """Whether the query asks for an aggregate rather than rows"""
+        return self.aggregate is not None
+
+@dataclass
+class CompiledSQL:
+    """Parameterized SQL produced by the compiler"""
+    sql: str
+    params: Dict[str, Any]
+    shape: QueryShape
+
+    def render(self) -> str:
+        """Inline the validated parameters for tools that take plain SQL"""
+        return self.sql % {name: _sql_literal(value) for name, value in self.params.items()}
+
+def _sql_literal(value: Any) -> str:
+    """Render a compiler-produced parameter as a SQL literal"""
+    if isinstance(value, bool):
+        raise TypeError("Boolean parameters are not supported")
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        return repr(value)
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'"
+    raise TypeError(f"Unsupported SQL parameter type: {type(value).__name__}")
+
+def metric_column(text: str) -> Optional[str]:
+    """Map a natural language metric name onto its column"""
+    for pattern, column in METRIC_SYNONYMS:
+        if re.fullmatch(pattern, text.strip()):
+            return column
+    return None
+
+class RuleBasedSQLCompiler:
+    """Compiles common query shapes into SQL without an LLM round trip"""
+
+    def __init__(self, table: str = "argo_profiles", max_limit: int = 1000):
+        self.table = table
+        self.max_limit = max_limit
+
+    def compile(self, query: str) -> Optional[CompiledSQL]:
+        """Compile a query, or return None when it cannot be fully parsed"""
+        shape = self.parse(query)
+        if shape is None:
+            return None
+        return self.to_sql(shape)
+
+    def parse(self, query: str) -> Optional[QueryShape]:
+        """Interpret a query as a QueryShape, or None if any part is not understood"""
+        text = query.lower().replace("–", "-")
+        text = re.sub(r"°\s*c\b", " celsius", text)
+        text = re.sub(r"°\s*f\b", " fahrenheit", text).replace("°", " degrees")
+        if UNSUPPORTED.search(text) or NEGATION.search(text) or FOREIGN_UNITS.search(text):
+            return None
+
+        shape = QueryShape()
+        consumed: List[Tuple[int, int]] = []
+
+        self._parse_dates(text, shape, consumed)
+        self._parse_coordinates(text, shape, consumed)
+        self._parse_thresholds(text, shape, consumed)
+        self._parse_region(text, shape, consumed)
+        self._parse_monsoon(text, shape, consumed)
+        self._parse_aggregate(text, shape, consumed)
+        self._parse_ordering(text, shape, consumed)
+
+        # Every number and every meaningful word must have been accounted for
+        leftover = list(text)
+        for start, end in consumed:
+            leftover[start:end] = " " * (end - start)
+        leftover = "".join(leftover)
+        if re.search(r"\d", leftover) or any(word not in FILLER_WORDS for word in re.findall(r"[a-z]+", leftover)):
+            return None
+
+        if shape.aggregate and shape.aggregate != "count" and not shape.metric:
+            return None
+
+        has_filter = bool(
+            shape.conditions or shape.date_from or shape.date_to or shape.region or shape.months
+        )
+        if not (has_filter or shape.aggregate or shape.order_by):
+            return None
+
+        return shape
+
+    def _parse_dates(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize ISO dates, years, year ranges and month ranges"""
+        match = re.search(r"(?:from|between)\s+(\d{4}-\d{2}-\d{2})\s+(?:to|and|until|-)\s+(\d{4}-\d{2}-\d{2})", text)
+        if match:
+            shape.date_from = date.fromisoformat(match.group(1))
+            shape.date_to = _next_day(date.fromisoformat(match.group(2)))
+            consumed.append(match.span())
+            return
+
+        match = re.search(r"(after|since|from|before|until)\s+(\d{4}-\d{2}-\d{2})", text)
+        if match:
+            day = date.fromisoformat(match.group(2))
+            if match.group(1) in ("after", "since", "from"):
+                shape.date_from = day
+            else:
+                shape.date_to = day
+            consumed.append(match.span())
+            return
+
+        match = re.search(
+            rf"(?:from|between)\s+({MONTH_PATTERN})\s+(?:to|and|through|-)\s+({MONTH_PATTERN})\s+(\d{{4}})", text
+        )
+        if match:
+            year = int(match.group(3))
+            start_month, end_month = MONTHS[match.group(1)], MONTHS[match.group(2)]
+            if start_month <= end_month:
+                shape.date_from = date(year, start_month, 1)
+                shape.date_to = _month_end(year, end_month)
+                consumed.append(match.span())
+                return
+
+        match = re.search(rf"\b(?:in|during)\s+({MONTH_PATTERN})\s+(\d{{4}})\b", text)
+        if match:
+            year, month = int(match.group(2)), MONTHS[match.group(1)]
+            shape.date_from = date(year, month, 1)
+            shape.date_to = _month_end(year, month)
+            consumed.append(match.span())
+            return
+
+        match = re.search(r"\b(?:from|between)\s+(\d{4})\s*(?:to|and|until|through|-)\s*(\d{4})\b", text) or \
+            re.search(r"\b(\d{4})\s*-\s*(\d{4})\b", text)
+        if match:
+            start_year, end_year = int(match.group(1)), int(match.group(2))
+            if 1900 <= start_year <= end_year <= 2100:
+                shape.date_from = date(start_year, 1, 1)
+                shape.date_to = date(end_year + 1, 1, 1)
+                consumed.append(match.span())
+            return
+
+        match = re.search(r"\b(?:in|during|for|of)\s+(\d{4})\b", text)
+        if match and 1900 <= int(match.group(1)) <= 2100:
+            year = int(match.group(1))
+            shape.date_from = date(year, 1, 1)
+            shape.date_to = date(year + 1, 1, 1)
+            consumed.append(match.span())
+            return
+
+        match = re.search(r"\b(after|since|before)\s+(\d{4})\b", text)
+        if match and 1900 <= int(match.group(2)) <= 2100:
+            year = int(match.group(2))
+            if match.group(1) == "before":
+                shape.date_to = date(year, 1, 1)
+            elif match.group(1) == "after":
+                shape.date_from = date(year + 1, 1, 1)
+            else:
+                shape.date_from = date(year, 1, 1)
+            consumed.append(match.span())
+
+    def _parse_coordinates(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize latitude/longitude ranges and comparisons"""
+        degrees = r"(?:\s*degrees?\b)?"
+        for names, column, low, high in (("latitude|lat", "lat", -90, 90), ("longitude|lon|lng", "lon", -180, 180)):
+            for match in re.finditer(
+                rf"\b(?:{names})\s+(?:between|from)\s+({NUMBER}){degrees}\s*(?:and|to|-)\s*({NUMBER}){degrees}", text
+            ):
+                first, second = sorted((float(match.group(1)), float(match.group(2))))
+                if low <= first and second <= high:
+                    shape.conditions.append(Condition(column, ">=", first))
+                    shape.conditions.append(Condition(column, "<=", second))
+                    consumed.append(match.span())
+
+            for match in re.finditer(rf"\b(?:{names})\s*({COMPARATOR_PATTERN})\s*({NUMBER}){degrees}", text):
+                value = float(match.group(2))
+                if low <= value <= high:
+                    shape.conditions.append(Condition(column, _comparator(match.group(1)), value))
+                    consumed.append(match.span())
+
+    def _parse_thresholds(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize thresholds and ranges on measurement columns"""
+        for match in re.finditer(RANGE_PATTERN, text):
+            column = metric_column(match.group(1))
+            if not _unit_matches(column, match.group(3)) or not _unit_matches(column, match.group(5)):
+                continue
+            first, second = sorted((float(match.group(2)), float(match.group(4))))
+            shape.conditions.append(Condition(column, ">=", first))
+            shape.conditions.append(Condition(column, "<=", second))
+            consumed.append(match.span())
+
+        for match in re.finditer(
+            rf"({METRIC_PATTERN})\s*(?:is\s+|values?\s+)?({COMPARATOR_PATTERN})\s*({NUMBER}){UNIT}(?!\s*(?:-|and|to)\s*\d)",
+            text,
+        ):
+            if any(start <= match.start() < end for start, end in _range_spans(text)):
+                continue
+            column = metric_column(match.group(1))
+            if not _unit_matches(column, match.group(4)):
+                continue
+            shape.conditions.append(Condition(column, _comparator(match.group(2)), float(match.group(3))))
+            consumed.append(match.span())
+
+        # "warmer than 28" without naming the column
+        for match in re.finditer(rf"\b(warmer|hotter|colder|cooler)\s+than\s+({NUMBER}){UNIT}", text):
+            if not _unit_matches("surfacetemp", match.group(3)):
+                continue
+            op = ">" if match.group(1) in ("warmer", "hotter") else "<"
+            shape.conditions.append(Condition("surfacetemp", op, float(match.group(2))))
+            consumed.append(match.span())
+
+        # "above 25°C": a temperature unit names the column
+        for match in re.finditer(
+            rf"\b({COMPARATOR_PATTERN})\s*({NUMBER})\s*(?:{COLUMN_UNITS['surfacetemp']})\b", text
+        ):
+            if _overlaps(match.span(), consumed):
+                continue
+            shape.conditions.append(Condition("surfacetemp", _comparator(match.group(1)), float(match.group(2))))
+            consumed.append(match.span())
+
+        # "temperature profiles" describes the rows rather than filtering them
+        for match in re.finditer(rf"\b(?:{METRIC_PATTERN})\s+(?:profiles?|data|measurements?|readings?)\b", text):
+            if not _overlaps(match.span(), consumed):
+                consumed.append(match.span())
+
+    def _parse_region(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize the most specific named basin"""
+        for name in REGIONS:
+            match = re.search(rf"\b{name}(?:\s+ocean)?\b", text)
+            if match:
+                shape.region = name
+                consumed.append(match.span())
+                return
+
+    def _parse_monsoon(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize monsoon periods"""
+        for pattern, monsoon in MONSOON_ALIASES:
+            match = re.search(rf"\b{pattern}(?:\s+(?:season|period))?\b", text)
+            if match:
+                shape.monsoon = monsoon
+                shape.months = MONSOON_MONTHS[monsoon]
+                consumed.append(match.span())
+                return
+
+    def _parse_aggregate(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize counts, averages, extremes and grouping"""
+        match = re.search(r"\b(?:count|how\s+many|number\s+of)\b", text)
+        if match:
+            shape.aggregate = "count"
+            consumed.append(match.span())
+        else:
+            for pattern, aggregate in AGGREGATES:
+                match = re.search(pattern + rf"\s*(?:of\s+|the\s+)*(?:surface\s+|sea\s+surface\s+)?({METRIC_PATTERN})?", text)
+                if match:
+                    shape.aggregate = aggregate
+                    consumed.append(match.span())
+                    metric_text = match.group(match.lastindex) if match.lastindex else None
+                    if metric_text:
+                        shape.metric = metric_column(metric_text)
+                    else:
+                        metric_match = re.search(rf"\b({METRIC_PATTERN})\b", text)
+                        if metric_match:
+                            shape.metric = metric_column(metric_match.group(1))
+                            consumed.append(metric_match.span())
+                    break
+
+        match = re.search(r"\b(?:by|per|each)\s+(month|year|monsoon(?:\s+period|\s+season)?)\b|\b(monthly|yearly|annual)\b", text)
+        if match and shape.aggregate:
+            unit = match.group(1) or match.group(2)
+            if unit.startswith("monsoon"):
+                shape.group_by = "monsoon"
+            else:
+                shape.group_by = "month" if unit.startswith("month") else "year"
+            consumed.append(match.span())
+
+    def _parse_ordering(self, text: str, shape: QueryShape, consumed: List[Tuple[int, int]]):
+        """Recognize "top N", "N profiles", superlatives and explicit sorting"""
+        match = re.search(r"\b(?:top|first|last|latest)\s+(\d+)\b", text)
+        if match:
+            consumed.append(match.span())
+        else:
+            # Only the count is consumed; any words before the noun still have to be understood
+            match = re.search(r"\b(\d+)\s+(?:\w+\s+){0,2}?(?:profiles?|records?|rows?|measurements?|results?)\b", text)
+            if match:
+                consumed.append(match.span(1))
+        if match:
+            shape.limit = min(int(match.group(1)), self.max_limit)
+
+        for pattern, column, direction in SUPERLATIVES:
+            match = re.search(rf"\b(?:{pattern})\b", text)
+            if match:
+                shape.order_by = (column, direction)
+                consumed.append(match.span())
+                break
+
+        match = re.search(rf"\b(?:sorted|ordered|order|sort)\s+by\s+({METRIC_PATTERN}|date)\s*(asc\w*|desc\w*)?", text)
+        if match:
+            column = "date" if match.group(1) == "date" else metric_column(match.group(1))
+            direction = "ASC" if (match.group(2) or "").startswith("asc") else "DESC"
+            shape.order_by = (column, direction)
+            consumed.append(match.span())
+
+        if shape.order_by and not shape.limit and not shape.aggregate:
+            shape.limit = 10
+
+    def to_sql(self, shape: QueryShape) -> CompiledSQL:
+        """Render a QueryShape as parameterized PostgreSQL"""
+        params: Dict[str, Any] = {}
+        where: List[str] = []
+
+        def param(value: Any) -> str:
+            name = f"p{len(params)}"
+            params[name] = value
+            return f"%({name})s"
+
+        for condition in shape.conditions:
+            where.append(f"{condition.column} {condition.op} {param(condition.value)}")
+        if shape.metric and shape.aggregate:
+            where.append(f"{shape.metric} IS NOT NULL")
+        if shape.date_from:
+            where.append(f"date >= {param(shape.date_from)}")
+        if shape.date_to:
+            where.append(f"date < {param(shape.date_to)}")
+        if shape.region:
+            lat_min, lat_max, lon_min, lon_max = REGIONS[shape.region]
+            where.append(f"lat BETWEEN {param(lat_min)} AND {param(lat_max)}")
+            if lon_min <= lon_max:
+                where.append(f"lon BETWEEN {param(lon_min)} AND {param(lon_max)}")
+            else:
+                where.append(f"(lon >= {param(lon_min)} OR lon <= {param(lon_max)})")
+        if shape.months:
+            where.append(f"EXTRACT(MONTH FROM date) IN ({', '.join(param(month) for month in shape.months)})")
+
+        group_expr = {
+            "month": "date_trunc('month', date)",
+            "year": "date_trunc('year', date)",
+            "monsoon": (
+                "CASE WHEN EXTRACT(MONTH FROM date) BETWEEN 6 AND 9 THEN 'southwest monsoon' "
+                "WHEN EXTRACT(MONTH FROM date) IN (12, 1, 2) THEN 'northeast monsoon' "
+                "ELSE 'inter-monsoon' END"
+            ),
+        }.get(shape.group_by)
+
+        if shape.aggregate == "count":
+            select = ["COUNT(*) AS count"]
+        elif shape.aggregate:
+            select = [
+                f"{shape.aggregate.upper()}({shape.metric}) AS {shape.aggregate}_{shape.metric}",
+                f"COUNT({shape.metric}) AS count",
+            ]
+        else:
+            select = PROFILE_COLUMNS
+
+        if group_expr:
+            select = [f"{group_expr} AS {shape.group_by}"] + select
+
+        sql = f"SELECT {', '.join(select)} FROM {self.table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if group_expr:
+            sql += " GROUP BY 1 ORDER BY 1"
+        elif shape.order_by and not shape.aggregate:
+            column, direction = shape.order_by
+            nulls = " NULLS LAST" if direction == "DESC" else ""
+            sql += f" ORDER BY {column} {direction}{nulls}"
+        elif not shape.aggregate:
+            sql += " ORDER BY date DESC"
+        if shape.limit and not shape.aggregate:
+            sql += f" LIMIT {param(shape.limit)}"
+
+        return CompiledSQL(sql=sql, params=params, shape=shape)
+
+def _comparator(text: str) -> str:
+    """Normalize a natural language comparator"""
+    text = re.sub(r"\s+", " ", text.strip())
+    for pattern, op in COMPARATORS:
+        if re.fullmatch(pattern, text):
+            return op
+    return "="
+
+def _range_spans(text: str) -> List[Tuple[int, int]]:
+    """Spans of range expressions already parsed for a metric"""
+    return [match.span() for match in re.finditer(RANGE_PATTERN, text)]
+
+def _overlaps(span: Tuple[int, int], consumed: List[Tuple[int, int]]) -> bool:
+    """Whether a span overlaps any consumed span"""
+    return any(span[0] < end and start < span[1] for start, end in consumed)
+
+def _unit_matches(column: str, unit: Optional[str]) -> bool:
+    """Whether a unit written after a threshold is the column's own unit"""
+    if unit is None:
+        return True
+    pattern = COLUMN_UNITS.get(column)
+    return bool(pattern and re.fullmatch(pattern, unit))
+
+def _next_day(day: date) -> date:
+    """The day after `day`, used for exclusive upper bounds"""
+    return date.fromordinal(day.toordinal() + 1)
+
+def _month_end(year: int, month: int) -> date:
+    """Exclusive upper bound for a calendar month"""
+    return date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
@@ -0,0 +1,245 @@
+"""
+SQL guardrail and rewrite layer for generated queries.
+
+Runs between SQL generation and `queryARGO`: rejects anything that is not a
+single read-only SELECT, maps legacy column names onto the real
+`argo_profiles` columns, projects only the columns the result converters
+read, strips the generated LIMIT/OFFSET (the MCP server appends its own) and
+folds it into the page size, and bounds unfiltered full-table scans.
+"""
+
+import logging
+import re
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from sql_compiler import PROFILE_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Legacy and LLM-invented column names mapped onto argo_profiles columns
+COLUMN_ALIASES = {
+    "surface_temp": "surfacetemp",
+    "surface_temperature": "surfacetemp",
+    "temperature": "surfacetemp",
+    "surface_sal": "surfacesal",
+    "surface_salinity": "surfacesal",
+    "salinity": "surfacesal",
+    "latitude": "lat",
+    "longitude": "lon",
+    "thermocline_depth": "thermoclinedepth",
+    "salinity_min_depth": "salinitymindepth",
+    "salinity_max_depth": "salinitymaxdepth",
+    "mean_stratification": "meanstratification",
+    "mixed_layer_depth": "mld",
+    "ohc": "ohc_0_200m",
+    "profile_date": "date",
+    "timestamp": "date",
+    "juld": "date",
+    "n_prof_levels": "n_levels",
+}
+
+# Columns the RAG pipeline's result converters read
+PROJECTED_COLUMNS = [
+    "id", "file", "date", "lat", "lon", "mld", "thermoclinedepth", "salinitymindepth",
+    "salinitymaxdepth", "meanstratification", "ohc_0_200m", "surfacetemp", "surfacesal",
+]
+
+# Columns the old schema had but argo_profiles does not
+MISSING_COLUMNS = {"platform_number", "cycle_number", "quality_flag", "data_mode", "pressure"}
+
+FORBIDDEN_KEYWORDS = re.compile(
+    r"\b(insert|update|delete|drop|alter|create|truncate|grant|revoke|copy|merge|call|execute|"
+    r"vacuum|into|pg_sleep|set)\b",
+    re.IGNORECASE,
+)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+TRAILING_LIMIT = re.compile(
+    r"\s+limit\s+(\d+)(?:\s+offset\s+(\d+))?\s*$|\s+offset\s+(\d+)(?:\s+limit\s+(\d+))?\s*$", re.IGNORECASE
+)
+SELECT_ALIAS = re.compile(r"\bas\s+([a-z_][a-z0-9_]*)", re.IGNORECASE)
+ORDER_BY_KEYWORDS = {"asc", "desc", "nulls", "first", "last"}
+AGGREGATE_CALL = re.compile(r"\b(count|sum|avg|min|max|stddev|variance|percentile_cont|array_agg)\s*\(", re.IGNORECASE)
+
+class SQLGuardrailError(ValueError):
+    """Raised when generated SQL cannot be made safe to execute"""
+    pass
+
+@dataclass
+class GuardedSQL:
+    """SQL rewritten for execution together with its pagination"""
+    sql: str
+    page: int
+    page_size: int
+    rewrites: List[str] = field(default_factory=list)
+
+class SQLGuard:
+    """Validates and rewrites generated SQL before it reaches queryARGO"""
+
+    def __init__(self, table: str = "argo_profiles", max_page_size: int = 500, unbounded_scan_limit: int = 50):
+        self.table = table
+        self.max_page_size = max_page_size
+        self.unbounded_scan_limit = unbounded_scan_limit
+
+    def rewrite(self, sql: str, page_size: int = 100) -> GuardedSQL:
+        """Validate `sql` and return the rewritten query and pagination"""
+        rewrites: List[str] = []
+        sql = self._strip_comments(sql).strip().rstrip(";").strip()
+
+        if not sql:
+            raise SQLGuardrailError("Empty SQL query")
+        if ";" in self._code(sql):
+            raise SQLGuardrailError("Multiple SQL statements are not allowed")
+        if not re.match(r"select\b", sql, re.IGNORECASE):
+            raise SQLGuardrailError("Only SELECT queries are allowed")
+
+        keyword = FORBIDDEN_KEYWORDS.search(self._code(sql))
+        if keyword:
+            raise SQLGuardrailError(f"Forbidden SQL keyword: {keyword.group(1).upper()}")
+
+        normalized = self._normalize_columns(sql)
+        if normalized != sql:
+            rewrites.append("normalized_columns")
+            sql = normalized
+
+        select_list, rest = self._split_select(sql)
+        code_rest = self._code(rest).lower()
+
+        if not re.search(rf"\bfrom\s+(?:public\.)?{self.table}\b", code_rest):
+            raise SQLGuardrailError(f"Queries must read from {self.table}")
+
+        missing = sorted(
+            column for column in MISSING_COLUMNS if re.search(rf"\b{column}\b", code_rest)
+        )
+        if missing:
+            raise SQLGuardrailError(f"Unknown column(s) for {self.table}: {', '.join(missing)}")
+
+        is_aggregate = bool(AGGREGATE_CALL.search(select_list)) or " group by " in f" {code_rest} "
+        # ORDER BY on a select alias, expression or position needs the original select list
+        if not is_aggregate and not re.search(r"^\s*distinct\b", select_list, re.IGNORECASE) \
+                and not self._orders_by_output(rest):
+            projection = ", ".join(PROJECTED_COLUMNS)
+            if select_list.strip() != projection:
+                rewrites.append("projected_columns")
+                select_list = projection
+
+        # queryARGO appends "LIMIT page_size OFFSET offset" itself
+        limit, offset = None, None
+        match = TRAILING_LIMIT.search(rest)
+        if match:
+            limit = match.group(1) or match.group(4)
+            offset = match.group(2) or match.group(3)
+            rest = rest[:match.start()]
+            rewrites.append("merged_limit")
+        if re.search(r"\b(limit|offset)\b", self._code(rest), re.IGNORECASE):
+            raise SQLGuardrailError("LIMIT/OFFSET is only supported at the end of the query")
+
+        page_size = min(page_size, self.max_page_size)
+        if limit is not None:
+            page_size = min(page_size, int(limit))
+        page_size = max(page_size, 1)
+
+        has_filter = re.search(r"\bwhere\b", self._code(rest), re.IGNORECASE) is not None
+        if not is_aggregate and not has_filter and limit is None:
+            page_size = min(page_size, self.unbounded_scan_limit)
+            rewrites.append("bounded_full_scan")
+            if not re.search(r"\border\s+by\b", self._code(rest), re.IGNORECASE):
+                rest = f"{rest} ORDER BY date DESC"
+
+        page = 1
+        if offset is not None and int(offset) > 0:
+            if int(offset) % page_size:
+                raise SQLGuardrailError(f"OFFSET {offset} is not a multiple of the page size {page_size}")
+            page = int(offset) // page_size + 1
+
+        rewritten = f"SELECT {select_list.strip()} {rest.strip()}"
+        if rewrites:
+            logger.info(f"SQL guardrail rewrites: {', '.join(rewrites)}")
+        return GuardedSQL(sql=rewritten, page=page, page_size=page_size, rewrites=rewrites)
+
+    def _strip_comments(self, sql: str) -> str:
+        """Remove SQL comments outside string literals"""
+        return self._map_code(sql, lambda code: re.sub(r"--[^\n]*|/\*.*?\*/", " ", code, flags=re.DOTALL))
+
+    def _normalize_columns(self, sql: str) -> str:
+        """Map legacy column names onto the real ones outside string literals
+
+        Names defined with AS are output aliases, not columns: they are left
+        alone, and so are references to them in the top-level ORDER BY.
+        """
+        names = "|".join(COLUMN_ALIASES)
+        pattern = re.compile(rf"(\bas\s+)?\b({names})\b(?!\s*\()", re.IGNORECASE)
+        aliases = {name.lower() for name in SELECT_ALIAS.findall(self._code(sql))}
+
+        def transform(keep: set):
+            def replace(match: re.Match) -> str:
+                if match.group(1) or match.group(2).lower() in keep:
+                    return match.group(0)
+                return COLUMN_ALIASES[match.group(2).lower()]
+            return lambda code: pattern.sub(replace, code)
+
+        order_by = self._order_by_start(sql)
+        if order_by is None:
+            return self._map_code(sql, transform(set()))
+        return self._map_code(sql[:order_by], transform(set())) + self._map_code(sql[order_by:], transform(aliases))
+
+    def _orders_by_output(self, rest: str) -> bool:
+        """Whether the top-level ORDER BY uses anything but table columns"""
+        start = self._order_by_start(rest)
+        if start is None:
+            return False
+        clause = TRAILING_LIMIT.sub("", self._code(rest)[start:]).lower()
+        clause = re.sub(r"^order\s+by\b", "", clause)
+        # ORDER BY 2 sorts by the second output column
+        if re.search(r"(?:^|,)\s*\d+\s*(?:asc|desc|nulls|,|$)", clause):
+            return True
+        for match in re.finditer(r"([a-z_][a-z0-9_]*)(\s*\()?", clause):
+            name, call = match.groups()
+            if not call and name not in ORDER_BY_KEYWORDS and name not in PROFILE_COLUMNS:
+                return True
+        return False
+
+    def _order_by_start(self, sql: str) -> Optional[int]:
+        """Offset of the outermost query's last ORDER BY, if any"""
+        depth = 0
+        start = None
+        for match in re.finditer(r"\(|\)|\border\s+by\b", self._code(sql), re.IGNORECASE):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0:
+                start = match.start()
+        return start
+
+    def _split_select(self, sql: str) -> Tuple[str, str]:
+        """Split a query into its select list and the remainder starting at FROM"""
+        depth = 0
+        code = self._code(sql)
+        for match in re.finditer(r"\(|\)|\bfrom\b", code, re.IGNORECASE):
+            token = match.group(0)
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+            elif depth == 0:
+                return sql[len("select"):match.start()], sql[match.start():]
+        raise SQLGuardrailError("Query has no FROM clause")
+
+    @staticmethod
+    def _code(sql: str) -> str:
+        """The query with string literal contents blanked out, same length"""
+        return STRING_LITERAL.sub(lambda m: "'" + " " * (len(m.group(0)) - 2) + "'", sql)
+
+    @staticmethod
+    def _map_code(sql: str, transform) -> str:
+        """Apply `transform` to the parts of the query outside string literals"""
+        parts: List[str] = []
+        position = 0
+        for match in STRING_LITERAL.finditer(sql):
+            parts.append(transform(sql[position:match.start()]))
+            parts.append(match.group(0))
+            position = match.end()
+        parts.append(transform(sql[position:]))
+        return "".join(parts)
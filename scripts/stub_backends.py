@@ -0,0 +1,294 @@
+"""
+Local stand-ins for the OpenAI and MCP backends.
+
+The stubs reproduce the response shapes the pipeline and agent parse, with a
+configurable service-time distribution, a concurrency capacity (requests
+beyond it queue, as they would at a rate-limited provider or a database
+connection pool), an optional error rate and, for the LLM, optional
+requests- and tokens-per-minute quotas answered with 429s like a provider's. They let load tests and
+benchmarks exercise RAGPipeline and ProductionARGOLLMAgent end to end
+without network access or API keys.
+"""
+
+import asyncio
+import json
+import random
+import time
+import zlib
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from llm_scheduler import ScheduledLLMClient, TokenBucket
+from rag_config import RAGConfig
+
+class StubBackendError(Exception):
+    """Injected backend failure"""
+    pass
+
+class StubRateLimitError(StubBackendError):
+    """Quota exceeded, shaped like the provider SDK's 429 error"""
+    status_code = 429
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"Rate limit exceeded, retry after {retry_after:.2f}s")
+        self.retry_after = retry_after
+
+@dataclass
+class BackendProfile:
+    """Service-time model for one stub backend"""
+    median_latency: float = 0.1
+    sigma: float = 0.3
+    capacity: int = 32
+    error_rate: float = 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        """Draw a log-normally distributed service time"""
+        return self.median_latency * rng.lognormvariate(0.0, self.sigma) if self.median_latency > 0 else 0.0
+
+class _StubBackend:
+    """Shared capacity, latency and accounting for a stub"""
+
+    def __init__(self, profile: BackendProfile, seed: Optional[int] = None):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self._slots = asyncio.Semaphore(profile.capacity)
+        self.calls = 0
+        self.errors = 0
+        self.queue_wait = 0.0
+        self.busy_time = 0.0
+
+    async def _serve(self, service_time: Optional[float] = None):
+        """Wait for a free slot, then occupy it for one service time"""
+        self.calls += 1
+        queued = time.monotonic()
+        async with self._slots:
+            started = time.monotonic()
+            self.queue_wait += started - queued
+            await asyncio.sleep(self.profile.sample(self.rng) if service_time is None else service_time)
+            self.busy_time += time.monotonic() - started
+
+        if self.profile.error_rate and self.rng.random() < self.profile.error_rate:
+            self.errors += 1
+            raise StubBackendError("Injected backend failure")
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-backend counters"""
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_queue_wait": self.queue_wait / self.calls if self.calls else 0.0,
+            "busy_time": self.busy_time,
+        }
+
+    def reset_stats(self):
+        """Clear counters between load levels"""
+        self.calls = self.errors = 0
+        self.queue_wait = self.busy_time = 0.0
+
+def _completion(content: str, total_tokens: int) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+                           usage=SimpleNamespace(total_tokens=total_tokens))
+
+def _chunk(content: str) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+class StubLLM(_StubBackend):
+    """Drop-in for AsyncOpenAI's chat completions as used by the pipeline and agent"""
+
+    def __init__(self, profile: Optional[BackendProfile] = None, seed: Optional[int] = None,
+                 stream_chunk_chars: int = 24, requests_per_minute: int = 0, tokens_per_minute: int = 0,
+                 burst_seconds: float = 10.0):
+        super().__init__(profile or BackendProfile(median_latency=0.2, capacity=32), seed)
+        self.stream_chunk_chars = stream_chunk_chars
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.request_quota = (
+            TokenBucket(requests_per_minute, max(1.0, requests_per_minute * burst_seconds / 60))
+            if requests_per_minute > 0 else None
+        )
+        self.token_quota = (
+            TokenBucket(tokens_per_minute, max(1.0, tokens_per_minute * burst_seconds / 60))
+            if tokens_per_minute > 0 else None
+        )
+        self.rate_limited = 0
+
+    async def create(self, model: str = "", messages: List[Dict[str, str]] = (), stream: bool = False, **kwargs):
+        """Answer a chat completion request after a simulated generation time"""
+        content = self.reply(list(messages))
+        # Four characters per token, plus per-message framing
+        total_tokens = (sum(len(m.get("content") or "") for m in messages) + len(content)) // 4 + 4 * len(messages)
+        self._charge_quota(total_tokens)
+        if not stream:
+            await self._serve()
+            return _completion(content, total_tokens)
+
+        # Streams deliver the first token after a fraction of the generation time
+        generation = self.profile.sample(self.rng)
+        await self._serve(generation * 0.3)
+        return self._stream(content, generation * 0.7)
+
+    async def _stream(self, content: str, duration: float) -> AsyncIterator[SimpleNamespace]:
+        pieces = [content[i:i + self.stream_chunk_chars] for i in range(0, len(content), self.stream_chunk_chars)]
+        for piece in pieces:
+            await asyncio.sleep(duration / max(len(pieces), 1))
+            yield _chunk(piece)
+
+    def _charge_quota(self, tokens: int):
+        """Reject the request with a 429 when it would exceed a per-minute quota"""
+        waits = []
+        if self.request_quota is not None:
+            waits.append(self.request_quota.delay(1))
+        if self.token_quota is not None:
+            waits.append(self.token_quota.delay(tokens))
+        if any(wait > 0 for wait in waits):
+            self.rate_limited += 1
+            raise StubRateLimitError(max(waits))
+        if self.request_quota is not None:
+            self.request_quota.take(1)
+        if self.token_quota is not None:
+            self.token_quota.take(tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["rate_limited"] = self.rate_limited
+        return stats
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.rate_limited = 0
+
+    def reply(self, messages: List[Dict[str, str]]) -> str:
+        """Deterministic canned reply for the prompt family being served"""
+        system = messages[0]["content"] if messages else ""
+        last = messages[-1]["content"] if messages else ""
+
+        if "Classify the user's query" in system:
+            intent = ("sql", "semantic", "hybrid")[zlib.crc32(last.encode("utf-8")) % 3]
+            return json.dumps({"intent": intent, "confidence": 0.85})
+        if "SQL query generator" in system:
+            return "SELECT * FROM argo_profiles WHERE surfacetemp > 25 ORDER BY date DESC LIMIT 50"
+        if "TOOL_CALL:" in system:
+            if "TOOL RESULTS" in last:
+                return "Stub analysis of the tool results: surface temperatures are typical of the tropical Indian Ocean."
+            return (
+                "I will look this up. TOOL_CALL: "
+                + json.dumps({"tool": "queryARGO", "arguments": {"sql": "SELECT * FROM argo_profiles LIMIT 20"},
+                              "call_id": "stub_sql"})
+                + " and TOOL_CALL: "
+                + json.dumps({"tool": "retrieveARGO", "arguments": {"query": last[:80], "limit": 5},
+                              "call_id": "stub_semantic"})
+                + " Waiting for results."
+            )
+        return "Stub response summarizing the retrieved ARGO profiles."
+
+def synthetic_profiles(count: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Deterministic argo_profiles rows"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        rows.append({
+            "id": i + 1,
+            "file": f"D19{rng.randint(10000, 99999)}_{rng.randint(1, 300):03d}.nc",
+            "date": f"{rng.randint(2005, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z",
+            "lat": round(rng.uniform(-40, 25), 3),
+            "lon": round(rng.uniform(40, 110), 3),
+            "mld": round(rng.uniform(10, 120), 1),
+            "thermoclinedepth": round(rng.uniform(50, 250), 1),
+            "salinitymindepth": round(rng.uniform(20, 150), 1),
+            "salinitymaxdepth": round(rng.uniform(100, 400), 1),
+            "meanstratification": round(rng.uniform(0.002, 0.008), 5),
+            "ohc_0_200m": round(rng.uniform(2e9, 4e9), -6),
+            "surfacetemp": round(rng.uniform(18, 31), 2),
+            "surfacesal": round(rng.uniform(32, 37), 3),
+            "n_levels": rng.randint(50, 200),
+            "direction": "ascending",
+        })
+    return rows
+
+class StubMCPSession(_StubBackend):
+    """Drop-in for the pipeline's MCP client or session pool"""
+
+    def __init__(self, profile: Optional[BackendProfile] = None, seed: Optional[int] = None, max_rows: int = 500):
+        super().__init__(profile or BackendProfile(median_latency=0.05, capacity=8), seed)
+        self.rows = synthetic_profiles(max_rows, seed or 0)
+        self._payloads: Dict[Any, str] = {}
+
+    async def connect(self):
+        pass
+
+    async def disconnect(self):
+        pass
+
+    async def ping(self) -> bool:
+        return True
+
+    async def query_argo_sql(self, sql: str, page: int = 1, page_size: int = 100) -> str:
+        """queryARGO response text"""
+        await self._serve()
+        key = ("sql", page, page_size)
+        if key not in self._payloads:
+            rows = self.rows[(page - 1) * page_size:page * page_size]
+            self._payloads[key] = json.dumps({"data": {"data": rows, "metadata": {"total_count": len(self.rows)}}})
+        return self._payloads[key]
+
+    async def retrieve_argo_semantic(self, query: str, limit: int = 10, offset: int = 0) -> str:
+        """retrieveARGO response text"""
+        await self._serve()
+        key = ("semantic", limit, offset)
+        if key not in self._payloads:
+            rows = self.rows[offset:offset + limit]
+            similarities = [round(0.95 - 0.01 * i, 3) for i in range(offset, offset + len(rows))]
+            self._payloads[key] = json.dumps({"data": {"profiles": rows, "similarities": similarities}})
+        return self._payloads[key]
+
+class StubToolClient(_StubBackend):
+    """Drop-in for the HTTP MCPClient used by ProductionARGOLLMAgent"""
+
+    def __init__(self, profile: Optional[BackendProfile] = None, seed: Optional[int] = None, max_rows: int = 100):
+        super().__init__(profile or BackendProfile(median_latency=0.05, capacity=8), seed)
+        self.rows = synthetic_profiles(max_rows, seed or 0)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    async def _result(self, rows: List[Dict[str, Any]], **extra) -> Dict[str, Any]:
+        await self._serve()
+        return {"success": True, "data": {"data": rows, **extra}, "metadata": {"source": "stub"}}
+
+    async def query_argo(self, sql: str, page: int = 1, page_size: int = 100, **kwargs) -> Dict[str, Any]:
+        return await self._result(self.rows[:page_size])
+
+    async def retrieve_argo(self, query: str, limit: int = 10, **kwargs) -> Dict[str, Any]:
+        rows = self.rows[:limit]
+        return await self._result(rows, similarities=[0.9] * len(rows))
+
+    async def get_argo_by_location(self, **kwargs) -> Dict[str, Any]:
+        return await self._result(self.rows[:10])
+
+    async def get_argo_by_date_range(self, **kwargs) -> Dict[str, Any]:
+        return await self._result(self.rows[:10])
+
+def build_stub_pipeline(llm: StubLLM, mcp: StubMCPSession, config: Optional[RAGConfig] = None):
+    """RAGPipeline wired to stub backends"""
+    from rag_pipeline import RAGPipeline
+
+    config = config or RAGConfig(openai_api_key="stub")
+    pipeline = RAGPipeline.from_config(config)
+    client = ScheduledLLMClient(llm, pipeline.llm_scheduler) if pipeline.llm_scheduler is not None else llm
+    pipeline.openai = client
+    pipeline.intent_classifier.openai = client
+    pipeline.sql_generator.openai = client
+    pipeline.mcp_client = mcp
+    return pipeline
+
+def build_stub_agent(llm: StubLLM, tools: StubToolClient, session_store=None, llm_scheduler=None):
+    """ProductionARGOLLMAgent wired to stub backends"""
+    from mcp_client import ProductionARGOLLMAgent
+
+    agent = ProductionARGOLLMAgent("stub", session_store=session_store, llm_scheduler=llm_scheduler)
+    agent.client = ScheduledLLMClient(llm, llm_scheduler) if llm_scheduler is not None else llm
+    agent._mcp_client = tools
+    return agent
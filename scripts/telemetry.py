@@ -0,0 +1,175 @@
+"""
+Non-blocking structured telemetry for the RAG pipeline and LLM agent.
+
+Hot-path code calls `Telemetry.emit(event, **fields)`, which only builds a
+small dict and hands it to a bounded queue; formatting and I/O happen on a
+background writer thread that drains the queue in batches and appends them
+as JSON lines to a file (or, without a file, passes them to the logger).
+When the queue is full records are dropped and counted rather than making
+the caller wait.
+
+Every record carries the correlation ID of the query it belongs to, held in
+a context variable so that tasks spawned for the query inherit it. Events
+can be sampled per event name; the decision is made per correlation ID, so
+a sampled query keeps all of its events of that kind.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+correlation_id: ContextVar[Optional[str]] = ContextVar("correlation_id", default=None)
+
+_STOP = object()
+
+def new_correlation_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+@contextmanager
+def correlation(cid: Optional[str] = None) -> Iterator[str]:
+    """Tag telemetry emitted within the block, and tasks it spawns, with a correlation ID"""
+    cid = cid or new_correlation_id()
+    token = correlation_id.set(cid)
+    try:
+        yield cid
+    finally:
+        correlation_id.reset(token)
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "event=rate,event=rate" into a sample rate mapping"""
+    rates = {}
+    for item in spec.split(","):
+        if "=" in item:
+            event, rate = item.split("=", 1)
+            rates[event.strip()] = float(rate)
+    return rates
+
+class Telemetry:
+    """Queue-fed, batching JSON-lines event writer"""
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 256, flush_interval: float = 1.0,
+                 max_queue: int = 10000, sample_rates: Optional[Dict[str, float]] = None):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.sample_rates = sample_rates or {}
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+        self.emitted = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+
+    def emit(self, event: str, **fields: Any):
+        """Queue one structured record; never blocks"""
+        cid = correlation_id.get()
+        rate = self.sample_rates.get(event)
+        if rate is not None and rate < 1.0 and not self._sampled(cid, rate):
+            self.sampled_out += 1
+            return
+
+        if self._thread is None:
+            self._start()
+
+        record = {"ts": time.time(), "event": event, "correlation_id": cid}
+        record.update(fields)
+        try:
+            self._queue.put_nowait(record)
+            self.emitted += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        """Write everything queued and stop the writer thread"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Telemetry queue full at shutdown; pending records are lost")
+            return
+        self._thread.join(timeout=timeout)
+        self._thread = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "emitted": self.emitted,
+            "sampled_out": self.sampled_out,
+            "dropped": self.dropped,
+            "written": self.written,
+            "batches": self.batches,
+            "queued": self._queue.qsize(),
+        }
+
+    def _sampled(self, cid: Optional[str], rate: float) -> bool:
+        """Keep a whole query's events together: the decision is a hash of its correlation ID"""
+        key = cid or uuid.uuid4().hex
+        return zlib.crc32(key.encode("ascii")) / 0xFFFFFFFF < rate
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Writer thread: drain the queue in batches"""
+        stopping = False
+        while not stopping:
+            batch: List[Dict[str, Any]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    break
+                batch.append(record)
+
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    logger.error(f"Failed to write {len(batch)} telemetry records: {e}")
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        lines = [json.dumps(record, default=str) for record in batch]
+        if self.path:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        else:
+            for line in lines:
+                logger.info(line)
+        self.written += len(batch)
+        self.batches += 1
+
+_default: Optional[Telemetry] = None
+
+def default_telemetry() -> Telemetry:
+    """Process-wide telemetry for components that are not given their own"""
+    global _default
+    if _default is None:
+        _default = Telemetry(
+            path=os.getenv("TELEMETRY_PATH") or None,
+            sample_rates=parse_sample_rates(os.getenv("TELEMETRY_SAMPLE_RATES", "")),
+        )
+    return _default
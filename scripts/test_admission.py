@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control in front of the pipeline.
+
+Interactive queries are dispatched before batch ones and batch queries are
+held to their share of the slots. A slot granted at the moment its waiter
+times out or is cancelled must never be lost: it is either used or handed
+on to the next waiter.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import admission
+from admission import AdmissionController, AdmissionRejected, Priority
+
+async def _query(controller, name, priority, order, release=None):
+    async with controller.admit(priority):
+        order.append(name)
+        if release is not None:
+            await release.wait()
+
+def _racing_wait_for(monkeypatch, race, error):
+    """Replace the queue wait once: run `race` when it starts, then fail with `error`"""
+    real_wait_for = asyncio.wait_for
+    go = asyncio.Event()
+    raced = []
+
+    async def wait_for(awaitable, timeout):
+        if raced:
+            return await real_wait_for(awaitable, timeout)
+        raced.append(True)
+        awaitable.cancel()
+        await go.wait()
+        race()
+        raise error
+
+    monkeypatch.setattr(admission.asyncio, "wait_for", wait_for)
+    return go
+
+def test_interactive_queries_run_before_batch():
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(_query(controller, "holder", Priority.INTERACTIVE, order, release))
+        await asyncio.sleep(0)
+
+        queued = [
+            asyncio.create_task(_query(controller, "batch", Priority.BATCH, order)),
+            asyncio.create_task(_query(controller, "interactive", Priority.INTERACTIVE, order)),
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(holder, *queued)
+        return order
+
+    assert asyncio.run(run()) == ["holder", "interactive", "batch"]
+
+def test_batch_queries_are_held_to_their_share():
+    async def run():
+        controller = AdmissionController(max_concurrent=4, batch_share=0.5)
+        order, release = [], asyncio.Event()
+        batch = [
+            asyncio.create_task(_query(controller, f"batch {i}", Priority.BATCH, order, release))
+            for i in range(3)
+        ]
+        await asyncio.sleep(0)
+        stats = controller.stats()
+
+        # Two slots stay free for interactive traffic
+        await _query(controller, "interactive", Priority.INTERACTIVE, order)
+        release.set()
+        await asyncio.gather(*batch)
+        return stats, order
+
+    stats, order = asyncio.run(run())
+
+    assert (stats["running"]["batch"], stats["queued"]["batch"]) == (2, 1)
+    assert order == ["batch 0", "batch 1", "interactive", "batch 2"]
+
+def test_interactive_arrival_sheds_the_newest_batch_waiter():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=2)
+        order, release = [], asyncio.Event()
+        holder = asyncio.create_task(_query(controller, "holder", Priority.INTERACTIVE, order, release))
+        await asyncio.sleep(0)
+
+        oldest = asyncio.create_task(_query(controller, "oldest batch", Priority.BATCH, order))
+        newest = asyncio.create_task(_query(controller, "newest batch", Priority.BATCH, order))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(_query(controller, "interactive", Priority.INTERACTIVE, order))
+        await asyncio.sleep(0)
+
+        release.set()
+        results = await asyncio.gather(holder, oldest, newest, interactive, return_exceptions=True)
+        return controller, order, results
+
+    controller, order, results = asyncio.run(run())
+
+    assert isinstance(results[2], AdmissionRejected) and results[2].reason == "shed"
+    assert results[2].retry_after >= admission.MIN_RETRY_AFTER
+    assert order == ["holder", "interactive", "oldest batch"]
+    assert controller.stats()["rejected"] == {"shed": 1}
+
+def test_full_queue_rejects_batch_arrivals():
+    async def run():
+        controller = AdmissionController(max_concurrent=1, max_queue=1)
+        controller._start(Priority.INTERACTIVE, 0.0)
+        waiter = asyncio.create_task(controller._acquire(Priority.BATCH, None))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(Priority.BATCH, None)
+        waiter.cancel()
+        return rejected.value
+
+    assert asyncio.run(run()).reason == "queue_full"
+
+def test_slot_granted_as_the_wait_times_out_is_kept(monkeypatch):
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        controller._start(Priority.INTERACTIVE, 0.0)
+        go = _racing_wait_for(
+            monkeypatch, lambda: controller._release(Priority.INTERACTIVE, None), asyncio.TimeoutError()
+        )
+        go.set()
+
+        async with controller.admit(Priority.INTERACTIVE) as slot:
+            running = controller.stats()["running"]["interactive"]
+        return controller, slot, running
+
+    controller, slot, running = asyncio.run(run())
+
+    assert slot.priority == Priority.INTERACTIVE
+    assert running == 1
+    assert controller.stats()["running"]["interactive"] == 0
+    assert "queue_timeout" not in controller.rejected
+
+def test_waiter_shed_as_its_wait_times_out_holds_no_slot(monkeypatch):
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        controller._start(Priority.INTERACTIVE, 0.0)
+        go = _racing_wait_for(monkeypatch, controller._shed_batch, asyncio.TimeoutError())
+        go.set()
+
+        with pytest.raises(AdmissionRejected) as rejected:
+            await controller._acquire(Priority.BATCH, None)
+        return controller, rejected.value
+
+    controller, rejected = asyncio.run(run())
+
+    assert rejected.reason == "shed"
+    assert controller.stats()["running"] == {"interactive": 1, "batch": 0}
+    assert controller.stats()["queued"] == {"interactive": 0, "batch": 0}
+
+def test_slot_granted_as_the_caller_cancels_is_handed_on(monkeypatch):
+    async def run():
+        controller = AdmissionController(max_concurrent=1)
+        controller._start(Priority.INTERACTIVE, 0.0)
+        go = _racing_wait_for(
+            monkeypatch, lambda: controller._release(Priority.INTERACTIVE, None), asyncio.CancelledError()
+        )
+        order = []
+
+        cancelled = asyncio.create_task(_query(controller, "cancelled", Priority.INTERACTIVE, order))
+        await asyncio.sleep(0)
+        next_in_line = asyncio.create_task(_query(controller, "next", Priority.INTERACTIVE, order))
+        await asyncio.sleep(0)
+
+        go.set()
+        await asyncio.wait_for(next_in_line, timeout=1.0)
+        await asyncio.gather(cancelled, return_exceptions=True)
+        return controller, order, cancelled
+
+    controller, order, cancelled = asyncio.run(run())
+
+    assert cancelled.cancelled()
+    assert order == ["next"]
+    assert controller.stats()["running"] == {"interactive": 0, "batch": 0}
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for answering aggregations from the aggregate cube.
+
+The cube is consulted before intent classification, so only queries the
+compiler parses completely may be answered from it; anything else has to
+go through the regular pipeline.
+"""
+
+import asyncio
+import json
+import os
+import sys
+from datetime import date, datetime
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from aggregate_cube import AggregateCube
+from rag_config import RAGConfig
+from sql_compiler import REGIONS, RuleBasedSQLCompiler
+from stub_backends import BackendProfile, StubLLM, StubMCPSession, build_stub_pipeline, synthetic_profiles
+
+ROWS = synthetic_profiles(400, seed=3)
+
+@pytest.fixture(scope="module")
+def pipeline():
+    pipeline = build_stub_pipeline(StubLLM(), StubMCPSession(), RAGConfig(openai_api_key="stub", aggregate_cube=True))
+    pipeline.aggregate_cube.add_profiles(ROWS)
+    return pipeline
+
+def _inside(row, region):
+    lat_min, lat_max, lon_min, lon_max = REGIONS[region]
+    return lat_min <= row["lat"] <= lat_max and lon_min <= row["lon"] <= lon_max
+
+@pytest.mark.parametrize("query", [
+    # Negation and exclusion
+    "How many profiles are not in the Arabian Sea?",
+    "How many profiles except in the Arabian Sea?",
+    "How many profiles outside the Bay of Bengal?",
+    # Disjunction
+    "How many profiles have temperature > 25 or salinity > 36?",
+    "Average temperature in the Arabian Sea or the Bay of Bengal",
+    # Qualifiers the compiler does not understand
+    "How many profiles have high salinity in the Bay of Bengal?",
+    "What is the average temperature of warm water in the Arabian Sea?",
+    "Average salinity below the thermocline in 2020",
+    "Count warm water profiles in the Indian Ocean",
+])
+def test_partially_understood_queries_bypass_the_cube(pipeline, query):
+    assert pipeline._answer_from_cube(query, datetime.now()) is None
+
+def test_count_in_region_is_answered_from_the_cube(pipeline):
+    response = pipeline._answer_from_cube("How many profiles in the Arabian Sea?", datetime.now())
+
+    assert response is not None
+    assert response.metadata["sql_source"] == "aggregate_cube"
+    assert response.merged_data["aggregate"]["rows"] == [
+        {"count": sum(1 for row in ROWS if _inside(row, "arabian sea"))}
+    ]
+
+def test_threshold_count_matches_the_rows():
+    cube = AggregateCube()
+    cube.add_profiles(ROWS)
+    shape = RuleBasedSQLCompiler().parse("count profiles above 25°C in 2020")
+
+    answer = cube.answer(shape)
+
+    expected = sum(
+        1 for row in ROWS if row["surfacetemp"] > 25 and date.fromisoformat(row["date"][:10]).year == 2020
+    )
+    assert answer.rows == [{"count": expected}]
+
+def test_refresh_pages_past_the_first_batch():
+    cube = AggregateCube()
+    profile = BackendProfile(median_latency=0.0, capacity=8)
+
+    # The stub, like queryARGO, pages over the whole table whatever the SQL says
+    assert asyncio.run(cube.refresh(StubMCPSession(profile, max_rows=1200), batch_size=500)) == 1200
+    assert (cube.profiles, cube.max_id) == (1200, 1200)
+
+    # Synthetic rows are deterministic, so a larger table only appends new IDs
+    assert asyncio.run(cube.refresh(StubMCPSession(profile, max_rows=1300), batch_size=500)) == 100
+    assert cube.profiles == 1300
+
+class UnorderedPages:
+    """queryARGO double that returns overlapping pages in no particular order"""
+
+    def __init__(self, pages):
+        self.pages = pages
+
+    async def query_argo_sql(self, sql: str, page: int = 1, page_size: int = 100) -> str:
+        rows = self.pages[page - 1] if page <= len(self.pages) else []
+        return json.dumps({"data": {"data": rows}})
+
+def test_refresh_counts_each_profile_once():
+    rows = {row["id"]: row for row in synthetic_profiles(12, seed=5)}
+    without_id = [dict(rows[1], id=None), dict(rows[2], id="n/a")]
+    pages = [
+        [rows[i] for i in (9, 3, 12, 1)],
+        [rows[i] for i in (3, 7, 2, 10)],
+        [rows[i] for i in (5, 11, 9, 4)],
+        [rows[i] for i in (6, 8)] + without_id,
+        [],
+    ]
+    client = UnorderedPages(pages)
+    cube = AggregateCube()
+
+    assert asyncio.run(cube.refresh(client, batch_size=4)) == 12
+    # A second full pass finds nothing new, and rows without an ID never count
+    assert asyncio.run(cube.refresh(client, batch_size=4)) == 0
+
+    answer = cube.answer(RuleBasedSQLCompiler().parse("What is the average temperature in the Indian Ocean?"))
+    inside = [row for row in rows.values() if _inside(row, "indian ocean")]
+    assert cube.profiles == 12
+    assert answer.rows[0]["count"] == len(inside)
+    assert answer.rows[0]["avg_surfacetemp"] == pytest.approx(sum(row["surfacetemp"] for row in inside) / len(inside))
@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Tests for rate-limit-aware LLM call scheduling.
+
+Calls are admitted by request and token buckets, dispatched interactive
+first and critical before speculative, and a 429 pauses dispatch for the
+provider's retry-after, cuts the bucket rates and lets them recover with
+each successful call. Time is driven by a fake clock shared with the event
+loop, so every wait is deterministic.
+"""
+
+import asyncio
+import os
+import sys
+from contextlib import nullcontext
+from types import SimpleNamespace
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import llm_scheduler
+from admission import Priority
+from llm_scheduler import LLMScheduler, ScheduledLLMClient, llm_call_scope
+from stub_backends import StubRateLimitError
+
+class FakeClock:
+    """Monotonic clock the tests advance by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class ScriptedLLM:
+    """Chat completions client that answers from a script and logs who called"""
+
+    def __init__(self, *outcomes, total_tokens: int = 10):
+        self.outcomes = list(outcomes)
+        self.total_tokens = total_tokens
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, messages=(), **kwargs):
+        self.calls.append(messages[-1]["content"])
+        # In flight for one loop turn, so concurrent calls can fail together
+        await asyncio.sleep(0)
+        outcome = self.outcomes.pop(0) if self.outcomes else None
+        if isinstance(outcome, Exception):
+            raise outcome
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=self.total_tokens))
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Patching time.monotonic also moves the event loop's clock, so call_later fires on advance()
+    clock = FakeClock()
+    monkeypatch.setattr(llm_scheduler.time, "monotonic", clock)
+    monkeypatch.setattr(llm_scheduler.random, "random", lambda: 0.0)
+    return clock
+
+async def _advance(clock, seconds: float):
+    if seconds:
+        # A hair past the target, or float error in the refill leaves a due call a few ulps short forever
+        clock.now += seconds + 1e-9
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def _ask(client, name, priority=None, critical=None, max_tokens=8):
+    # Without a class of its own the call keeps the caller's tag, so promoting that tag reaches it
+    scope = nullcontext() if priority is None and critical is None else llm_call_scope(priority, critical)
+
+    async def ask():
+        with scope:
+            return await client.chat.completions.create(
+                model="stub", messages=[{"role": "user", "content": name}], max_tokens=max_tokens
+            )
+    return asyncio.create_task(ask())
+
+def test_request_bucket_admits_a_burst_then_paces_calls(clock):
+    llm = ScriptedLLM()
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=2.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        tasks = [_ask(client, f"call {i}") for i in range(4)]
+        await _advance(clock, 0)
+        assert llm.calls == ["call 0", "call 1"]
+        await _advance(clock, 0.99)
+        assert len(llm.calls) == 2
+        await _advance(clock, 0.01)
+        assert len(llm.calls) == 3
+        await _advance(clock, 1.0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert llm.calls == ["call 0", "call 1", "call 2", "call 3"]
+
+def test_token_bucket_charges_the_estimate_and_settles_on_usage(clock):
+    llm = ScriptedLLM(total_tokens=20)
+    # 100 tokens of burst, refilled at 10 per second
+    scheduler = LLMScheduler(tokens_per_minute=600, burst_seconds=10.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        # Each call is estimated at 4 framing + 60 completion tokens
+        await _ask(client, "a", max_tokens=60)
+        # Only 36 tokens would be left on the estimate; the refund of the 44 unused lets the next call go at once
+        await _ask(client, "b", max_tokens=60)
+        assert llm.calls == ["a", "b"]
+
+        third = _ask(client, "c", max_tokens=60)
+        await _advance(clock, 0)
+        assert len(llm.calls) == 2
+        # 60 tokens are left after the second call settled and 64 are needed
+        await _advance(clock, 0.39)
+        assert len(llm.calls) == 2
+        await _advance(clock, 0.01)
+        await third
+
+    asyncio.run(run())
+
+    stats = scheduler.stats()
+    assert llm.calls == ["a", "b", "c"]
+    assert (stats["estimated_tokens"], stats["actual_tokens"]) == (192, 60)
+
+def test_waiting_calls_are_dispatched_by_priority(clock):
+    llm = ScriptedLLM()
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=1.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        tasks = [_ask(client, "first")]
+        await _advance(clock, 0)
+        for name, priority, critical in [
+            ("batch speculative", Priority.BATCH, False),
+            ("batch critical", Priority.BATCH, True),
+            ("interactive speculative", Priority.INTERACTIVE, False),
+            ("interactive critical", Priority.INTERACTIVE, True),
+        ]:
+            tasks.append(_ask(client, name, priority, critical))
+        await _advance(clock, 0)
+        for _ in range(4):
+            await _advance(clock, 1.0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert llm.calls == [
+        "first", "interactive critical", "interactive speculative", "batch critical", "batch speculative",
+    ]
+
+def test_promoted_call_overtakes_speculative_ones(clock):
+    llm = ScriptedLLM()
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=1.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        tasks = [_ask(client, "first")]
+        await _advance(clock, 0)
+        tasks.append(_ask(client, "speculative", critical=False))
+        with llm_call_scope(critical=False) as tag:
+            tasks.append(_ask(client, "promoted"))
+        await _advance(clock, 0)
+        tag.critical = True
+        for _ in range(2):
+            await _advance(clock, 1.0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert llm.calls == ["first", "promoted", "speculative"]
+
+def test_rate_limit_pauses_dispatch_and_backs_off_the_rate(clock):
+    llm = ScriptedLLM(StubRateLimitError(5.0))
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=10.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        limited = _ask(client, "limited")
+        await _advance(clock, 0)
+        assert scheduler.stats()["paused_for"] == pytest.approx(5.0)
+        assert scheduler.stats()["request_rate_per_minute"] == pytest.approx(60 * llm_scheduler.RATE_BACKOFF)
+
+        # Nothing is dispatched during the pause, however much budget there is
+        other = _ask(client, "other")
+        await _advance(clock, 4.9)
+        assert llm.calls == ["limited"]
+
+        await _advance(clock, 0.1)
+        await asyncio.gather(limited, other)
+
+    asyncio.run(run())
+
+    stats = scheduler.stats()
+    assert llm.calls == ["limited", "limited", "other"]
+    assert (stats["rate_limited"], stats["failed"]) == (1, 0)
+    # Two successful calls each recover a step of the configured rate
+    expected = 60 * (llm_scheduler.RATE_BACKOFF + 2 * llm_scheduler.RATE_RECOVERY)
+    assert stats["request_rate_per_minute"] == pytest.approx(expected)
+
+def test_burst_of_rate_limits_cuts_the_rate_once(clock):
+    llm = ScriptedLLM(StubRateLimitError(2.0), StubRateLimitError(2.0))
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=10.0)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        tasks = [_ask(client, "a"), _ask(client, "b")]
+        await _advance(clock, 0)
+        rate = scheduler.stats()["request_rate_per_minute"]
+        # The pause drained the bucket; at the reduced rate both retries fit within three seconds
+        await _advance(clock, 2.0)
+        await _advance(clock, 1.0)
+        await asyncio.gather(*tasks)
+        return rate
+
+    rate = asyncio.run(run())
+
+    assert rate == pytest.approx(60 * llm_scheduler.RATE_BACKOFF)
+    assert scheduler.rate_limited == 2
+
+def test_rate_limit_retries_are_bounded(clock):
+    llm = ScriptedLLM(*[StubRateLimitError(1.0)] * 3)
+    scheduler = LLMScheduler(requests_per_minute=60, burst_seconds=10.0, max_retries=2)
+    client = ScheduledLLMClient(llm, scheduler)
+
+    async def run():
+        task = _ask(client, "limited")
+        # Each pause also drains the request bucket, which refills at the reduced rate
+        for _ in range(3):
+            await _advance(clock, 2.0)
+        return await asyncio.gather(task, return_exceptions=True)
+
+    [result] = asyncio.run(run())
+
+    assert isinstance(result, StubRateLimitError)
+    assert len(llm.calls) == 3
+    assert (scheduler.rate_limited, scheduler.failed) == (3, 1)
+    # Consecutive 429s after each pause keep cutting the rate, down to the floor at most
+    assert scheduler.stats()["request_rate_per_minute"] == pytest.approx(60 * llm_scheduler.RATE_BACKOFF ** 3)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Tests for the MCP client's circuit breaker and retry budget.
+
+A tool's circuit opens after consecutive server failures, then admits a
+single probe once the reset timeout has passed; client errors must neither
+close nor open it. Retries are capped by a budget earned from first attempts.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import mcp_client
+from mcp_client import CircuitBreaker, CircuitOpenError, MCPCallError, MCPClient, MCPClientConfig
+
+class FakeClock:
+    """Monotonic clock the tests advance by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class ScriptedServer:
+    """Stands in for MCPClient._send, answering each request from a script"""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.requests = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self, tool_name, payload, hedge):
+        self.requests += 1
+        outcome = self.outcomes.pop(0) if self.outcomes else {"ok": True}
+        if outcome == "wait":
+            await self.release.wait()
+            return {"ok": True}
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+def _server_error():
+    return MCPCallError("MCP call failed: unavailable", status=503)
+
+def _client_error():
+    return MCPCallError("MCP call failed: bad request", status=400, retryable=False)
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(mcp_client.time, "monotonic", clock)
+    return clock
+
+def _client(server, **overrides):
+    settings = dict(max_retries=1, backoff_base=0.0, breaker_failure_threshold=3, breaker_reset_timeout=10.0)
+    settings.update(overrides)
+    client = MCPClient(MCPClientConfig(**settings))
+    # call_tool only checks that a session is open; requests go to the scripted server
+    client.session = object()
+    client._send = server
+    return client
+
+async def _call(client):
+    try:
+        return await client.call_tool("queryARGO", {"sql": "SELECT 1"})
+    except MCPCallError as e:
+        return e
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    server = ScriptedServer(*[_server_error()] * 3)
+    client = _client(server)
+
+    async def run():
+        return [await _call(client) for _ in range(4)]
+
+    results = asyncio.run(run())
+
+    assert [type(result) for result in results] == [MCPCallError] * 3 + [CircuitOpenError]
+    assert results[-1].retry_after == pytest.approx(10.0)
+    assert server.requests == 3
+    assert client.breaker("queryARGO").state == CircuitBreaker.OPEN
+
+def test_half_open_admits_one_probe_and_closes_on_success(clock):
+    server = ScriptedServer(*[_server_error()] * 3, "wait")
+    client = _client(server)
+
+    async def run():
+        for _ in range(3):
+            await _call(client)
+        clock.now += 10
+
+        probe = asyncio.create_task(_call(client))
+        await asyncio.sleep(0)
+        # Only the probe reaches the server while the circuit is half-open
+        assert isinstance(await _call(client), CircuitOpenError)
+        server.release.set()
+        return await probe
+
+    assert asyncio.run(run()) == {"ok": True}
+    breaker = client.breaker("queryARGO")
+    assert (breaker.state, breaker.consecutive_failures) == (CircuitBreaker.CLOSED, 0)
+    assert server.requests == 4
+
+def test_failed_probe_reopens_the_circuit(clock):
+    server = ScriptedServer(*[_server_error()] * 4)
+    client = _client(server)
+
+    async def run():
+        for _ in range(3):
+            await _call(client)
+        clock.now += 10
+        await _call(client)
+        return await _call(client)
+
+    assert isinstance(asyncio.run(run()), CircuitOpenError)
+    assert client.breaker("queryARGO").retry_after() == pytest.approx(10.0)
+
+def test_client_errors_do_not_reset_the_failure_count(clock):
+    server = ScriptedServer(_server_error(), _server_error(), _client_error(), _server_error())
+    client = _client(server)
+
+    async def run():
+        return [await _call(client) for _ in range(5)]
+
+    results = asyncio.run(run())
+
+    # 400 neither counts as a failure nor closes the streak, so the third 5xx opens the circuit
+    assert results[2].status == 400
+    assert isinstance(results[4], CircuitOpenError)
+
+def test_client_error_on_a_probe_frees_the_probe_slot(clock):
+    server = ScriptedServer(*[_server_error()] * 3, _client_error(), {"ok": True})
+    client = _client(server)
+
+    async def run():
+        for _ in range(3):
+            await _call(client)
+        clock.now += 10
+        rejected = await _call(client)
+        assert client.breaker("queryARGO").state == CircuitBreaker.HALF_OPEN
+        return rejected, await _call(client)
+
+    rejected, result = asyncio.run(run())
+
+    assert rejected.status == 400
+    assert result == {"ok": True}
+    assert client.breaker("queryARGO").state == CircuitBreaker.CLOSED
+
+def test_cancelled_probe_frees_the_probe_slot(clock):
+    server = ScriptedServer(*[_server_error()] * 3, "wait")
+    client = _client(server)
+
+    async def run():
+        for _ in range(3):
+            await _call(client)
+        clock.now += 10
+        probe = asyncio.create_task(_call(client))
+        await asyncio.sleep(0)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+        return await _call(client)
+
+    assert asyncio.run(run()) == {"ok": True}
+
+def test_retries_stop_when_the_budget_is_spent(clock):
+    server = ScriptedServer(*[_server_error()] * 6)
+    client = _client(server, max_retries=3, retry_budget_ratio=0.0, retry_budget_burst=2.0,
+                     breaker_failure_threshold=100)
+
+    async def run():
+        first = await _call(client)
+        requests = server.requests
+        second = await _call(client)
+        return first, requests, second
+
+    first, requests, second = asyncio.run(run())
+
+    # Two banked tokens buy the first call both of its retries; the second gets none
+    assert requests == 3
+    assert server.requests == 4
+    assert isinstance(first, MCPCallError) and isinstance(second, MCPCallError)
+
+def test_first_attempts_earn_retry_budget():
+    budget = mcp_client.RetryBudget(ratio=0.5, burst=1.0)
+    assert budget.try_spend() and not budget.try_spend()
+
+    budget.deposit()
+    assert not budget.try_spend()
+    budget.deposit()
+    assert budget.try_spend()
+
+    for _ in range(10):
+        budget.deposit()
+    assert budget.tokens == 1.0
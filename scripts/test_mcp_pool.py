@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Tests for the MCP session pool's member lifecycle.
+
+The stdio transport's anyio cancel scopes must be exited by the task that
+entered them, so every member's connect and disconnect have to run in the
+same task, including across restarts, and a restart must wait for the
+member's in-flight calls.
+"""
+
+import asyncio
+import os
+import sys
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from mcp_pool import MCPSessionPool
+
+class FakeClient:
+    """Records which task opened and closed each session"""
+
+    def __init__(self):
+        self.events = []
+        self.alive = True
+        self.release = asyncio.Event()
+
+    async def connect(self):
+        self.events.append(("connect", asyncio.current_task()))
+        self.alive = True
+
+    async def disconnect(self):
+        self.events.append(("disconnect", asyncio.current_task()))
+
+    async def ping(self) -> bool:
+        return self.alive
+
+    async def query_argo_sql(self, sql: str, page: int = 1, page_size: int = 100):
+        if sql == "fail":
+            raise RuntimeError("broken pipe")
+        if sql == "slow":
+            await self.release.wait()
+        self.events.append(("call", sql))
+        return "{}"
+
+def _pool(clients, size: int = 2):
+    def factory():
+        client = FakeClient()
+        clients.append(client)
+        return client
+    return MCPSessionPool(factory, min_size=size, max_size=size, health_check_interval=3600)
+
+def test_sessions_are_opened_and_closed_by_the_same_task():
+    clients = []
+
+    async def run():
+        pool = _pool(clients)
+        await pool.connect()
+        await pool.query_argo_sql("SELECT 1")
+        await pool.disconnect()
+
+    asyncio.run(run())
+
+    assert len(clients) == 2
+    for client in clients:
+        (opened, opener), (closed, closer) = [event for event in client.events if event[0] != "call"]
+        assert (opened, closed) == ("connect", "disconnect")
+        assert opener is closer
+
+def test_failed_member_drains_before_it_restarts():
+    clients = []
+
+    async def run():
+        pool = _pool(clients, size=1)
+        await pool.connect()
+        member = pool.members[0]
+        client = member.client
+
+        slow = asyncio.create_task(pool.query_argo_sql("slow"))
+        await asyncio.sleep(0)
+        client.alive = False
+        try:
+            await pool.query_argo_sql("fail")
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0.01)
+
+        # Out of rotation, but still open while a call is in flight on it
+        assert not member.healthy
+        assert [event[0] for event in client.events] == ["connect"]
+
+        client.release.set()
+        await slow
+        await asyncio.sleep(0.01)
+
+        assert member.healthy and member.restarts == 1
+        await pool.disconnect()
+        return client
+
+    client = asyncio.run(run())
+
+    assert [event[0] for event in client.events] == ["connect", "call", "disconnect", "connect", "disconnect"]
+    assert len({event[1] for event in client.events if event[0] != "call"}) == 1
+
+def test_failed_call_on_a_live_member_does_not_restart_it():
+    clients = []
+
+    async def run():
+        pool = _pool(clients)
+        await pool.connect()
+        try:
+            await pool.query_argo_sql("fail")
+        except RuntimeError:
+            pass
+        await asyncio.sleep(0.01)
+        stats = pool.stats()
+        await pool.disconnect()
+        return stats
+
+    stats = asyncio.run(run())
+
+    assert all(member["healthy"] and member["restarts"] == 0 for member in stats["members"])
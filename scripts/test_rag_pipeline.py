@@ -2,54 +2,217 @@
 """
 Comprehensive test suite for RAG + MCP pipeline validation.
 Tests SQL mode, semantic mode, and hybrid mode queries.
+
+Cases run concurrently (--workers), each in its own conversation session.
+The case list can be split into shards (--shard 2/4), and --processes N runs
+N shards in child processes and merges their reports into one.
 """
 
+import argparse
 import asyncio
 import json
 import logging
+import tempfile
+import time
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 import sys
 import os
 
 # Add the scripts directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from benchmark_store import BenchmarkRun, BenchmarkStore, compare_runs, report_comparison
+from cassette import Cassette
 from llm_agent import ARGOLLMAgent, MCPToolResponse
+from test_queries import TestQueryLibrary
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# TestQueryLibrary categories and the validation mode applied to each
+LIBRARY_MODES = {
+    "sql_mode": "SQL",
+    "semantic_mode": "SEMANTIC",
+    "hybrid_mode": "HYBRID",
+    "edge_cases": "EDGE",
+    "performance": "PERFORMANCE",
+}
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parse a 1-based "index/count" shard spec"""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Shard must look like 2/4, got {spec!r}")
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Shard index must be between 1 and {count}, got {spec!r}")
+    return index, count
+
+def build_report(results: List[Dict[str, Any]], wall_time: float, shards: int = 1) -> Dict[str, Any]:
+    """Summarize test results into the validation report structure"""
+    total_tests = len(results)
+    passed_tests = sum(1 for result in results if result.get("validation", {}).get("passed", False))
+    
+    modes = {}
+    for result in results:
+        stats = modes.setdefault(result["mode"], {"total": 0, "passed": 0})
+        stats["total"] += 1
+        if result.get("validation", {}).get("passed", False):
+            stats["passed"] += 1
+    
+    execution_times = [r["execution_time"] for r in results if "execution_time" in r]
+    return {
+        "summary": {
+            "total_tests": total_tests,
+            "passed_tests": passed_tests,
+            "failed_tests": total_tests - passed_tests,
+            "pass_rate": passed_tests / total_tests * 100 if total_tests > 0 else 0
+        },
+        "mode_breakdown": modes,
+        "performance": {
+            "avg_time": sum(execution_times) / len(execution_times) if execution_times else 0,
+            "max_time": max(execution_times, default=0),
+            "min_time": min(execution_times, default=0),
+            "wall_time": wall_time,
+            "serial_time": sum(execution_times)
+        },
+        "shards": shards,
+        "detailed_results": results,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def merge_reports(reports: List[Dict[str, Any]], wall_time: float) -> Dict[str, Any]:
+    """Combine per-shard reports into one, restoring the original case order"""
+    results = [result for report in reports for result in report["detailed_results"]]
+    results.sort(key=lambda result: result.get("case_index", 0))
+    return build_report(results, wall_time, shards=len(reports))
+
+def benchmark_from_report(report: Dict[str, Any]) -> BenchmarkRun:
+    """Benchmark samples for the cases that completed"""
+    run = BenchmarkRun(label="validation", wall_time=report["performance"]["wall_time"])
+    for result in report["detailed_results"]:
+        if "execution_time" in result:
+            run.add_sample(result["execution_time"], result.get("stage_timings"))
+    return run
+
+def log_report(report: Dict[str, Any]):
+    """Log a human-readable summary of a validation report"""
+    logger.info("\n" + "=" * 80)
+    logger.info("📊 VALIDATION REPORT")
+    logger.info("=" * 80)
+    
+    summary = report["summary"]
+    total_tests = summary["total_tests"] or 1
+    logger.info(f"\n📈 SUMMARY:")
+    logger.info(f"   Total Tests: {summary['total_tests']}")
+    logger.info(f"   Passed: {summary['passed_tests']} ({summary['passed_tests']/total_tests*100:.1f}%)")
+    logger.info(f"   Failed: {summary['failed_tests']} ({summary['failed_tests']/total_tests*100:.1f}%)")
+    
+    logger.info(f"\n📊 BY MODE:")
+    for mode, stats in report["mode_breakdown"].items():
+        pass_rate = stats["passed"] / stats["total"] * 100 if stats["total"] > 0 else 0
+        logger.info(f"   {mode}: {stats['passed']}/{stats['total']} ({pass_rate:.1f}%)")
+    
+    # Failed tests details
+    if summary["failed_tests"] > 0:
+        logger.info(f"\n❌ FAILED TESTS:")
+        for result in report["detailed_results"]:
+            if not result.get("validation", {}).get("passed", False):
+                logger.info(f"   • {result['query'][:60]}...")
+                issues = result.get("validation", {}).get("issues", [])
+                for issue in issues[:3]:  # Show first 3 issues
+                    logger.info(f"     - {issue}")
+    
+    performance = report["performance"]
+    logger.info(f"\n⏱️  PERFORMANCE:")
+    logger.info(f"   Average Response Time: {performance['avg_time']:.2f}s")
+    logger.info(f"   Fastest Response: {performance['min_time']:.2f}s")
+    logger.info(f"   Slowest Response: {performance['max_time']:.2f}s")
+    logger.info(f"   Wall Time: {performance['wall_time']:.2f}s "
+                f"(serial sum {performance['serial_time']:.2f}s, {report['shards']} shard(s))")
+
+def save_report(report: Dict[str, Any], report_file: Optional[str] = None) -> str:
+    """Write a validation report to disk"""
+    report_file = report_file or f"rag_validation_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"\n💾 Detailed report saved to: {report_file}")
+    logger.info("=" * 80)
+    return report_file
+
 class RAGPipelineValidator:
     """Validates RAG + MCP pipeline with comprehensive test queries"""
     
-    def __init__(self, openai_api_key: str):
+    def __init__(self, openai_api_key: str, cassette: Optional[Cassette] = None, workers: int = 8,
+                 use_library: bool = False, categories: Optional[List[str]] = None,
+                 shard: Tuple[int, int] = (1, 1)):
         self.agent = ARGOLLMAgent(openai_api_key)
         self.test_results = []
+        self.report: Dict[str, Any] = {}
+        self.benchmark = BenchmarkRun(label="validation")
+        self.workers = max(1, workers)
+        self.use_library = use_library
+        self.categories = categories
+        self.shard = shard
+        self.cassette = cassette
+        if cassette is not None:
+            cassette.wrap_agent(self.agent)
         
-    async def run_all_tests(self):
-        """Run all validation tests"""
+    async def run_all_tests(self, report_file: Optional[str] = None) -> Dict[str, Any]:
+        """Run this shard's validation cases concurrently and report on them"""
+        cases = self._shard_cases()
         logger.info("Starting RAG + MCP Pipeline Validation")
+        logger.info(f"   {len(cases)} case(s), shard {self.shard[0]}/{self.shard[1]}, {self.workers} worker(s)")
         logger.info("=" * 80)
+        started = time.monotonic()
         
-        # SQL Mode Tests
-        await self._test_sql_mode()
+        slots = asyncio.Semaphore(self.workers)
         
-        # Semantic Mode Tests  
-        await self._test_semantic_mode()
+        async def run_case(index: int, mode: str, test_case: Dict[str, Any]) -> Dict[str, Any]:
+            async with slots:
+                return await self._execute_test_case(mode, test_case, index)
         
-        # Hybrid Mode Tests
-        await self._test_hybrid_mode()
+        self.test_results = list(await asyncio.gather(*(run_case(*case) for case in cases)))
         
         # Generate validation report
-        self._generate_validation_report()
+        self.report = build_report(self.test_results, time.monotonic() - started, shards=1)
+        self.benchmark = benchmark_from_report(self.report)
+        log_report(self.report)
+        save_report(self.report, report_file)
+        
+        if self.cassette is not None:
+            self.cassette.save()
+            logger.info(f"📼 Cassette: {self.cassette.stats()}")
+        return self.report
+        
+    def _all_cases(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Every (mode, test case) pair, in a stable order"""
+        if self.use_library:
+            return [
+                (LIBRARY_MODES.get(category, category.upper()), test_case)
+                for category, test_cases in TestQueryLibrary.get_all_test_queries().items()
+                if not self.categories or category in self.categories
+                for test_case in test_cases
+            ]
+        return (
+            [("SQL", test_case) for test_case in self._sql_mode_cases()]
+            + [("SEMANTIC", test_case) for test_case in self._semantic_mode_cases()]
+            + [("HYBRID", test_case) for test_case in self._hybrid_mode_cases()]
+        )
         
-    async def _test_sql_mode(self):
-        """Test structured queries that should use SQL (queryARGO)"""
-        logger.info("\n🔍 TESTING SQL MODE")
-        logger.info("-" * 50)
+    def _shard_cases(self) -> List[Tuple[int, str, Dict[str, Any]]]:
+        """This shard's cases, dealt round-robin so shards get a similar mix of modes"""
+        index, count = self.shard
+        return [
+            (case_index, mode, test_case)
+            for case_index, (mode, test_case) in enumerate(self._all_cases())
+            if case_index % count == index - 1
+        ]
         
+    def _sql_mode_cases(self) -> List[Dict[str, Any]]:
+        """Structured queries that should use SQL (queryARGO)"""
         sql_queries = [
             {
                 "query": "Show me 5 profiles from the Indian Ocean in 2010",
@@ -72,15 +235,10 @@ class RAGPipelineValidator:
                 "description": "Statistical aggregation query"
             }
         ]
-        
-        for test_case in sql_queries:
-            await self._execute_test_case("SQL", test_case)
+        return sql_queries
             
-    async def _test_semantic_mode(self):
-        """Test unstructured queries that should use vector search (retrieveARGO)"""
-        logger.info("\n🧠 TESTING SEMANTIC MODE")
-        logger.info("-" * 50)
-        
+    def _semantic_mode_cases(self) -> List[Dict[str, Any]]:
+        """Unstructured queries that should use vector search (retrieveARGO)"""
         semantic_queries = [
             {
                 "query": "Where are the warmest waters recorded?",
@@ -103,15 +261,10 @@ class RAGPipelineValidator:
                 "description": "Physical oceanography feature search"
             }
         ]
-        
-        for test_case in semantic_queries:
-            await self._execute_test_case("SEMANTIC", test_case)
+        return semantic_queries
             
-    async def _test_hybrid_mode(self):
-        """Test complex queries that should use both SQL and vector search"""
-        logger.info("\n🔄 TESTING HYBRID MODE")
-        logger.info("-" * 50)
-        
+    def _hybrid_mode_cases(self) -> List[Dict[str, Any]]:
+        """Complex queries that should use both SQL and vector search"""
         hybrid_queries = [
             {
                 "query": "Compare salinity trends in Pacific vs Atlantic from 2000–2010",
@@ -129,20 +282,20 @@ class RAGPipelineValidator:
                 "description": "Climate pattern analysis with historical comparison"
             }
         ]
-        
-        for test_case in hybrid_queries:
-            await self._execute_test_case("HYBRID", test_case)
+        return hybrid_queries
             
-    async def _execute_test_case(self, mode: str, test_case: Dict[str, Any]):
-        """Execute a single test case and validate results"""
+    async def _execute_test_case(self, mode: str, test_case: Dict[str, Any], case_index: int = 0) -> Dict[str, Any]:
+        """Execute a single test case in its own session and validate results"""
         query = test_case["query"]
-        logger.info(f"\n📝 Testing: {query}")
-        logger.info(f"   Expected: {test_case.get('expected_tool', test_case.get('expected_tools', 'Unknown'))}")
+        logger.info(f"📝 [{mode}] Testing: {query}")
         
         try:
             # Execute query
+            stage_timings = {}
             start_time = datetime.now()
-            response = await self.agent.process_query(query)
+            response = await self.agent.process_query(
+                query, session_id=f"validation-{case_index}", timings=stage_timings
+            )
             end_time = datetime.now()
             execution_time = (end_time - start_time).total_seconds()
             
@@ -151,34 +304,36 @@ class RAGPipelineValidator:
             
             # Store test result
             test_result = {
+                "case_index": case_index,
                 "mode": mode,
                 "query": query,
                 "description": test_case["description"],
                 "response": response,
                 "execution_time": execution_time,
+                "stage_timings": stage_timings,
                 "validation": validation_result,
                 "timestamp": datetime.now().isoformat()
             }
             
-            self.test_results.append(test_result)
-            
             # Log result
             status = "✅ PASS" if validation_result["passed"] else "❌ FAIL"
-            logger.info(f"   Result: {status} ({execution_time:.2f}s)")
+            logger.info(f"   [{mode}] {query[:60]}: {status} ({execution_time:.2f}s)")
             
             if not validation_result["passed"]:
                 logger.warning(f"   Issues: {', '.join(validation_result['issues'])}")
+            return test_result
                 
         except Exception as e:
-            logger.error(f"   Error: {str(e)}")
-            self.test_results.append({
+            logger.error(f"   [{mode}] {query[:60]}: Error: {str(e)}")
+            return {
+                "case_index": case_index,
                 "mode": mode,
                 "query": query,
                 "description": test_case["description"],
                 "error": str(e),
                 "validation": {"passed": False, "issues": [f"Execution error: {str(e)}"]},
                 "timestamp": datetime.now().isoformat()
-            })
+            }
             
     def _validate_response(self, response: str, test_case: Dict[str, Any], mode: str) -> Dict[str, Any]:
         """Validate response quality and completeness"""
@@ -229,93 +384,105 @@ class RAGPipelineValidator:
             "issues": issues,
             "score": max(0, 100 - len(issues) * 20)  # Simple scoring system
         }
+
+async def run_sharded(args) -> Dict[str, Any]:
+    """Run every shard in its own process and merge the shard reports"""
+    passthrough = ["--workers", str(args.workers), "--no-benchmark"]
+    if args.replay:
+        passthrough += ["--replay", args.replay, "--latency-scale", str(args.latency_scale)]
+    if args.replay_latency:
+        passthrough.append("--replay-latency")
+    if args.library:
+        passthrough.append("--library")
+    if args.categories:
+        passthrough += ["--categories", *args.categories]
+    
+    with tempfile.TemporaryDirectory(prefix="rag_validation_") as shard_dir:
+        started = time.monotonic()
+        shards = []
+        for index in range(1, args.processes + 1):
+            report_file = os.path.join(shard_dir, f"shard_{index}.json")
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, os.path.abspath(__file__),
+                "--shard", f"{index}/{args.processes}", "--report-file", report_file, *passthrough
+            )
+            shards.append((index, report_file, process))
         
-    def _generate_validation_report(self):
-        """Generate comprehensive validation report"""
-        logger.info("\n" + "=" * 80)
-        logger.info("📊 VALIDATION REPORT")
-        logger.info("=" * 80)
-        
-        # Summary statistics
-        total_tests = len(self.test_results)
-        passed_tests = sum(1 for result in self.test_results if result.get("validation", {}).get("passed", False))
-        failed_tests = total_tests - passed_tests
-        
-        logger.info(f"\n📈 SUMMARY:")
-        logger.info(f"   Total Tests: {total_tests}")
-        logger.info(f"   Passed: {passed_tests} ({passed_tests/total_tests*100:.1f}%)")
-        logger.info(f"   Failed: {failed_tests} ({failed_tests/total_tests*100:.1f}%)")
+        reports = []
+        for index, report_file, process in shards:
+            await process.wait()
+            if not os.path.exists(report_file):
+                raise RuntimeError(f"Shard {index}/{args.processes} exited with {process.returncode} without a report")
+            with open(report_file) as f:
+                reports.append(json.load(f))
         
-        # Mode breakdown
-        modes = {}
-        for result in self.test_results:
-            mode = result["mode"]
-            if mode not in modes:
-                modes[mode] = {"total": 0, "passed": 0}
-            modes[mode]["total"] += 1
-            if result.get("validation", {}).get("passed", False):
-                modes[mode]["passed"] += 1
-                
-        logger.info(f"\n📊 BY MODE:")
-        for mode, stats in modes.items():
-            pass_rate = stats["passed"] / stats["total"] * 100 if stats["total"] > 0 else 0
-            logger.info(f"   {mode}: {stats['passed']}/{stats['total']} ({pass_rate:.1f}%)")
-            
-        # Failed tests details
-        if failed_tests > 0:
-            logger.info(f"\n❌ FAILED TESTS:")
-            for result in self.test_results:
-                if not result.get("validation", {}).get("passed", False):
-                    logger.info(f"   • {result['query'][:60]}...")
-                    issues = result.get("validation", {}).get("issues", [])
-                    for issue in issues[:3]:  # Show first 3 issues
-                        logger.info(f"     - {issue}")
-                        
-        # Performance metrics
-        execution_times = [r.get("execution_time", 0) for r in self.test_results if "execution_time" in r]
-        if execution_times:
-            avg_time = sum(execution_times) / len(execution_times)
-            max_time = max(execution_times)
-            min_time = min(execution_times)
-            
-            logger.info(f"\n⏱️  PERFORMANCE:")
-            logger.info(f"   Average Response Time: {avg_time:.2f}s")
-            logger.info(f"   Fastest Response: {min_time:.2f}s")
-            logger.info(f"   Slowest Response: {max_time:.2f}s")
-            
-        # Save detailed report
-        report_file = f"rag_validation_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(report_file, 'w') as f:
-            json.dump({
-                "summary": {
-                    "total_tests": total_tests,
-                    "passed_tests": passed_tests,
-                    "failed_tests": failed_tests,
-                    "pass_rate": passed_tests/total_tests*100 if total_tests > 0 else 0
-                },
-                "mode_breakdown": modes,
-                "performance": {
-                    "avg_time": avg_time if execution_times else 0,
-                    "max_time": max_time if execution_times else 0,
-                    "min_time": min_time if execution_times else 0
-                },
-                "detailed_results": self.test_results,
-                "timestamp": datetime.now().isoformat()
-            }, f, indent=2)
-            
-        logger.info(f"\n💾 Detailed report saved to: {report_file}")
-        logger.info("=" * 80)
+        return merge_reports(reports, time.monotonic() - started)
 
-async def main():
+async def main() -> int:
     """Main test execution function"""
+    parser = argparse.ArgumentParser(description="Validate the RAG + MCP pipeline")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="PATH", help="Record LLM and MCP traffic to a cassette file")
+    cassette_group.add_argument("--replay", metavar="PATH", help="Replay LLM and MCP traffic from a cassette file")
+    parser.add_argument("--replay-latency", action="store_true", help="Sleep for the recorded latencies when replaying")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier applied to replayed latencies")
+    parser.add_argument("--store", default="benchmark_results", help="Benchmark results directory")
+    parser.add_argument("--baseline", metavar="NAME", help="Fail on significant regressions against this baseline")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save this run as the named baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Relative slowdown tolerated before failing")
+    parser.add_argument("--workers", type=int, default=8, help="Cases run concurrently within a process")
+    parser.add_argument("--library", action="store_true", help="Run the TestQueryLibrary cases")
+    parser.add_argument("--categories", nargs="+", choices=sorted(LIBRARY_MODES), help="TestQueryLibrary categories")
+    parser.add_argument("--shard", default="1/1", help="Run only this 1-based INDEX/COUNT share of the cases")
+    parser.add_argument("--processes", type=int, default=1, help="Run the cases as this many sharded processes")
+    parser.add_argument("--report-file", help="Path of the validation report (default: timestamped)")
+    parser.add_argument("--no-benchmark", action="store_true", help="Do not save a benchmark run")
+    args = parser.parse_args()
+    
+    try:
+        shard = parse_shard(args.shard)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.processes > 1 and (args.record or shard != (1, 1)):
+        parser.error("--processes cannot be combined with --record or --shard")
+
     # You would replace this with your actual OpenAI API key
     api_key = os.getenv("OPENAI_API_KEY", "your-openai-api-key-here")
     
-    if api_key == "your-openai-api-key-here":
+    if api_key == "your-openai-api-key-here" and not args.replay:
         logger.warning("⚠️  Using placeholder API key. Set OPENAI_API_KEY environment variable for actual testing.")
+    
+    cassette = None
+    if args.record:
+        cassette = Cassette.record(args.record)
+    elif args.replay:
+        cassette = Cassette.replay(args.replay, replay_latency=args.replay_latency, latency_scale=args.latency_scale)
         
-    validator = RAGPipelineValidator(api_key)
-    await validator.run_all_tests()
+    if args.processes > 1:
+        report = await run_sharded(args)
+        log_report(report)
+        save_report(report, args.report_file)
+        benchmark = benchmark_from_report(report)
+    else:
+        validator = RAGPipelineValidator(api_key, cassette=cassette, workers=args.workers, use_library=args.library,
+                                         categories=args.categories, shard=shard)
+        await validator.run_all_tests(args.report_file)
+        benchmark = validator.benchmark
+    
+    if args.no_benchmark:
+        return 0
+    
+    store = BenchmarkStore(args.store)
+    run_path = store.save_run(benchmark)
+    logger.info(f"📏 Benchmark run saved to: {run_path}")
+    
+    passed = True
+    if args.baseline:
+        comparison = compare_runs(store.get_baseline(args.baseline), benchmark, tolerance=args.tolerance)
+        passed = report_comparison(comparison)
+    if args.save_baseline:
+        store.set_baseline(args.save_baseline, benchmark)
+    return 0 if passed else 1
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    sys.exit(asyncio.run(main()))
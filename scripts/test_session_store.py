@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Tests for the conversation session store.
+
+The store keeps sessions in last-active order, evicts idle and least
+recently used ones, and spills evicted sessions to disk with all file I/O
+kept off the event loop.
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import session_store
+from session_store import SessionStore
+
+class FakeClock:
+    """Monotonic clock the tests advance by hand"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(session_store.time, "monotonic", clock)
+    return clock
+
+async def _talk(store, session_id, content="hello"):
+    async with store.session(session_id) as session:
+        session.add_message("user", content)
+
+def test_least_recently_used_session_is_evicted(clock):
+    store = SessionStore(max_sessions=2)
+
+    async def run():
+        await _talk(store, "a")
+        clock.now += 1
+        await _talk(store, "b")
+        clock.now += 1
+        await _talk(store, "a")
+        clock.now += 1
+        await _talk(store, "c")
+
+    asyncio.run(run())
+
+    assert list(store._sessions) == ["a", "c"]
+    assert store.evictions == 1
+
+def test_sessions_held_by_a_request_are_not_evicted(clock):
+    store = SessionStore(max_sessions=1)
+
+    async def run():
+        async with store.session("a"):
+            clock.now += 1
+            # "a" is pinned, so the store runs over capacity rather than evict it
+            async with store.session("b"):
+                assert list(store._sessions) == ["a", "b"]
+            return list(store._sessions)
+
+    assert asyncio.run(run()) == ["a"]
+
+def test_idle_sessions_are_evicted(clock):
+    store = SessionStore(idle_timeout=60.0)
+
+    async def run():
+        await _talk(store, "a")
+        clock.now += 30
+        await _talk(store, "b")
+        clock.now += 45
+        await _talk(store, "c")
+
+    asyncio.run(run())
+
+    assert list(store._sessions) == ["b", "c"]
+
+def test_evicted_session_is_restored_from_disk(tmp_path, clock):
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+
+    async def run():
+        await _talk(store, "a", "first")
+        await _talk(store, "b")
+        await store.flush()
+        assert "a" not in store and len(os.listdir(tmp_path)) == 2
+
+        async with store.session("a") as session:
+            return session.messages()
+
+    assert asyncio.run(run()) == [{"role": "user", "content": "first"}]
+    assert store.restores == 1
+
+def test_restore_does_not_read_files_on_the_event_loop(tmp_path, clock, monkeypatch):
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+    readers = []
+    read_spill = store._read_spill
+
+    def recording_read(session_id):
+        try:
+            asyncio.get_running_loop()
+            readers.append("loop")
+        except RuntimeError:
+            readers.append("thread")
+        return read_spill(session_id)
+
+    monkeypatch.setattr(store, "_read_spill", recording_read)
+
+    async def run():
+        await _talk(store, "a", "first")
+        await _talk(store, "b")
+        await store.flush()
+        await _talk(store, "a", "second")
+
+    asyncio.run(run())
+
+    # New sessions look for a spill file too
+    assert readers and set(readers) == {"thread"}
+
+def test_concurrent_requests_share_one_restore(tmp_path, clock):
+    store = SessionStore(spill_dir=str(tmp_path))
+
+    async def run():
+        await _talk(store, "a", "first")
+        await store.flush()
+
+        await asyncio.gather(*(_talk(store, "a", f"reply {i}") for i in range(3)))
+        return store.peek("a").messages()
+
+    messages = asyncio.run(run())
+
+    assert [message["content"] for message in messages] == ["first", "reply 0", "reply 1", "reply 2"]
+    assert store.restores == 1
+    assert os.listdir(tmp_path) == []
+
+def test_session_restored_before_its_spill_lands_keeps_its_history(tmp_path, clock):
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+
+    async def run():
+        await _talk(store, "a", "first")
+        await _talk(store, "b")
+        # "a" is still being written when it comes back
+        assert "a" in store._pending_spills
+        await _talk(store, "a", "second")
+        await store.flush()
+        await _talk(store, "a", "third")
+        return store.peek("a").messages()
+
+    messages = asyncio.run(run())
+
+    assert [message["content"] for message in messages] == ["first", "second", "third"]
+
+def test_dropped_session_starts_empty(tmp_path, clock):
+    store = SessionStore(max_sessions=1, spill_dir=str(tmp_path))
+
+    async def run():
+        await _talk(store, "a", "first")
+        await store.flush()
+        store.drop("a")
+        async with store.session("a") as session:
+            messages = session.messages()
+        await store.flush()
+        return messages
+
+    assert asyncio.run(run()) == []
+    assert os.listdir(tmp_path) == []
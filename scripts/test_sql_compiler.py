@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the rule-based SQL compiler.
+
+The compiler must fail closed: a query with any part it does not understand
+returns None so that SQL generation falls back to the LLM.
+"""
+
+import os
+import sys
+from datetime import date
+
+import pytest
+
+# Add the scripts directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sql_compiler import Condition, RuleBasedSQLCompiler
+
+@pytest.fixture
+def compiler():
+    return RuleBasedSQLCompiler()
+
+@pytest.mark.parametrize("query", [
+    # Disjunction and negation
+    "temperature > 25 or salinity > 36",
+    "Show profiles not in the Arabian Sea",
+    "Show profiles except in the Arabian Sea",
+    "profiles without salinity below 35",
+    "Find profiles outside the Bay of Bengal",
+    # Qualifiers the grammar does not cover
+    "How many profiles have high salinity in the Bay of Bengal?",
+    "average temperature of warm water",
+    "profiles below the thermocline",
+    "Find warm water profiles in the Pacific",
+    "Show 10 warm water profiles",
+    # Units the columns are not stored in
+    "profiles with temperature over 30 degrees fahrenheit",
+    "temperature > 25 m",
+    "count profiles above 80°F",
+])
+def test_unparsed_queries_fall_back(compiler, query):
+    assert compiler.parse(query) is None
+    assert compiler.compile(query) is None
+
+def test_threshold_with_celsius_unit_grouped_by_month(compiler):
+    compiled = compiler.compile("count profiles above 25°C by month")
+
+    assert compiled is not None
+    assert compiled.shape.aggregate == "count"
+    assert compiled.shape.group_by == "month"
+    assert compiled.shape.conditions == [Condition("surfacetemp", ">", 25.0)]
+    assert compiled.render() == (
+        "SELECT date_trunc('month', date) AS month, COUNT(*) AS count FROM argo_profiles "
+        "WHERE surfacetemp > 25.0 GROUP BY 1 ORDER BY 1"
+    )
+
+def test_conjunction_of_thresholds(compiler):
+    shape = compiler.parse("Find profiles with temperature above 28 and salinity below 35 in 2023")
+
+    assert shape is not None
+    assert shape.conditions == [Condition("surfacetemp", ">", 28.0), Condition("surfacesal", "<", 35.0)]
+    assert (shape.date_from, shape.date_to) == (date(2023, 1, 1), date(2024, 1, 1))
+
+def test_comparator_containing_no(compiler):
+    shape = compiler.parse("profiles with temperature no more than 20")
+
+    assert shape is not None
+    assert shape.conditions == [Condition("surfacetemp", "<=", 20.0)]
+
+def test_aggregate_in_region(compiler):
+    shape = compiler.parse("What is the average temperature in the Arabian Sea in 2023?")
+
+    assert shape is not None
+    assert (shape.aggregate, shape.metric, shape.region) == ("avg", "surfacetemp", "arabian sea")
+
+def test_region_with_ocean_suffix_and_monsoon_season(compiler):
+    shape = compiler.parse("How many profiles in the Pacific Ocean during the southwest monsoon season?")
+
+    assert shape is not None
+    assert (shape.aggregate, shape.region, shape.monsoon) == ("count", "pacific", "southwest monsoon")
+
+def test_matching_units(compiler):
+    assert compiler.parse("mixed layer depth > 50 m").conditions == [Condition("mld", ">", 50.0)]
+    assert compiler.parse("temperature between 20°C and 25°C").conditions == [
+        Condition("surfacetemp", ">=", 20.0), Condition("surfacetemp", "<=", 25.0)
+    ]
+
+def test_limit_and_superlative(compiler):
+    shape = compiler.parse("Show 10 warmest profiles in the Bay of Bengal")
+
+    assert shape is not None
+    assert (shape.limit, shape.order_by, shape.region) == (10, ("surfacetemp", "DESC"), "bay of bengal")
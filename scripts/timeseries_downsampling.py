@@ -0,0 +1,182 @@
+"""
+Shape-preserving downsampling of result time series for charts.
+
+Chart queries (surface temperature or heat content over time for a region or
+float) can return thousands of profiles, every one of which the front end
+would otherwise draw. `downsample_series` reduces the chosen variable's time
+series to a target number of points with one of two methods that keep the
+visual shape of the line:
+
+* "lttb" (largest triangle three buckets) keeps, from each bucket of
+  consecutive points, the one forming the largest triangle with the point
+  kept from the previous bucket and the mean of the next bucket, which
+  preserves peaks, troughs and trend changes;
+* "minmax" keeps the minimum and the maximum of each bucket, an envelope
+  that never hides an extreme value.
+
+Bucket boundaries, bucket means and the min/max selection are vectorized
+over the column arrays; LTTB still walks the buckets in order because each
+choice depends on the previous one, but only with a vectorized argmax per
+bucket. The payload is at most the requested number of points, however many
+profiles matched.
+"""
+
+import importlib
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Sequence
+
+logger = logging.getLogger(__name__)
+
+# Chartable variables: request name -> (ARGOResult.variables key, sub-key or None)
+METRICS = {
+    "surface_temperature": ("temperature", "surface"),
+    "surface_salinity": ("salinity", "surface"),
+    "mixed_layer_depth": ("mixed_layer_depth", None),
+    "heat_content_0_200m": ("heat_content_0_200m", None),
+    "thermocline_depth": ("temperature", "thermocline_depth"),
+}
+
+METHODS = ("lttb", "minmax")
+
+# Fewest points a request may ask for: the first and last points plus one per bucket
+MIN_POINTS = 3
+
+def _numpy():
+    # Deferred like the pipeline's other heavy imports, so that importing the pipeline stays cheap
+    return importlib.import_module("numpy")
+
+@dataclass(frozen=True)
+class DownsamplingRequest:
+    """Per-request time series downsampling options"""
+    metric: str
+    points: int = 500
+    method: str = "lttb"
+
+    @classmethod
+    def parse(cls, value: Any, max_points: int) -> "DownsamplingRequest":
+        """Options from a request payload such as {"metric": "surface_temperature", "points": 300, "method": "lttb"}"""
+        if not isinstance(value, dict):
+            raise ValueError("'downsampling' must be an object with a 'metric' and optional 'points' and 'method'")
+        metric = value.get("metric")
+        if metric not in METRICS:
+            raise ValueError(f"'downsampling.metric' must be one of {sorted(METRICS)}")
+        points = value.get("points", min(cls.points, max_points))
+        if not isinstance(points, int) or isinstance(points, bool) or not MIN_POINTS <= points <= max_points:
+            raise ValueError(f"'downsampling.points' must be an integer between {MIN_POINTS} and {max_points}")
+        method = value.get("method", cls.method)
+        if method not in METHODS:
+            raise ValueError(f"'downsampling.method' must be one of {list(METHODS)}")
+        return cls(metric, points, method)
+
+def _epoch_seconds(timestamp: Any) -> float:
+    try:
+        moment = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return float("nan")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+def series_arrays(results: Sequence[Any], metric: str) -> Dict[str, Any]:
+    """Time (epoch seconds) and value columns of one metric, NaN where missing"""
+    np = _numpy()
+    key, sub_key = METRICS[metric]
+
+    def value(result) -> float:
+        field = result.variables.get(key)
+        if sub_key is not None:
+            field = field.get(sub_key) if isinstance(field, dict) else None
+        return np.nan if field is None else field
+
+    return {
+        "time": np.fromiter((_epoch_seconds(r.timestamp) for r in results), dtype=np.float64, count=len(results)),
+        "value": np.fromiter((value(r) for r in results), dtype=np.float64, count=len(results)),
+    }
+
+def _bucket_edges(n: int, buckets: int):
+    """Start offsets of `buckets` near-equal buckets over points 1..n-2 (the ends are always kept)"""
+    np = _numpy()
+    return 1 + (np.arange(buckets + 1) * (n - 2)) // buckets
+
+def lttb_indices(x, y, points: int):
+    """Indices of the points kept by largest-triangle-three-buckets"""
+    np = _numpy()
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+
+    buckets = points - 2
+    edges = _bucket_edges(n, buckets)
+    sizes = np.diff(edges)
+    # Means of every bucket at once (reduceat's last slice runs to the end, so the final
+    # point is cut off first); the last bucket is followed by the final point itself
+    mean_x = np.append(np.add.reduceat(x[:-1], edges[:-1]) / sizes, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:-1], edges[:-1]) / sizes, y[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(buckets):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area; the constant factor does not change the argmax
+        areas = np.abs(
+            (x[previous] - mean_x[bucket + 1]) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (mean_y[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+def minmax_indices(y, points: int):
+    """Indices of each bucket's minimum and maximum, in order"""
+    np = _numpy()
+    n = len(y)
+    if points >= n:
+        return np.arange(n)
+
+    buckets = max(1, (points - 2) // 2)
+    edges = _bucket_edges(n, buckets)
+    sizes = np.diff(edges)
+    bucket_of = np.repeat(np.arange(buckets), sizes)
+    inner = y[1:-1]
+    kept = [np.array([0, n - 1])]
+    for extreme in (np.minimum, np.maximum):
+        # Positions equal to their bucket's extreme; the first of each bucket is kept
+        per_bucket = extreme.reduceat(inner, edges[:-1] - 1)
+        hits = np.flatnonzero(inner == np.repeat(per_bucket, sizes))
+        _, first = np.unique(bucket_of[hits], return_index=True)
+        kept.append(hits[first] + 1)
+    return np.unique(np.concatenate(kept))
+
+def downsample_series(arrays: Dict[str, Any], request: DownsamplingRequest) -> Dict[str, Any]:
+    """Sort, clean and downsample a series to at most `request.points` points
+
+    `arrays` are the columns from `series_arrays`. Module-level so that it
+    can run in an offload worker on shared-memory arrays.
+    """
+    np = _numpy()
+    times, values = arrays["time"], arrays["value"]
+    present = ~(np.isnan(times) | np.isnan(values))
+    order = np.argsort(times[present], kind="stable")
+    x, y = times[present][order], values[present][order]
+
+    if request.method == "minmax":
+        kept = minmax_indices(y, request.points)
+    else:
+        kept = lttb_indices(x, y, request.points)
+
+    return {
+        "metric": request.metric,
+        "method": request.method,
+        "source_points": int(len(times)),
+        "usable_points": int(len(x)),
+        "points": [
+            {
+                "time": datetime.fromtimestamp(float(t), tz=timezone.utc).isoformat().replace("+00:00", "Z"),
+                "value": round(float(v), 4),
+            }
+            for t, v in zip(x[kept], y[kept])
+        ],
+    }
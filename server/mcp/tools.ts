@@ -57,6 +57,11 @@ export class ARGOTools {
               description: "Maximum number of results to return (default: 10)",
               default: 10,
             },
+            offset: {
+              type: "number",
+              description: "Number of best matches to skip, for reading results page by page (default: 0)",
+              default: 0,
+            },
           },
           required: ["query"],
         },
@@ -222,10 +227,15 @@ export class ARGOTools {
     const startTime = Date.now()
 
     try {
-      const { query, limit = 10 } = args
-
-      // Perform vector search
-      const result = await this.vectorSearch.search(query, limit)
+      const { query, limit = 10, offset = 0 } = args
+
+      // Perform vector search, skipping the matches earlier pages returned
+      const result = await this.vectorSearch.search(query, offset + limit)
+      if (offset > 0) {
+        result.profiles = result.profiles.slice(offset)
+        result.similarities = result.similarities.slice(offset)
+        result.metadata.total_results = result.profiles.length
+      }
 
       const executionTime = Date.now() - startTime
 